@@ -0,0 +1,70 @@
+#!/usr/bin/python
+"""
+Measure the parsing and serialisation throughput of each installed JSON backend on files with one
+json per line, such as the ClinVar release file from CellBase and the evidence strings output, and
+whether each backend gives the same results as the stdlib json module on them.
+"""
+
+import argparse
+import json
+import time
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import utilities
+
+
+def read_lines(file_path, max_lines):
+    lines = []
+    with utilities.open_file(file_path, "rt") as f:
+        for line in f:
+            lines.append(line.rstrip("\n"))
+            if len(lines) == max_lines:
+                break
+    return lines
+
+
+def time_calls(function, items):
+    start = time.perf_counter()
+    results = [function(item) for item in items]
+    return time.perf_counter() - start, results
+
+
+def benchmark_file(file_path, max_lines):
+    lines = read_lines(file_path, max_lines)
+    n_bytes = sum(len(line.encode()) for line in lines)
+    print("{}: {} lines, {:.1f} MB".format(file_path, len(lines), n_bytes / 1e6))
+    print("{:<10} {:>12} {:>10} {:>10}  {:>12} {:>10} {:>10}".format(
+        "backend", "parse/s", "MB/s", "same", "serialise/s", "MB/s", "same"))
+
+    expected_documents = [json.loads(line) for line in lines]
+    expected_lines = [json.dumps(document) for document in expected_documents]
+    for backend in json_codec.get_available_backends():
+        seconds, documents = time_calls(backend.loads, lines)
+        same_documents = [json.dumps(document) for document in documents] == expected_lines
+        row = [backend.name, len(lines) / seconds, n_bytes / seconds / 1e6, same_documents]
+        if backend.dumps is not None:
+            seconds, dumped_lines = time_calls(backend.dumps, expected_documents)
+            row += [len(lines) / seconds, n_bytes / seconds / 1e6, dumped_lines == expected_lines]
+        else:
+            row += [0, 0, "-"]
+        print("{:<10} {:>12.0f} {:>10.1f} {!s:>10}  {:>12.0f} {:>10.1f} {!s:>10}".format(*row))
+
+    print("Selected: loads {}, dumps {}".format(json_codec.loads_backend.name,
+                                                json_codec.dumps_backend.name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("files", nargs="+",
+                        help="Files with one json per line, optionally gzipped, e.g. the ClinVar "
+                             "CellBase release file and the evidence strings file")
+    parser.add_argument("--maxLines", dest="max_lines", type=int, default=100000,
+                        help="Number of lines of each file to use")
+    args = parser.parse_args()
+
+    for file_path in args.files:
+        benchmark_file(file_path, args.max_lines)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+#!/usr/bin/python
+"""
+Build the index of the terms of an EFO release used by evidence string generation and trait
+mapping (with --efoIndex) to check terms without querying the EFO SPARQL endpoint or OLS.
+"""
+
+import argparse
+
+from eva_cttv_pipeline.efo_index import EFOIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("release", help="EFO release file, OWL in RDF/XML or OBO (named .obo)")
+    parser.add_argument("-o", dest="index", required=True, help="Path to write the index to")
+    args = parser.parse_args()
+
+    efo_index = EFOIndex.from_release(args.release)
+    efo_index.save(args.index)
+    print("{} terms, {} obsolete, {} available for Open Targets".format(
+        len(efo_index), len(efo_index.get_obsolete_terms()),
+        len(efo_index.get_cttv_available_terms())))
+
+
+if __name__ == '__main__':
+    main()
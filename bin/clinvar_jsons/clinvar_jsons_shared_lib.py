@@ -1,7 +1,8 @@
 import gzip
-import json
 from collections import namedtuple
 
+from eva_cttv_pipeline import json_codec
+
 
 class Trait:
     def __init__(self, name):
@@ -25,7 +26,7 @@ def clinvar_jsons(filepath):
     with gzip.open(filepath, "rt") as f:
         for line in f:
             line = line.rstrip()
-            yield json.loads(line)
+            yield json_codec.loads(line)
 
 
 def get_trait_set(clinvar_json):
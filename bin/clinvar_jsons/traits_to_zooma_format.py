@@ -7,9 +7,9 @@ import sys
 from time import gmtime, strftime
 
 import progressbar
-import requests
 
 from clinvar_jsons_shared_lib import clinvar_jsons, get_traits_from_json, has_allowed_clinical_significance
+from eva_cttv_pipeline.trait_mapping.utils import get_session, request_retry_helper
 
 
 DATE = strftime("%d/%m/%y %H:%M", gmtime())
@@ -132,20 +132,10 @@ def build_zooma_query(trait_name, filters, zooma_host):
     return url
 
 
-def request_retry_helper(function, retry_count, url):
-    for retry_num in range(retry_count):
-        return_value = function(url)
-        if return_value is not None:
-            return return_value
-        print("attempt {}: failed running function {} with url {}".format(retry_num, function, url))
-    print("error on last attempt, skipping")
-    return None
-
-
 @lru_cache(maxsize=16384)
 def zooma_query_helper(url):
     try:
-        json_response = requests.get(url).json()
+        json_response = get_session().get(url).json()
         return json_response
     except json.decoder.JSONDecodeError as e:
         return None
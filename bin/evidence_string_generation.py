@@ -2,7 +2,9 @@
 
 import sys
 
+from eva_cttv_pipeline.efo_index import EFOIndex
 from eva_cttv_pipeline.evidence_string_generation import utilities, clinvar_to_evidence_strings
+from eva_cttv_pipeline.evidence_string_generation import efo_term
 
 
 def main():
@@ -12,11 +14,27 @@ def main():
 
     utilities.check_dir_exists_create(parser.out)
 
+    if parser.efo_index is not None:
+        efo_term.use_efo_index(EFOIndex.load(parser.efo_index))
+
     clinvar_to_evidence_strings.launch_pipeline(parser.out,
                                                 allowed_clinical_significance=parser.clinical_significance,
                                                 efo_mapping_file=parser.efo_mapping_file,
                                                 snp_2_gene_file=parser.snp_2_gene_file,
-                                                json_file=parser.json_file)
+                                                json_file=parser.json_file,
+                                                workers=parser.workers,
+                                                quarantine=parser.quarantine,
+                                                validation_workers=parser.validation_workers,
+                                                prefilter_clin_sig=parser.prefilter_clin_sig,
+                                                most_severe_consequence=parser.most_severe_consequence,
+                                                incremental=parser.incremental,
+                                                previous_run_dir=parser.previous_run_dir,
+                                                checkpoints=parser.checkpoints,
+                                                resume=parser.resume,
+                                                shard_by=parser.shard_by,
+                                                shard_limit=parser.shard_limit,
+                                                deduplicate=parser.deduplicate,
+                                                consequence_type_index_dir=parser.consequence_type_index_dir)
 
     print('>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>> Finished <<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<<')
 
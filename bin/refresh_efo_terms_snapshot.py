@@ -0,0 +1,25 @@
+#!/usr/bin/python
+"""
+Query the EFO SPARQL endpoint in the pipeline configuration for the obsolete and available EFO
+terms, and save them as the snapshot the pipeline loads them from. Run it wherever the endpoint
+can be reached and copy the snapshot to nodes where it can't.
+"""
+
+import argparse
+
+from eva_cttv_pipeline.evidence_string_generation import efo_term
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--snapshot", dest="snapshot_path", default=None,
+                        help="Path to save the snapshot to, by default the one the pipeline uses")
+    args = parser.parse_args()
+
+    snapshot = efo_term.refresh_terms_snapshot(args.snapshot_path)
+    print("{} obsolete and {} available terms saved".format(
+        len(snapshot["obsolete_terms"]), len(snapshot["cttv_available_terms"])))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,21 @@
 import argparse
 import sys
 
+from eva_cttv_pipeline.efo_index import EFOIndex
 import eva_cttv_pipeline.trait_mapping.main as main
+import eva_cttv_pipeline.trait_mapping.ols as ols
 
 
 def launch():
     parser = ArgParser(sys.argv)
 
+    if parser.efo_index_filepath is not None:
+        ols.use_efo_index(EFOIndex.load(parser.efo_index_filepath))
+
     main.main(parser.input_filepath, parser.output_mappings_filepath,
               parser.output_curation_filepath, parser.filters, parser.zooma_host,
-              parser.oxo_target_list, parser.oxo_distance)
+              parser.oxo_target_list, parser.oxo_distance, parser.workers,
+              parser.service_concurrency, parser.cache_dir, parser.cache_max_size)
 
 
 class ArgParser:
@@ -39,6 +45,22 @@ class ArgParser:
                             help="target ontologies to use with OxO")
         parser.add_argument("-d", dest="oxo_distance", default=3,
                             help="distance to use to query OxO.")
+        parser.add_argument("--efoIndex", dest="efo_index_filepath", default=None,
+                            help="index of an EFO release, built with bin/build_efo_index.py, "
+                                 "to check terms against instead of querying OLS")
+        parser.add_argument("--workers", dest="workers", type=int, default=1,
+                            help="number of traits to map at once")
+        parser.add_argument("--zoomaConcurrency", dest="zooma_concurrency", type=int, default=4,
+                            help="maximum number of requests to Zooma at once, with --workers")
+        parser.add_argument("--olsConcurrency", dest="ols_concurrency", type=int, default=8,
+                            help="maximum number of requests to OLS at once, with --workers")
+        parser.add_argument("--oxoConcurrency", dest="oxo_concurrency", type=int, default=2,
+                            help="maximum number of requests to OxO at once, with --workers")
+        parser.add_argument("--cacheDir", dest="cache_dir", default=None,
+                            help="directory in which to cache the responses of Zooma, OLS and OxO "
+                                 "for later runs")
+        parser.add_argument("--cacheMaxSize", dest="cache_max_size", type=int, default=1024,
+                            help="megabytes of responses to keep in the cache")
 
         args = parser.parse_args(args=argv[1:])
 
@@ -53,6 +75,13 @@ class ArgParser:
         self.zooma_host = args.zooma_host
         self.oxo_target_list = [target.strip() for target in args.oxo_target_list.split(",")]
         self.oxo_distance = args.oxo_distance
+        self.efo_index_filepath = args.efo_index_filepath
+        self.workers = args.workers
+        self.cache_dir = args.cache_dir
+        self.cache_max_size = args.cache_max_size * 1024 * 1024
+        self.service_concurrency = {"zooma": args.zooma_concurrency,
+                                    "ols": args.ols_concurrency,
+                                    "oxo": args.oxo_concurrency}
 
 
 if __name__ == '__main__':
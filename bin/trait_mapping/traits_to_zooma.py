@@ -1,8 +1,9 @@
 import argparse
 import json
-import requests
 import sys
 
+from eva_cttv_pipeline.trait_mapping.utils import get_session, request_retry_helper
+
 
 class Trait:
 
@@ -60,19 +61,9 @@ def read_traits(filepath):
     return traits
 
 
-def request_retry_helper(function, retry_count, url):
-    for retry_num in range(retry_count):
-        return_value = function(url)
-        if return_value is not None:
-            return return_value
-        print("attempt {}: failed running function {} with url {}".format(retry_num, function, url))
-    print("error on last attempt, skipping")
-    return None
-
-
 def zooma_query_helper(url):
     try:
-        json_response_1 = requests.get(url).json()
+        json_response_1 = get_session().get(url).json()
         return json_response_1
     except json.decoder.JSONDecodeError as e:
         return None
@@ -80,7 +71,7 @@ def zooma_query_helper(url):
 
 def ols_query_helper(url):
     try:
-        json_response = requests.get(url).json()
+        json_response = get_session().get(url).json()
         for term in json_response["_embedded"]["terms"]:
             if term["is_defining_ontology"]:
                 return term["label"]
@@ -0,0 +1,96 @@
+"""
+Benchmarks of the hot paths of evidence string generation and trait mapping, run offline with
+stand-ins for the web services. Results, with the items processed per second and the peak memory
+allocated by each benchmark, are written as json, and can be compared against those of a
+previous run stored as a baseline:
+
+    python -m eva_cttv_pipeline.bench --output baseline.json
+    python -m eva_cttv_pipeline.bench --baseline baseline.json
+"""
+
+import argparse
+import platform
+import sys
+from collections import OrderedDict
+from time import gmtime, strftime
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.bench import benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clinvarJson", dest="json_file", default=None,
+                        help="ClinVar json file, one record per line. By default a synthetic one "
+                             "of --records records")
+    parser.add_argument("--efoMapping", dest="efo_mapping_file", default=None,
+                        help="Trait to EFO mapping file. By default a synthetic one")
+    parser.add_argument("--snp2gene", dest="snp_2_gene_file", default=None,
+                        help="snp2gene file. By default a synthetic one")
+    parser.add_argument("--records", dest="n_records", type=int, default=2000,
+                        help="Number of ClinVar records of the synthetic input files")
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the synthetic input files")
+    parser.add_argument("--traits", dest="n_traits", type=int, default=500,
+                        help="Number of trait names of the mapping file to map with Zooma/OxO")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Number of times each benchmark is run, the best time being kept")
+    parser.add_argument("--only", default=None,
+                        help="Comma-separated benchmarks to run, of: " +
+                             ", ".join(benchmarks.BENCHMARKS))
+    parser.add_argument("--output", default=None,
+                        help="File to write the results to, rather than standard output")
+    parser.add_argument("--baseline", default=None,
+                        help="Results of a previous run to compare these against")
+    parser.add_argument("--maxSlowdown", dest="max_slowdown", type=float, default=None,
+                        help="Exit with an error if any benchmark is slower than in the baseline "
+                             "by more than this fraction, e.g. 0.1")
+    args = parser.parse_args()
+
+    names = list(benchmarks.BENCHMARKS)
+    if args.only is not None:
+        names = [name.strip() for name in args.only.split(",")]
+        unknown_names = [name for name in names if name not in benchmarks.BENCHMARKS]
+        if unknown_names:
+            parser.error("Unknown benchmarks: " + ", ".join(unknown_names))
+
+    inputs = benchmarks.BenchmarkInputs(args.json_file, args.efo_mapping_file,
+                                        args.snp_2_gene_file, args.n_records, args.n_traits,
+                                        args.seed)
+    results = OrderedDict()
+    try:
+        for name in names:
+            result = benchmarks.run_benchmark(name, inputs, args.repeat)
+            results[name] = result._asdict()
+            print("{:<35} {:>12.0f} items/s {:>10.1f} MB peak".format(
+                name, result.items_per_second or 0, result.peak_memory_bytes / 1e6),
+                file=sys.stderr)
+    finally:
+        inputs.close()
+
+    output = {"created": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+              "python": platform.python_version(),
+              "json_backend": json_codec.loads_backend.name,
+              "benchmarks": results}
+    if args.output is not None:
+        with open(args.output, "wt") as f:
+            f.write(json_codec.dumps(output) + "\n")
+    else:
+        print(json_codec.dumps(output))
+
+    if args.baseline is not None:
+        baseline = benchmarks.load_results(args.baseline)
+        ratios = benchmarks.compare_to_baseline(results, baseline["benchmarks"])
+        print("Compared to " + args.baseline + " (above 1 is faster):", file=sys.stderr)
+        for name, ratio in ratios.items():
+            print("{:<35} {:>8.2f}".format(name, ratio), file=sys.stderr)
+        if args.max_slowdown is not None:
+            slower = [name for name, ratio in ratios.items() if ratio < 1 - args.max_slowdown]
+            if slower:
+                print("Slower than the baseline: " + ", ".join(slower), file=sys.stderr)
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
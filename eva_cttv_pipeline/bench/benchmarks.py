@@ -0,0 +1,343 @@
+"""
+Benchmarks of the hot paths of evidence string generation and trait mapping. Each benchmark is a
+function which takes the BenchmarkInputs, does any preparation which isn't to be measured, and
+returns a function without arguments which runs the code measured and returns the number of items
+(records, lines, evidence strings or traits) it processed.
+"""
+
+import contextlib
+import gc
+import io
+import itertools
+import os
+import tempfile
+import tracemalloc
+from collections import OrderedDict, namedtuple
+from time import perf_counter
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.bench import services
+from eva_cttv_pipeline.bench import synthetic_data
+from eva_cttv_pipeline.evidence_string_generation import cellbase_records
+from eva_cttv_pipeline.evidence_string_generation import clinvar
+from eva_cttv_pipeline.evidence_string_generation import clinvar_to_evidence_strings
+from eva_cttv_pipeline.evidence_string_generation import consequence_type as CT
+from eva_cttv_pipeline.evidence_string_generation import evidence_strings
+from eva_cttv_pipeline.evidence_string_generation import utilities
+from eva_cttv_pipeline.trait_mapping import main as trait_mapping
+from eva_cttv_pipeline.trait_mapping.trait import Trait
+
+
+ALLOWED_CLINICAL_SIGNIFICANCE = \
+    clinvar_to_evidence_strings.get_default_allowed_clinical_significance()
+
+BenchmarkResult = namedtuple("BenchmarkResult", ["items", "seconds", "items_per_second",
+                                                 "peak_memory_bytes"])
+
+BENCHMARKS = OrderedDict()
+
+
+def benchmark(function):
+    BENCHMARKS[function.__name__] = function
+    return function
+
+
+def quiet(function, *args):
+    """Call function without the progress messages it prints"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+def count_lines(file_path):
+    with utilities.open_file(file_path, "rt") as f:
+        return sum(1 for _ in f)
+
+
+class BenchmarkInputs:
+
+    """
+    Input files of the benchmarks, and what is made from them, made once when first needed.
+    Those not given are synthetic ones of a release of n_records ClinVar records, written to a
+    temporary directory.
+    """
+
+    def __init__(self, json_file=None, efo_mapping_file=None, snp_2_gene_file=None,
+                 n_records=2000, n_traits=500, seed=1):
+        self.temp_dir = tempfile.mkdtemp()
+        if None in (json_file, efo_mapping_file, snp_2_gene_file):
+            release = synthetic_data.SyntheticRelease(
+                n_records / synthetic_data.RELEASE_RECORDS, seed)
+            if json_file is None:
+                json_file = os.path.join(self.temp_dir, synthetic_data.CLINVAR_JSON_FILE_NAME)
+                release.write_clinvar_json(json_file)
+            if efo_mapping_file is None:
+                efo_mapping_file = os.path.join(self.temp_dir,
+                                                synthetic_data.EFO_MAPPING_FILE_NAME)
+                release.write_efo_mapping_file(efo_mapping_file)
+            if snp_2_gene_file is None:
+                snp_2_gene_file = os.path.join(self.temp_dir,
+                                               synthetic_data.SNP_2_GENE_FILE_NAME)
+                release.write_snp_2_gene_file(snp_2_gene_file)
+        self.json_file = json_file
+        self.efo_mapping_file = efo_mapping_file
+        self.snp_2_gene_file = snp_2_gene_file
+        self.n_traits = n_traits
+        self._cache = {}
+
+    def _get(self, name, make):
+        if name not in self._cache:
+            self._cache[name] = make()
+        return self._cache[name]
+
+    @property
+    def cellbase_records(self):
+        return self._get("cellbase_records", lambda: list(
+            cellbase_records.CellbaseRecords(self.json_file)))
+
+    @property
+    def clinvar_records(self):
+        return self._get("clinvar_records", lambda: [
+            clinvar.ClinvarRecord(cellbase_record["clinvarSet"])
+            for cellbase_record in self.cellbase_records])
+
+    @property
+    def mappings(self):
+        return self._get("mappings", lambda: quiet(
+            clinvar_to_evidence_strings.get_mappings, self.efo_mapping_file,
+            self.snp_2_gene_file))
+
+    @property
+    def evidence_string_args(self):
+        """Arguments of each evidence string generated from the ClinVar records"""
+        return self._get("evidence_string_args", self._get_evidence_string_args)
+
+    def _get_evidence_string_args(self):
+        report = clinvar_to_evidence_strings.Report()
+        evidence_string_args = []
+        for clinvar_record in self.clinvar_records:
+            for measure in clinvar_record.measures:
+                traits = clinvar_to_evidence_strings.create_traits(
+                    clinvar_record.traits, self.mappings.trait_2_efo, report)
+                for consequence_type, trait, allele_origin in itertools.product(
+                        clinvar_to_evidence_strings.get_consequence_types(
+                            measure, self.mappings.consequence_type_dict),
+                        traits,
+                        clinvar_to_evidence_strings.convert_allele_origins(
+                            clinvar_record.allele_origins)):
+                    if not clinvar_to_evidence_strings.skip_record(
+                            clinvar_record, measure, consequence_type, allele_origin,
+                            ALLOWED_CLINICAL_SIGNIFICANCE, report):
+                        evidence_string_args.append((clinvar_record, measure, trait,
+                                                     consequence_type, allele_origin))
+        return evidence_string_args
+
+    @property
+    def evidence_strings(self):
+        return self._get("evidence_strings", lambda: make_evidence_strings(
+            self.evidence_string_args))
+
+    @property
+    def trait_names(self):
+        def get_trait_names():
+            trait_names = []
+            with open(self.efo_mapping_file, "rt") as f:
+                for line in f:
+                    if not line.startswith("#"):
+                        trait_names.append(line.split("\t")[0])
+                    if len(trait_names) == self.n_traits:
+                        break
+            return trait_names
+        return self._get("trait_names", get_trait_names)
+
+    def close(self):
+        for file_name in os.listdir(self.temp_dir):
+            os.remove(os.path.join(self.temp_dir, file_name))
+        os.rmdir(self.temp_dir)
+
+
+def make_evidence_strings(evidence_string_args):
+    report = clinvar_to_evidence_strings.Report()
+    made_evidence_strings = []
+    for clinvar_record, measure, trait, consequence_type, allele_origin in evidence_string_args:
+        if allele_origin == "germline":
+            evidence_string_class = evidence_strings.CompactGeneticsEvidenceString
+        else:
+            evidence_string_class = evidence_strings.CompactSomaticEvidenceString
+        made_evidence_strings.append(evidence_string_class(clinvar_record, measure, report, trait,
+                                                           consequence_type))
+    return made_evidence_strings
+
+
+@benchmark
+def cellbase_records_parsing(inputs):
+    def run():
+        return sum(1 for _ in cellbase_records.CellbaseRecords(inputs.json_file))
+    return run
+
+
+@benchmark
+def clinvar_record(inputs):
+    records = inputs.cellbase_records
+
+    def run():
+        for cellbase_record in records:
+            record = clinvar.ClinvarRecord(cellbase_record["clinvarSet"])
+            # The fields used in generating evidence strings
+            record.accession, record.date, record.clinical_significance, record.traits
+            record.trait_refs_list, record.observed_refs_list, record.allele_origins
+            for measure in record.measures:
+                measure.rs_id, measure.nsv_id, measure.refs_list, measure.variant_type
+                measure.chr, measure.start, measure.ref, measure.alt
+        return len(records)
+    return run
+
+
+@benchmark
+def get_consequence_types(inputs):
+    measures = [measure for record in inputs.clinvar_records for measure in record.measures]
+    consequence_type_dict = inputs.mappings.consequence_type_dict
+
+    def run():
+        for measure in measures:
+            clinvar_to_evidence_strings.get_consequence_types(measure, consequence_type_dict)
+        return len(measures)
+    return run
+
+
+@benchmark
+def load_efo_mapping(inputs):
+    n_lines = count_lines(inputs.efo_mapping_file)
+
+    def run():
+        quiet(clinvar_to_evidence_strings.load_efo_mapping, inputs.efo_mapping_file)
+        return n_lines
+    return run
+
+
+@benchmark
+def process_consequence_type_file(inputs):
+    n_lines = count_lines(inputs.snp_2_gene_file)
+
+    def run():
+        CT.process_consequence_type_file_tsv(inputs.snp_2_gene_file)
+        return n_lines
+    return run
+
+
+@benchmark
+def build_consequence_type_index(inputs):
+    n_lines = count_lines(inputs.snp_2_gene_file)
+    index_path = os.path.join(inputs.temp_dir, "consequence_types.sqlite")
+
+    def run():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        CT.build_consequence_type_index(inputs.snp_2_gene_file, index_path)
+        return n_lines
+    return run
+
+
+@benchmark
+def evidence_string_construction(inputs):
+    evidence_string_args = inputs.evidence_string_args
+
+    def run():
+        return len(make_evidence_strings(evidence_string_args))
+    return run
+
+
+@benchmark
+def schema_validation(inputs):
+    evidence_strings_to_validate = inputs.evidence_strings
+
+    def run():
+        for evidence_string in evidence_strings_to_validate:
+            evidence_string.validate()
+        return len(evidence_strings_to_validate)
+    return run
+
+
+@benchmark
+def output_serialisation(inputs):
+    evidence_strings_to_serialise = inputs.evidence_strings
+
+    def run():
+        output_fh = io.StringIO()
+        for evidence_string in evidence_strings_to_serialise:
+            output_fh.write(evidence_strings.evidence_string_to_json(evidence_string) + "\n")
+        return len(evidence_strings_to_serialise)
+    return run
+
+
+@benchmark
+def clinvar_to_evidence_strings_run(inputs):
+    mappings = inputs.mappings
+
+    def run():
+        report = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+            ALLOWED_CLINICAL_SIGNIFICANCE, mappings, inputs.json_file,
+            evidence_string_fh=io.StringIO())
+        return report.counters["record_counter"]
+    return run
+
+
+@benchmark
+def process_trait(inputs):
+    trait_names = inputs.trait_names
+    filters = {"ontologies": "efo,ordo,hp", "required": "cttv,eva-clinvar,clinvar-xrefs,gwas",
+               "preferred": "eva-clinvar,cttv,gwas,clinvar-xrefs"}
+
+    def run():
+        services.clear_caches()
+        with services.stub_services():
+            for trait_name in trait_names:
+                trait_mapping.process_trait(Trait(trait_name, 1), filters, services.ZOOMA_HOST,
+                                            ["Orphanet", "efo", "hp"], 3)
+        return len(trait_names)
+    return run
+
+
+def run_benchmark(name, inputs, repeat=3):
+    """
+    Run a benchmark repeat times, giving the best time, and once more with tracemalloc to find
+    the peak memory allocated while it runs (which is slower, so it isn't timed).
+    """
+    run = BENCHMARKS[name](inputs)
+    best_seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = perf_counter()
+        n_items = run()
+        seconds = perf_counter() - start
+        if best_seconds is None or seconds < best_seconds:
+            best_seconds = seconds
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        peak_memory_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return BenchmarkResult(n_items, best_seconds,
+                           n_items / best_seconds if best_seconds else None, peak_memory_bytes)
+
+
+def compare_to_baseline(results, baseline_results):
+    """
+    Ratio of the items per second of each benchmark to that of the baseline, above 1 if faster,
+    for the benchmarks in both.
+    """
+    ratios = OrderedDict()
+    for name, result in results.items():
+        baseline_result = baseline_results.get(name)
+        if baseline_result is not None and baseline_result["items_per_second"] and \
+                result["items_per_second"]:
+            ratios[name] = result["items_per_second"] / baseline_result["items_per_second"]
+    return ratios
+
+
+def load_results(results_file):
+    with open(results_file, "rt") as f:
+        return json_codec.loads(f.read())
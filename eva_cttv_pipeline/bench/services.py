@@ -0,0 +1,98 @@
+"""
+Stand-ins for the Zooma, OLS and OxO web services used in trait mapping, so that it can be
+benchmarked offline. Responses are made up from the request, always the same for the same trait
+name or term, and exercise each path of trait_mapping.main.process_trait: traits finished with a
+Zooma mapping, traits mapped through OxO and traits left for curation.
+"""
+
+import re
+import urllib.parse
+import zlib
+
+import requests_mock
+
+from eva_cttv_pipeline.trait_mapping import ols
+from eva_cttv_pipeline.trait_mapping import oxo
+from eva_cttv_pipeline.trait_mapping import zooma
+
+
+ZOOMA_HOST = "http://zooma.stub"
+
+ZOOMA_URL = re.compile(r"/spot/zooma/v2/api/services/annotate\?")
+OLS_TERMS_URL = re.compile(r"/ols/api/terms\?iri=")
+OLS_EFO_TERMS_URL = re.compile(r"/ols/api/ontologies/efo/terms/")
+OXO_URL = re.compile(r"/spot/oxo/api/search")
+
+EFO_URI_PREFIX = "http://www.ebi.ac.uk/efo/EFO_"
+EFO_URI = EFO_URI_PREFIX + "{:07d}"
+HP_URI = "http://purl.obolibrary.org/obo/HP_{:07d}"
+
+
+def get_term_number(text):
+    return zlib.crc32(text.encode()) % 10000000
+
+
+def zooma_response(request, context):
+    trait_name = urllib.parse.parse_qs(urllib.parse.urlparse(request.url).query)["propertyValue"][0]
+    term_number = get_term_number(trait_name)
+    kind = term_number % 10
+    if kind < 5:
+        # Finished with a Zooma mapping
+        uri, confidence = EFO_URI.format(term_number), "HIGH"
+    elif kind < 8:
+        # Mapped to a term outside EFO, looked up in OxO
+        uri, confidence = HP_URI.format(term_number), "HIGH"
+    else:
+        # Left for curation
+        uri, confidence = EFO_URI.format(term_number), "MEDIUM"
+    return [{"semanticTags": [uri],
+             "annotatedProperty": {"propertyValue": trait_name},
+             "confidence": confidence,
+             "derivedFrom": {"provenance": {"source": {"name": "eva-clinvar"}}}}]
+
+
+def ols_terms_response(request, context):
+    iri = urllib.parse.unquote(request.url.split("iri=", 1)[1])
+    return {"_embedded": {"terms": [{"is_defining_ontology": True,
+                                     "label": "Label of " + iri.rsplit("/", 1)[-1]}]}}
+
+
+def ols_efo_terms_response(request, context):
+    uri = urllib.parse.unquote(urllib.parse.unquote(request.url.rsplit("/", 1)[-1]))
+    if not uri.startswith(EFO_URI_PREFIX):
+        context.status_code = 404
+        return {}
+    return {"iri": uri, "label": "Label of " + uri.rsplit("/", 1)[-1], "is_obsolete": False,
+            "is_defining_ontology": True}
+
+
+def oxo_response(request, context):
+    query_ids = urllib.parse.parse_qs(request.text)["ids"]
+    search_results = []
+    for query_id in query_ids:
+        search_results.append({
+            "queryId": query_id, "label": "Label of " + query_id, "curie": query_id,
+            "mappingResponseList": [{"label": "Label of EFO term", "distance": 1,
+                                     "curie": "EFO:{:07d}".format(get_term_number(query_id))}]})
+    return {"_embedded": {"searchResults": search_results}}
+
+
+def clear_caches():
+    """Clear the caches of responses, so every benchmark run makes the same requests"""
+    for cached_function in (zooma.zooma_query_helper, ols.get_ontology_label_from_ols,
+                            ols.is_current_and_in_efo, ols.is_in_efo, ols.get_term_status,
+                            oxo.uri_to_oxo_format):
+        cached_function.cache_clear()
+
+
+def stub_services():
+    """
+    requests_mock.Mocker with the stand-in services, to use as a context manager. Any other
+    request fails.
+    """
+    mocker = requests_mock.Mocker()
+    mocker.get(ZOOMA_URL, json=zooma_response)
+    mocker.get(OLS_TERMS_URL, json=ols_terms_response)
+    mocker.get(OLS_EFO_TERMS_URL, json=ols_efo_terms_response)
+    mocker.post(OXO_URL, json=oxo_response)
+    return mocker
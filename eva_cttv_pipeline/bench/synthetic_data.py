@@ -0,0 +1,351 @@
+"""
+Generator of synthetic input files for the pipeline, at any multiple of the size of a ClinVar
+release, for load testing without real data:
+
+* ClinVar records as CellBase json, one per line, with one or more measures and traits, mixed
+  allele origins, clinical significances and citations, and variants with rs ids, nsv ids, both
+  or only coordinates;
+* a snp2gene file with the consequence types of most of those variants, by rs id, nsv id or
+  coordinates, as get_consequence_types looks them up;
+* a trait to EFO mapping file, as read by load_efo_mapping, mapping most of the trait names, some
+  by an alternate name and some to several terms.
+
+The same seed and scale always give the same files. Each variant and trait is made from a
+random number generator of its own, seeded from its index, so the files are consistent with each
+other while being written one line at a time, in memory which doesn't grow with the scale.
+
+    python -m eva_cttv_pipeline.bench.synthetic_data --out DIR --scale 10
+"""
+
+import argparse
+import os
+import random
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import utilities
+
+
+# Sizes of a ClinVar release, at scale 1
+RELEASE_RECORDS = 250000
+RELEASE_VARIANTS = 200000
+RELEASE_TRAITS = 25000
+N_GENES = 20000
+
+CLINVAR_JSON_FILE_NAME = "clinvar.json.gz"
+SNP_2_GENE_FILE_NAME = "snp2gene.tsv"
+EFO_MAPPING_FILE_NAME = "trait_to_efo.tsv"
+
+# Choices with their weights
+CLINICAL_SIGNIFICANCES = [
+    ("Pathogenic", 30), ("Likely pathogenic", 15), ("Uncertain significance", 25),
+    ("Benign", 10), ("Likely benign", 10), ("risk factor", 3), ("drug response", 2),
+    ("association", 2), ("protective", 1), ("conflicting data from submitters", 2)]
+REVIEW_STATUSES = [
+    ("CLASSIFIED_BY_SINGLE_SUBMITTER", 60), ("CLASSIFIED_BY_MULTIPLE_SUBMITTERS", 25),
+    ("NOT_CLASSIFIED_BY_SUBMITTER", 10), ("REVIEWED_BY_EXPERT_PANEL", 4),
+    ("REVIEWED_BY_PROFESSIONAL_SOCIETY", 1)]
+ALLELE_ORIGINS = [
+    (["germline"], 75), (["somatic"], 5), (["germline", "somatic"], 3), (["unknown"], 5),
+    (["de novo"], 3), (["maternal", "paternal"], 2), (["not provided"], 4),
+    (["tested-inconclusive"], 3)]
+SO_TERMS = [
+    ("missense_variant", 30), ("stop_gained", 10), ("frameshift_variant", 10),
+    ("synonymous_variant", 8), ("splice_donor_variant", 4), ("splice_acceptor_variant", 4),
+    ("splice_region_variant", 4), ("intron_variant", 10), ("inframe_deletion", 3),
+    ("inframe_insertion", 2), ("stop_lost", 1), ("start_lost", 1),
+    ("non_coding_transcript_exon_variant", 4), ("3_prime_UTR_variant", 3),
+    ("5_prime_UTR_variant", 2), ("upstream_gene_variant", 2), ("downstream_gene_variant", 1)]
+ONTOLOGY_URIS = [
+    ("http://www.ebi.ac.uk/efo/EFO_{:07d}", 40), ("http://www.orpha.net/ORDO/Orphanet_{}", 40),
+    ("http://purl.obolibrary.org/obo/HP_{:07d}", 20)]
+CHROMOSOMES = [str(chromosome) for chromosome in range(1, 23)] + ["X", "Y", "MT"]
+BASES = "ACGT"
+
+# Words trait names and descriptions are made of
+TRAIT_WORDS = (
+    "congenital hereditary familial progressive juvenile early-onset late-onset autosomal "
+    "dominant recessive x-linked cardiac renal hepatic retinal neuronal muscular skeletal "
+    "metabolic mitochondrial immune").split()
+TRAIT_NOUNS = (
+    "dystrophy myopathy neuropathy ataxia dysplasia cardiomyopathy anemia deficiency syndrome "
+    "epilepsy retinopathy nephropathy encephalopathy disorder disease carcinoma").split()
+TEXT_WORDS = (
+    "the variant was identified in a patient with affected family members and segregated with "
+    "disease in several kindreds functional studies showed reduced activity of the protein "
+    "consistent with a loss of function").split()
+
+
+def weighted_choice(rng, choices):
+    total = sum(weight for _, weight in choices)
+    point = rng.random() * total
+    for value, weight in choices:
+        point -= weight
+        if point < 0:
+            return value
+    return choices[-1][0]
+
+
+def get_gene(gene_number):
+    return "ENSG{:011d}".format(gene_number), "GENE{}".format(gene_number)
+
+
+class SyntheticRelease:
+
+    """
+    Synthetic ClinVar release of scale times the size of a real one. Variants and traits are
+    numbered, and made on demand from their number by get_variant and get_trait.
+    """
+
+    def __init__(self, scale=1.0, seed=1):
+        self.scale = scale
+        self.seed = seed
+        self.n_records = max(1, round(RELEASE_RECORDS * scale))
+        self.n_variants = max(1, round(RELEASE_VARIANTS * scale))
+        self.n_traits = max(1, round(RELEASE_TRAITS * scale))
+
+    def _get_rng(self, kind, number):
+        # Seeded from an integer, so it doesn't depend on the hash seed
+        return random.Random((self.seed * 4 + kind) * 1000000007 + number)
+
+    def get_variant(self, variant_number):
+        """Dict with the ids, location and type of a variant, and its consequence types"""
+        rng = self._get_rng(1, variant_number)
+        kind = rng.random()
+        variant = {"rs_id": None, "nsv_id": None, "chr": rng.choice(CHROMOSOMES),
+                   "start": rng.randint(10000, 240000000)}
+        if kind < 0.85:
+            variant["rs_id"] = "rs{}".format(100000000 + variant_number)
+        if kind >= 0.7 and kind < 0.9:
+            variant["nsv_id"] = "nsv{}".format(1000000 + variant_number)
+
+        if variant["nsv_id"] is not None and variant["rs_id"] is None:
+            variant["type"] = rng.choice(["copy number gain", "copy number loss"])
+            variant["stop"] = variant["start"] + rng.randint(1000, 5000000)
+            variant["ref"] = variant["alt"] = None
+        else:
+            length = rng.randint(1, 20)
+            variant_type = rng.random()
+            if variant_type < 0.8:
+                variant["type"] = "single nucleotide variant"
+                variant["ref"] = rng.choice(BASES)
+                variant["alt"] = rng.choice(BASES.replace(variant["ref"], ""))
+                length = 1
+            elif variant_type < 0.9:
+                variant["type"] = "Deletion"
+                variant["ref"] = "".join(rng.choice(BASES) for _ in range(length))
+                variant["alt"] = "-"
+            else:
+                variant["type"] = "Insertion"
+                variant["ref"] = "-"
+                variant["alt"] = "".join(rng.choice(BASES) for _ in range(length))
+            variant["stop"] = variant["start"] + length - 1
+
+        # Most variants have consequence types, under the first id get_consequence_types tries
+        consequence_type_id = None
+        if variant["rs_id"] is not None and rng.random() < 0.85:
+            consequence_type_id = variant["rs_id"]
+        elif variant["nsv_id"] is not None and rng.random() < 0.6:
+            consequence_type_id = variant["nsv_id"]
+        elif variant["rs_id"] is None and rng.random() < 0.5:
+            consequence_type_id = "{}:{}-{}:1/{}".format(variant["chr"], variant["start"],
+                                                         variant["stop"], variant["alt"] or "-")
+        variant["consequence_type_id"] = consequence_type_id
+        n_genes = weighted_choice(rng, [(1, 80), (2, 15), (3, 5)])
+        variant["consequence_types"] = [
+            (get_gene(rng.randrange(N_GENES)), weighted_choice(rng, SO_TERMS))
+            for _ in range(n_genes)] if consequence_type_id is not None else []
+        return variant
+
+    def get_trait(self, trait_number):
+        """Dict with the names of a trait, and the line of the mapping file for it, if any"""
+        rng = self._get_rng(2, trait_number)
+        name = "{} {} {}".format(rng.choice(TRAIT_WORDS), rng.choice(TRAIT_NOUNS), trait_number)
+        alternate_names = ["{} type {}".format(name, alternate_number + 1)
+                           for alternate_number in range(rng.randint(0, 3))]
+        mapping = rng.random()
+        mapping_line = None
+        if mapping < 0.7:
+            # Mapped, by an alternate name in some cases, to one or a few terms
+            mapped_name = rng.choice(alternate_names) \
+                if alternate_names and rng.random() < 0.2 else name
+            n_terms = weighted_choice(rng, [(1, 95), (2, 4), (3, 1)])
+            uris = [weighted_choice(rng, ONTOLOGY_URIS).format(rng.randrange(1, 1000000))
+                    for _ in range(n_terms)]
+            labels = ["Label of " + uri.rsplit("/", 1)[-1] for uri in uris]
+            mapping_line = "\t".join([mapped_name, "|".join(uris), "|".join(labels)])
+        elif mapping < 0.75:
+            # Without an EFO term available
+            mapping_line = name
+        return {"name": name, "alternate_names": alternate_names, "mapping_line": mapping_line}
+
+    def _get_citations(self, rng, probability, first_id):
+        if rng.random() >= probability:
+            return None
+        return [{"id": [{"value": str(first_id + citation_number), "source": "PubMed"}],
+                 "type": "general"}
+                for citation_number in range(rng.randint(1, 3))]
+
+    def _get_text(self, rng, max_words):
+        return " ".join(rng.choice(TEXT_WORDS) for _ in range(rng.randint(0, max_words)))
+
+    def _make_measure(self, rng, variant_number):
+        variant = self.get_variant(variant_number)
+        gene_id, gene_symbol = variant["consequence_types"][0][0] \
+            if variant["consequence_types"] else get_gene(variant_number % N_GENES)
+        change = "c.{}{}>{}".format(rng.randint(1, 5000), variant["ref"] or "N",
+                                    variant["alt"] or "N")
+        measure = {
+            "name": [{"elementValue": {"value": "NM_{:06d}.1({}):{}".format(
+                variant_number % 1000000, gene_symbol, change), "type": "Preferred"}}],
+            "attributeSet": [{"attribute": {"value": "NM_{:06d}.{}:{}".format(
+                rng.randrange(1000000), version, change), "type": "HGVS, coding, RefSeq",
+                "change": change}} for version in range(1, rng.randint(2, 8))],
+            "type": variant["type"],
+            "id": variant_number}
+        location = {"chr": variant["chr"], "start": variant["start"], "stop": variant["stop"]}
+        if variant["ref"] is not None:
+            location["referenceAllele"] = variant["ref"]
+            location["alternateAllele"] = variant["alt"]
+        measure["sequenceLocation"] = [
+            dict(location, assembly="GRCh38", assemblyStatus="current"),
+            dict(location, assembly="GRCh37", assemblyStatus="previous",
+                 start=max(1, variant["start"] - 283000), stop=max(1, variant["stop"] - 283000))]
+        xrefs = []
+        if variant["rs_id"] is not None:
+            xrefs.append({"db": "dbSNP", "id": variant["rs_id"][2:], "type": "rs",
+                          "status": "CURRENT"})
+        if variant["nsv_id"] is not None:
+            xrefs.append({"db": "dbVar", "id": variant["nsv_id"], "status": "CURRENT"})
+        if xrefs:
+            measure["xref"] = xrefs
+        citations = self._get_citations(rng, 0.3, 10000000 + variant_number * 3)
+        if citations is not None:
+            measure["citation"] = citations
+        return measure
+
+    def _make_trait(self, rng, trait_number):
+        trait = self.get_trait(trait_number)
+        names = [{"elementValue": {"value": trait["name"], "type": "Preferred"}}]
+        names.extend({"elementValue": {"value": alternate_name, "type": "Alternate"}}
+                     for alternate_name in trait["alternate_names"])
+        clinvar_trait = {"name": names, "type": "Disease", "id": trait_number}
+        citations = self._get_citations(rng, 0.4, 20000000 + trait_number * 3)
+        if citations is not None:
+            clinvar_trait["citation"] = citations
+        return clinvar_trait
+
+    def _make_observed_in(self, rng, origin):
+        observed_data = [{"attribute": {"value": self._get_text(rng, 120) or "not provided",
+                                        "type": "Description"}}]
+        citations = self._get_citations(rng, 0.4, 30000000 + rng.randrange(1000000))
+        if citations is not None:
+            observed_data[0]["citation"] = citations
+        return {"sample": {"origin": origin, "species": {"value": "human", "taxonomyId": 9606},
+                           "affectedStatus": "not provided"},
+                "method": [{"methodType": "CLINICAL_TESTING"}],
+                "observedData": observed_data}
+
+    def make_clinvar_record(self, rng, record_number):
+        """CellBase document of a ClinVar record, using the numbers given by rng"""
+        date = 1262304000000 + rng.randrange(0, 220000000) * 1000
+        measures = [self._make_measure(rng, rng.randrange(self.n_variants))
+                    for _ in range(weighted_choice(rng, [(1, 90), (2, 8), (3, 2)]))]
+        # Some traits appear in many more records than others
+        traits = [self._make_trait(rng, int(self.n_traits * rng.random() ** 3))
+                  for _ in range(weighted_choice(rng, [(1, 85), (2, 10), (3, 5)]))]
+        allele_origins = weighted_choice(rng, ALLELE_ORIGINS)
+        clinical_significance = weighted_choice(rng, CLINICAL_SIGNIFICANCES)
+        review_status = weighted_choice(rng, REVIEW_STATUSES)
+
+        clinvar_assertions = []
+        for submission_number in range(rng.randint(1, 3)):
+            clinvar_assertions.append({
+                "clinVarAccession": {"acc": "SCV{:09d}".format(record_number * 4 +
+                                                               submission_number),
+                                     "version": 1, "type": "SCV", "dateUpdated": date},
+                "clinicalSignificance": {"reviewStatus": review_status,
+                                         "description": [clinical_significance]},
+                "observedIn": [self._make_observed_in(rng, origin)
+                               for origin in allele_origins]})
+
+        reference_assertion = {
+            "clinVarAccession": {"acc": "RCV{:09d}".format(record_number), "version": 1,
+                                 "type": "RCV", "dateUpdated": date},
+            "recordStatus": "current",
+            "clinicalSignificance": {"reviewStatus": review_status,
+                                     "description": clinical_significance,
+                                     "dateLastEvaluated": date},
+            "assertion": {"type": "VARIATION_TO_DISEASE"},
+            "observedIn": [self._make_observed_in(rng, origin) for origin in allele_origins],
+            "measureSet": {"measure": measures, "type": "Variant", "id": record_number},
+            "traitSet": {"trait": traits, "type": "Disease", "id": record_number},
+            "dateCreated": date,
+            "dateLastUpdated": date,
+            "id": record_number}
+        return {"clinvarSet": {
+            "recordStatus": "current",
+            "title": "{} AND {}".format(measures[0]["name"][0]["elementValue"]["value"],
+                                        traits[0]["name"][0]["elementValue"]["value"]),
+            "referenceClinVarAssertion": reference_assertion,
+            "clinVarAssertion": clinvar_assertions,
+            "id": record_number}}
+
+    def iter_clinvar_records(self):
+        rng = self._get_rng(0, 0)
+        for record_number in range(self.n_records):
+            yield self.make_clinvar_record(rng, record_number)
+
+    def write_clinvar_json(self, file_path):
+        with utilities.open_file(file_path, "wt") as f:
+            for clinvar_record in self.iter_clinvar_records():
+                f.write(json_codec.dumps(clinvar_record) + "\n")
+
+    def write_snp_2_gene_file(self, file_path):
+        with utilities.open_file(file_path, "wt") as f:
+            for variant_number in range(self.n_variants):
+                variant = self.get_variant(variant_number)
+                for (gene_id, gene_symbol), so_term in variant["consequence_types"]:
+                    f.write("\t".join([variant["consequence_type_id"], "1", gene_id, gene_symbol,
+                                       so_term, "0"]) + "\n")
+
+    def write_efo_mapping_file(self, file_path):
+        with utilities.open_file(file_path, "wt") as f:
+            f.write("#ClinVar trait name\tURI\tLabel\n")
+            for trait_number in range(self.n_traits):
+                mapping_line = self.get_trait(trait_number)["mapping_line"]
+                if mapping_line is not None:
+                    f.write(mapping_line + "\n")
+
+    def write_files(self, dir_out):
+        """Write every input file to dir_out, returning their paths"""
+        os.makedirs(dir_out, exist_ok=True)
+        file_paths = {"json_file": os.path.join(dir_out, CLINVAR_JSON_FILE_NAME),
+                      "snp_2_gene_file": os.path.join(dir_out, SNP_2_GENE_FILE_NAME),
+                      "efo_mapping_file": os.path.join(dir_out, EFO_MAPPING_FILE_NAME)}
+        self.write_clinvar_json(file_paths["json_file"])
+        self.write_snp_2_gene_file(file_paths["snp_2_gene_file"])
+        self.write_efo_mapping_file(file_paths["efo_mapping_file"])
+        return file_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", dest="dir_out", required=True,
+                        help="Directory to write the files to")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Size as a multiple of a ClinVar release of {} records".format(
+                            RELEASE_RECORDS))
+    parser.add_argument("--seed", type=int, default=1,
+                        help="Seed of the random numbers the files are made from")
+    args = parser.parse_args()
+
+    release = SyntheticRelease(args.scale, args.seed)
+    file_paths = release.write_files(args.dir_out)
+    print("{} ClinVar records, {} variants and {} traits written to {}".format(
+        release.n_records, release.n_variants, release.n_traits, ", ".join(
+            file_paths.values())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+"""
+Index of the terms of an EFO release, built from its OWL or OBO file, with each term's label,
+whether it is obsolete and why, and whether it is available for Open Targets (a subclass of
+cttv_root). Used instead of querying the EFO SPARQL endpoint or OLS for each term.
+"""
+
+import os
+import re
+import xml.etree.ElementTree as ElementTree
+from collections import defaultdict, namedtuple
+
+from eva_cttv_pipeline import json_codec
+
+
+CTTV_ROOT = "http://www.targetvalidation.org/cttv_root"
+OBSOLETE_CLASS = "http://www.geneontology.org/formats/oboInOwl#ObsoleteClass"
+
+OWL = "{http://www.w3.org/2002/07/owl#}"
+RDF = "{http://www.w3.org/1999/02/22-rdf-syntax-ns#}"
+RDFS = "{http://www.w3.org/2000/01/rdf-schema#}"
+REASON_FOR_OBSOLESCENCE = "{http://www.ebi.ac.uk/efo/}reason_for_obsolescence"
+
+# IRI prefixes of OBO ids, by id prefix; the default is the OBO Foundry's
+OBO_ID_PREFIXES = {
+    "EFO": "http://www.ebi.ac.uk/efo/EFO_",
+    "Orphanet": "http://www.orpha.net/ORDO/Orphanet_",
+    "cttv_root": "http://www.targetvalidation.org/cttv_root",
+}
+OBO_FOUNDRY_PREFIX = "http://purl.obolibrary.org/obo/"
+
+OBO_QUOTED_VALUE = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+ReleaseTerm = namedtuple("ReleaseTerm", ["iri", "label", "obsolete", "reason", "parents"])
+
+IndexTerm = namedtuple("IndexTerm", ["label", "obsolete", "reason", "cttv_available"])
+
+
+def iter_owl_terms(owl_filepath):
+    """
+    Yields a ReleaseTerm for each named class of an OWL release in RDF/XML, parsing it one class
+    at a time so the whole document is never held in memory.
+    """
+    depth = 0
+    root = None
+    for event, element in ElementTree.iterparse(owl_filepath, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            depth += 1
+            continue
+        depth -= 1
+        # Only classes directly under rdf:RDF; nested ones are anonymous class expressions
+        if depth != 1:
+            continue
+        if element.tag == OWL + "Class" and element.get(RDF + "about") is not None:
+            yield owl_class_to_term(element)
+        # Drop every element parsed so far
+        root.clear()
+
+
+def owl_class_to_term(element):
+    label = None
+    obsolete = False
+    reason = None
+    parents = []
+    for child in element:
+        if child.tag == RDFS + "label" and label is None:
+            label = child.text
+        elif child.tag == OWL + "deprecated":
+            obsolete = obsolete or (child.text or "").strip().lower() == "true"
+        elif child.tag == REASON_FOR_OBSOLESCENCE and reason is None:
+            reason = child.text
+        elif child.tag == RDFS + "subClassOf" and child.get(RDF + "resource") is not None:
+            parents.append(child.get(RDF + "resource"))
+    obsolete = obsolete or OBSOLETE_CLASS in parents
+    return ReleaseTerm(element.get(RDF + "about"), label, obsolete, reason, parents)
+
+
+def obo_id_to_iri(obo_id):
+    if "://" in obo_id:
+        return obo_id
+    prefix, _, local_id = obo_id.partition(":")
+    if prefix in OBO_ID_PREFIXES:
+        return OBO_ID_PREFIXES[prefix] + local_id if local_id else OBO_ID_PREFIXES[prefix]
+    return OBO_FOUNDRY_PREFIX + prefix + "_" + local_id
+
+
+def iter_obo_terms(obo_filepath):
+    """Yields a ReleaseTerm for each [Term] stanza of an OBO release, reading it line by line"""
+    stanza = None
+    with open(obo_filepath, "rt", encoding="utf-8") as obo_file:
+        for line in obo_file:
+            line = line.strip()
+            if line.startswith("["):
+                if stanza:
+                    yield obo_stanza_to_term(stanza)
+                stanza = defaultdict(list) if line == "[Term]" else None
+            elif stanza is not None and ":" in line:
+                tag, _, value = line.partition(":")
+                stanza[tag].append(value.strip())
+    if stanza:
+        yield obo_stanza_to_term(stanza)
+
+
+def obo_stanza_to_term(stanza):
+    def unquote(value):
+        match = OBO_QUOTED_VALUE.search(value)
+        return match.group(1).replace('\\"', '"') if match else value
+
+    reason = None
+    for property_value in stanza["property_value"]:
+        if "reason_for_obsolescence" in property_value:
+            reason = unquote(property_value)
+            break
+    if reason is None and stanza["comment"]:
+        reason = stanza["comment"][0]
+    # is_a values may be followed by the parent's name as a "! name" comment
+    parents = [obo_id_to_iri(is_a.split("!")[0].split()[0]) for is_a in stanza["is_a"]]
+    obsolete = "true" in stanza["is_obsolete"] or OBSOLETE_CLASS in parents
+    label = stanza["name"][0] if stanza["name"] else None
+    return ReleaseTerm(obo_id_to_iri(stanza["id"][0]), label, obsolete,
+                       reason if obsolete else None, parents)
+
+
+def iter_release_terms(release_filepath):
+    if release_filepath.endswith(".obo"):
+        return iter_obo_terms(release_filepath)
+    return iter_owl_terms(release_filepath)
+
+
+class EFOIndex:
+
+    """Terms of an EFO release, by IRI, as IndexTerm"""
+
+    def __init__(self, terms):
+        self.terms = terms
+
+    @classmethod
+    def from_release(cls, release_filepath):
+        """Build the index of an EFO release file, OWL (RDF/XML) or OBO (if named .obo)"""
+        terms = {}
+        children = defaultdict(list)
+        for term in iter_release_terms(release_filepath):
+            terms[term.iri] = term
+            for parent in term.parents:
+                children[parent].append(term.iri)
+
+        # Available terms, as in the SPARQL query used before, are the labelled subclasses of
+        # cttv_root, itself included
+        cttv_available = set()
+        pending = [CTTV_ROOT]
+        while pending:
+            iri = pending.pop()
+            if iri not in cttv_available:
+                cttv_available.add(iri)
+                pending.extend(children[iri])
+
+        return cls({iri: IndexTerm(term.label, term.obsolete, term.reason,
+                                   iri in cttv_available and term.label is not None)
+                    for iri, term in terms.items()})
+
+    @classmethod
+    def load(cls, index_filepath):
+        with open(index_filepath, "rt", encoding="utf-8") as index_file:
+            terms = json_codec.loads(index_file.read())
+        return cls({iri: IndexTerm(*term) for iri, term in terms.items()})
+
+    def save(self, index_filepath):
+        # Written to a temporary file first so other processes never read a partial index
+        temp_filepath = "{}.{}.tmp".format(index_filepath, os.getpid())
+        with open(temp_filepath, "wt", encoding="utf-8") as index_file:
+            index_file.write(json_codec.dumps({iri: list(term)
+                                               for iri, term in self.terms.items()}))
+        os.replace(temp_filepath, index_filepath)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def __contains__(self, iri):
+        return iri in self.terms
+
+    def get_label(self, iri):
+        term = self.terms.get(iri)
+        return term.label if term is not None else None
+
+    def is_in_efo(self, iri):
+        return iri in self.terms
+
+    def is_current_and_in_efo(self, iri):
+        term = self.terms.get(iri)
+        return term is not None and not term.obsolete
+
+    def get_obsolete_terms(self):
+        """Obsolete terms with their reason for obsolescence, as EFOTerm.obsolete_terms"""
+        return {iri: term.reason or "" for iri, term in self.terms.items() if term.obsolete}
+
+    def get_cttv_available_terms(self):
+        """Terms available for Open Targets with their label, as EFOTerm.cttv_available_terms"""
+        return {iri: term.label for iri, term in self.terms.items() if term.cttv_available}
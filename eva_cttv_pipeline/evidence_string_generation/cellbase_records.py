@@ -1,22 +1,135 @@
-import json
+import itertools
+import re
 
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import stage_timings
 from eva_cttv_pipeline.evidence_string_generation import utilities
 
 
+class ClinicalSignificanceFilter:
+
+    """
+    Skips ClinVar records without an allowed clinical significance before they are fully parsed.
+    The undecoded json line is first searched for an allowed clinical significance as a string
+    value, which is much cheaper than decoding it; only lines which may have one are decoded, and
+    their clinical significance checked as in clinvar_to_evidence_strings.skip_record.
+    """
+
+    # Characters which json never escapes, so values made of them can be searched for in the line
+    unescaped_value_pattern = re.compile(r'[ !#-\[\]-~]*')
+
+    def __init__(self, allowed_clinical_significance):
+        self.allowed_clinical_significance = set(allowed_clinical_significance)
+        if all(self.unescaped_value_pattern.fullmatch(clinical_significance)
+               for clinical_significance in self.allowed_clinical_significance):
+            self.quoted_values = ['"' + clinical_significance + '"' for clinical_significance
+                                  in self.allowed_clinical_significance]
+        else:
+            self.quoted_values = None
+        self.n_skipped = 0
+
+    def line_may_pass(self, line):
+        """False if the json line can not be of a record with an allowed clinical significance"""
+        # A \u escape could spell out any of the values
+        if self.quoted_values is None or '\\u' in line:
+            return True
+        lowered_line = line.lower()
+        if any(quoted_value in lowered_line for quoted_value in self.quoted_values):
+            return True
+        self.n_skipped += 1
+        return False
+
+    def record_passes(self, cellbase_record):
+        clinical_significance = cellbase_record['clinvarSet']['referenceClinVarAssertion'][
+            'clinicalSignificance']['description']
+        if clinical_significance.lower() in self.allowed_clinical_significance:
+            return True
+        self.n_skipped += 1
+        return False
+
+
 class CellbaseRecords:
 
     """Assists in the requesting and iteration of clinvar cellbase records."""
 
-    def __init__(self, json_file):
+    def __init__(self, json_file, clinical_significance_filter=None):
         """
 
         :param json_file: Path to a file containing a list of json strings of the Clinvar records
         from Cellbase, one per line. This can be used to potentially save time since requests to
         Cellbase are subsequently not needed.
+        :param clinical_significance_filter: Optional ClinicalSignificanceFilter, to skip records
+        without an allowed clinical significance.
         """
         self.json_file = json_file
+        self.clinical_significance_filter = clinical_significance_filter
+        # Number of lines skipped at the start of the file by raw_records, to resume a run
+        self.start_line = 0
+        self.n_lines_read = 0
 
     def __iter__(self):
+        return self.records()
+
+    def records(self, timings=None):
+        """
+        Yields each ClinVar record, decoded. The lines of the records are read
+        config.READ_BATCH_SIZE at a time. The time spent reading and decoding the records is
+        added to the read and decode stages of timings, if given.
+        """
+        record_filter = self.clinical_significance_filter
+        if timings is None:
+            timings = stage_timings.StageTimings()
+        decode_stage = timings["decode"]
+        for lines in self.raw_record_batches(config.READ_BATCH_SIZE, timings):
+            # Decoded one at a time, as holding a batch of large decoded records is slower
+            for line in lines:
+                with decode_stage:
+                    cellbase_record = json_codec.loads(line)
+                if record_filter is not None and not record_filter.record_passes(cellbase_record):
+                    continue
+                yield cellbase_record
+
+    def raw_records(self):
+        """
+        Yields the undecoded json line of each ClinVar record. Only the check of the undecoded line
+        of the clinical significance filter is applied.
+        """
+        record_filter = self.clinical_significance_filter
+        self.n_lines_read = 0
         with utilities.open_file(self.json_file, "rt") as f:
             for line in f:
-                yield json.loads(line.rstrip())
+                self.n_lines_read += 1
+                if self.n_lines_read <= self.start_line:
+                    continue
+                if record_filter is not None and not record_filter.line_may_pass(line):
+                    continue
+                yield line
+
+    def raw_record_batches(self, batch_size, timings=None):
+        """
+        Yields lists of up to batch_size lines of raw_records. The time spent reading each batch is
+        added to the read stage of timings, if given.
+        """
+        if timings is None:
+            timings = stage_timings.StageTimings()
+        read_stage = timings["read"]
+        lines = self.raw_records()
+        while True:
+            with read_stage:
+                batch = list(itertools.islice(lines, batch_size))
+            if not batch:
+                return
+            yield batch
+
+    @property
+    def position(self):
+        """Number of lines read by raw_records so far, and of them skipped by the filter"""
+        return self.n_lines_read, self.n_skipped
+
+    @property
+    def n_skipped(self):
+        """Number of records skipped by the clinical significance filter"""
+        if self.clinical_significance_filter is None:
+            return 0
+        return self.clinical_significance_filter.n_skipped
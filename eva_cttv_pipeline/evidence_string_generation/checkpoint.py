@@ -0,0 +1,135 @@
+"""
+Checkpoints of a run of the pipeline, so that a run which stops can be resumed where it was and
+give the same output as one which didn't.
+
+ClinVar records are processed in batches, each into a partial report which is merged into the
+report of the run (see clinvar_to_evidence_strings.process_clinvar_records_separately). Every
+config.CHECKPOINT_INTERVAL records, once the output files have been flushed to disk, a line is
+appended to the checkpoint file with the number of input lines processed, the size of the output
+files and the records added to the report since the previous checkpoint, other than the zooma
+records already in the zooma file. The first line of the file holds the settings of the run, which
+must be the same to resume it: the input files, the options changing the output and the run key of
+incremental mode, which covers the schema, the evidence string templates and the EFO terms.
+"""
+
+import os
+from collections import namedtuple
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import incremental
+
+
+# Increase when what is stored in checkpoints changes, so older checkpoints are not used
+CHECKPOINT_VERSION = 3
+
+Checkpoint = namedtuple("Checkpoint", ["n_lines", "n_skipped_lines", "evidence_strings_size",
+                                       "quarantine_size", "zooma_size", "reports"])
+
+
+def get_file_settings(file_path):
+    stat = os.stat(file_path)
+    return {"path": os.path.abspath(file_path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def get_settings(json_file, efo_mapping_file, snp_2_gene_file, allowed_clinical_significance,
+                 prefilter_clin_sig, quarantine, most_severe_consequence):
+    return {"version": CHECKPOINT_VERSION, "json_file": get_file_settings(json_file),
+            "efo_mapping_file": get_file_settings(efo_mapping_file),
+            "snp_2_gene_file": get_file_settings(snp_2_gene_file),
+            "allowed_clinical_significance": list(allowed_clinical_significance),
+            "prefilter_clin_sig": prefilter_clin_sig, "quarantine": quarantine,
+            "most_severe_consequence": most_severe_consequence,
+            "run_key": incremental.get_run_key(allowed_clinical_significance)}
+
+
+def sync(fh):
+    fh.flush()
+    os.fsync(fh.fileno())
+    return os.fstat(fh.fileno()).st_size
+
+
+class Checkpointer:
+
+    """Writes the checkpoints of a run to checkpoint_file, and reads them to resume it"""
+
+    def __init__(self, checkpoint_file, settings):
+        self.checkpoint_file = checkpoint_file
+        self.settings = settings
+        self.checkpoint_fh = None
+        # Records since the last checkpoint, and what they added to the report
+        self.n_records = 0
+        self.reports = []
+
+    def load(self):
+        """
+        Return the last Checkpoint in the checkpoint file, with every report of the checkpoints up
+        to it, or None if there is none.
+        """
+        if not os.path.exists(self.checkpoint_file):
+            return None
+        last_checkpoint = None
+        reports = []
+        with open(self.checkpoint_file, "rb") as checkpoint_fh:
+            line = checkpoint_fh.readline()
+            settings = json_codec.loads(line.decode())
+            if settings != self.settings:
+                raise ValueError("Checkpoint file {} is of a run with different input or settings: "
+                                 "{}".format(self.checkpoint_file, settings))
+            size = len(line)
+            for line in checkpoint_fh:
+                # The run may have stopped while writing the last line
+                if not line.endswith(b"\n"):
+                    break
+                last_checkpoint = json_codec.loads(line.decode())
+                reports.extend(last_checkpoint["reports"])
+                size += len(line)
+        # Drop anything after the last whole checkpoint, so more can be appended
+        with open(self.checkpoint_file, "r+b") as checkpoint_fh:
+            checkpoint_fh.truncate(size)
+        if last_checkpoint is None:
+            return None
+        return Checkpoint(last_checkpoint["n_lines"], last_checkpoint["n_skipped_lines"],
+                          last_checkpoint["evidence_strings_size"],
+                          last_checkpoint["quarantine_size"], last_checkpoint["zooma_size"],
+                          reports)
+
+    def start(self, resumed):
+        if resumed:
+            self.checkpoint_fh = open(self.checkpoint_file, "at")
+        else:
+            self.checkpoint_fh = open(self.checkpoint_file, "wt")
+            self.checkpoint_fh.write(json_codec.dumps(self.settings) + "\n")
+            sync(self.checkpoint_fh)
+
+    def add(self, partial_report, n_records, position, report):
+        """
+        Add the partial report of a batch of n_records ClinVar records, just merged into report,
+        writing a checkpoint if enough records have been processed since the last one. position is
+        the number of input lines read, and of them skipped, up to the end of the batch.
+        """
+        report_dict = partial_report.to_dict()
+        if report.zooma_fh is not None:
+            # Already in the zooma file, which is cut back to its size at the checkpoint on resuming
+            del report_dict["evidence_list"]
+        self.reports.append(report_dict)
+        self.n_records += n_records
+        if self.n_records < config.CHECKPOINT_INTERVAL:
+            return
+        n_lines, n_skipped_lines = position
+        checkpoint = {
+            "n_lines": n_lines, "n_skipped_lines": n_skipped_lines,
+            "evidence_strings_size": sync(report.evidence_string_fh),
+            "quarantine_size":
+                sync(report.quarantine_fh) if report.quarantine_fh is not None else 0,
+            "zooma_size": sync(report.zooma_fh) if report.zooma_fh is not None else 0,
+            "reports": self.reports}
+        self.checkpoint_fh.write(json_codec.dumps(checkpoint) + "\n")
+        sync(self.checkpoint_fh)
+        self.n_records = 0
+        self.reports = []
+
+    def remove(self):
+        """Remove the checkpoint file, once the run has finished"""
+        self.checkpoint_fh.close()
+        os.remove(self.checkpoint_file)
@@ -1,13 +1,33 @@
 from datetime import datetime
-from collections import UserDict
 
 
-class ClinvarRecord(UserDict):
+EUROPE_PMC_URL = 'http://europepmc.org/abstract/MED/'
+
+
+def get_pubmed_refs(citations):
+    pubmed_refs_list = []
+    for citation in citations:
+        if ('id' in citation) and citation['id'] is not None:
+            for citation_id in citation['id']:
+                if citation_id['source'] == 'PubMed':
+                    pubmed_refs_list.append(int(citation_id['value']))
+    return pubmed_refs_list
+
+
+def get_refs_list(pubmed_refs):
+    return [EUROPE_PMC_URL + str(ref) for ref in pubmed_refs]
+
+
+class ClinvarRecord:
     """
-    Class of which instances hold data on individual clinvar records. Subclass of UserDict rather
-    than dict in order to use attributes
+    Class of which instances hold data on individual clinvar records. Every field used by the
+    pipeline is extracted from the CellBase document once, when the record is created.
     """
 
+    __slots__ = ('data', 'accession', 'date', 'review_status', 'clinical_significance', 'traits',
+                 'trait_pubmed_refs', 'trait_refs_list', 'observed_pubmed_refs',
+                 'observed_refs_list', 'allele_origins', 'measures')
+
     score_map = {
         "CLASSIFIED_BY_SINGLE_SUBMITTER": 1,
         "NOT_CLASSIFIED_BY_SUBMITTER": None,
@@ -17,115 +37,93 @@ class ClinvarRecord(UserDict):
     }
 
     def __init__(self, cellbase_dict):
-        UserDict.__init__(self, cellbase_dict)
-        self.measures = [ClinvarRecordMeasure(measure_dict, self)
-                         for measure_dict in self.data['referenceClinVarAssertion']["measureSet"]["measure"]]
-
-    @property
-    def date(self):
-        return datetime.fromtimestamp(
-            self.data['referenceClinVarAssertion']['dateLastUpdated'] / 1000).isoformat()
-
-    @property
-    def score(self):
-        return self.score_map[
-            self.data['referenceClinVarAssertion']['clinicalSignificance']['reviewStatus']
-        ]
-
-    @property
-    def accession(self):
-        return self.data['referenceClinVarAssertion']['clinVarAccession']['acc']
-
-    @property
-    def traits(self):
-        trait_list = []
-        for trait in self.data['referenceClinVarAssertion']['traitSet']['trait']:
-            trait_list.append([])
+        self.data = cellbase_dict
+        reference_assertion = cellbase_dict['referenceClinVarAssertion']
+
+        self.accession = reference_assertion['clinVarAccession']['acc']
+        self.date = datetime.fromtimestamp(
+            reference_assertion['dateLastUpdated'] / 1000).isoformat()
+        self.review_status = reference_assertion['clinicalSignificance']['reviewStatus']
+        self.clinical_significance = reference_assertion['clinicalSignificance']['description']
+
+        self.traits = []
+        self.trait_pubmed_refs = []
+        for trait in reference_assertion['traitSet']['trait']:
+            self.traits.append([])
             for name in trait['name']:
                 # First trait name in the list will always be the "Preferred" one
                 if name['elementValue']['type'] == 'Preferred':
-                    trait_list[-1] = [name['elementValue']['value']] + trait_list[-1]
+                    self.traits[-1] = [name['elementValue']['value']] + self.traits[-1]
                 elif name['elementValue']['type'] in ["EFO URL", "EFO id", "EFO name"]:
                     continue  # if the trait name not originally from clinvar
                 else:
-                    trait_list[-1].append(name['elementValue']['value'])
-
-        return trait_list
-
-    @property
-    def trait_pubmed_refs(self):
-        pubmed_refs_list = []
-        for trait in self.data['referenceClinVarAssertion']['traitSet']['trait']:
-            pubmed_refs_list.append([])
-            if 'citation' in trait:
-                for citation in trait['citation']:
-                    if ('id' in citation) and citation['id'] is not None:
-                        for citation_id in citation['id']:
-                            if citation_id['source'] == 'PubMed':
-                                pubmed_refs_list[-1].append(int(citation_id['value']))
-
-        return pubmed_refs_list
+                    self.traits[-1].append(name['elementValue']['value'])
+            self.trait_pubmed_refs.append(get_pubmed_refs(trait.get('citation', [])))
+        self.trait_refs_list = [get_refs_list(pubmed_refs)
+                                for pubmed_refs in self.trait_pubmed_refs]
+
+        self.observed_pubmed_refs = []
+        for observed_in in reference_assertion.get('observedIn', []):
+            for observed_data in observed_in['observedData']:
+                if 'citation' in observed_data:
+                    self.observed_pubmed_refs.extend(get_pubmed_refs(observed_data['citation']))
+        self.observed_refs_list = get_refs_list(self.observed_pubmed_refs)
 
-    @property
-    def observed_pubmed_refs(self):
-        pubmed_refs_list = []
-        if 'observedIn' in self.data['referenceClinVarAssertion']:
-            for observed_in in self.data['referenceClinVarAssertion']['observedIn']:
-                for observed_data in observed_in['observedData']:
-                    if 'citation' in observed_data:
-                        for citation in observed_data['citation']:
-                            if ('id' in citation) and citation['id'] is not None:
-                                for citation_id in citation['id']:
-                                    if citation_id['source'] == 'PubMed':
-                                        pubmed_refs_list.append(int(citation_id['value']))
-        return pubmed_refs_list
+        allele_origins = set()
+        for clinvar_assertion_document in cellbase_dict['clinVarAssertion']:
+            for observed_in_document in clinvar_assertion_document['observedIn']:
+                allele_origins.add(observed_in_document['sample']['origin'].lower())
+        self.allele_origins = list(allele_origins)
 
-    @property
-    def trait_refs_list(self):
-        return [['http://europepmc.org/abstract/MED/' + str(ref) for ref in ref_list]
-                for ref_list in self.trait_pubmed_refs]
+        self.measures = [ClinvarRecordMeasure(measure_dict, self)
+                         for measure_dict in reference_assertion["measureSet"]["measure"]]
 
-    @property
-    def observed_refs_list(self):
-        return ['http://europepmc.org/abstract/MED/' + str(ref)
-                for ref in self.observed_pubmed_refs]
+    def __str__(self):
+        return str(self.data)
 
     @property
-    def clinical_significance(self):
-        return \
-            self.data['referenceClinVarAssertion']['clinicalSignificance']['description']
+    def score(self):
+        return self.score_map[self.review_status]
 
-    @property
-    def allele_origins(self):
-        allele_origins = set()
-        for clinvar_assertion_document in self.data['clinVarAssertion']:
-            for observed_in_document in clinvar_assertion_document['observedIn']:
-                allele_origins.add(observed_in_document['sample']['origin'].lower())
 
-        return list(allele_origins)
+class ClinvarRecordMeasure:
 
+    __slots__ = ('data', 'clinvar_record', 'rs_id', 'nsv_id', 'pubmed_refs', 'refs_list', 'chr',
+                 'start', 'stop', 'ref', 'alt')
 
-class ClinvarRecordMeasure(UserDict):
+    # Attributes of the GRCh38 sequence location, with the ClinvarRecordMeasure slots they fill
+    sequence_location_attributes = (('chr', 'chr'), ('start', 'start'), ('stop', 'stop'),
+                                    ('referenceAllele', 'ref'), ('alternateAllele', 'alt'))
 
     def __init__(self, clinvar_measure_dict, clinvar_record):
-        UserDict.__init__(self, clinvar_measure_dict)
+        self.data = clinvar_measure_dict
         self.clinvar_record = clinvar_record
 
-    @property
-    def rs_id(self):
-        if "xref" in self.data:
-            for xref in self.data["xref"]:
-                if xref["db"].lower() == "dbsnp":
-                    return "rs{}".format(xref["id"])
-        return None
+        self.rs_id = None
+        self.nsv_id = None
+        for xref in clinvar_measure_dict.get("xref", []):
+            if self.rs_id is None and xref["db"].lower() == "dbsnp":
+                self.rs_id = "rs{}".format(xref["id"])
+            elif self.nsv_id is None and xref["db"].lower() == "dbvar" and \
+                    xref["id"].lower()[:3] in ("nsv", "esv"):
+                self.nsv_id = xref["id"]
+
+        self.pubmed_refs = get_pubmed_refs(clinvar_measure_dict.get('citation', []))
+        self.refs_list = get_refs_list(self.pubmed_refs)
+
+        # Each attribute is taken from the first GRCh38 location which has it
+        missing_attributes = list(self.sequence_location_attributes)
+        for attr, slot in missing_attributes:
+            setattr(self, slot, None)
+        for sequence_location in clinvar_measure_dict.get("sequenceLocation", []):
+            if sequence_location["assembly"].lower() == "grch38":
+                for attr, slot in list(missing_attributes):
+                    if attr in sequence_location:
+                        setattr(self, slot, sequence_location[attr])
+                        missing_attributes.remove((attr, slot))
 
-    @property
-    def nsv_id(self):
-        if "xref" in self.data:
-            for xref in self.data["xref"]:
-                if xref["db"].lower() == "dbvar" and xref["id"].lower()[:3] in ("nsv", "esv"):
-                    return xref["id"]
-        return None
+    def __str__(self):
+        return str(self.data)
 
     @property
     def hgvs(self):
@@ -139,48 +137,3 @@ class ClinvarRecordMeasure(UserDict):
     @property
     def variant_type(self):
         return self.data['type']
-
-    @property
-    def pubmed_refs(self):
-        pubmed_refs_list = []
-        if 'citation' in self.data:
-            for citation in self.data['citation']:
-                if 'id' in citation and citation['id'] is not None:
-                    for citation_id in citation['id']:
-                        if citation_id['source'] == 'PubMed':
-                            pubmed_refs_list.append(int(citation_id['value']))
-        return pubmed_refs_list
-
-    @property
-    def refs_list(self):
-        return ['http://europepmc.org/abstract/MED/' + str(ref)
-                for ref in self.pubmed_refs]
-
-    @property
-    def chr(self):
-        return self.sequence_location_helper("chr")
-
-    @property
-    def start(self):
-        return self.sequence_location_helper("start")
-
-    @property
-    def stop(self):
-        return self.sequence_location_helper("stop")
-
-    @property
-    def ref(self):
-        return self.sequence_location_helper("referenceAllele")
-
-    @property
-    def alt(self):
-        return self.sequence_location_helper("alternateAllele")
-
-    def sequence_location_helper(self, attr):
-        if "sequenceLocation" in self.data:
-            for sequence_location in self.data["sequenceLocation"]:
-                if sequence_location["assembly"].lower() == "grch38":
-                    if attr in sequence_location:
-                        return sequence_location[attr]
-        return None
-
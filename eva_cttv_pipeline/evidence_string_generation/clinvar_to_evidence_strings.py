@@ -1,43 +1,82 @@
+import contextlib
 import itertools
-import copy
-import json
+import io
+import multiprocessing
 import sys
 import os
-from collections import defaultdict
+from collections import defaultdict, deque, namedtuple
 from time import gmtime, strftime
 from types import SimpleNamespace
 
 import jsonschema
 
+from eva_cttv_pipeline import json_codec
 from eva_cttv_pipeline.evidence_string_generation import cellbase_records
+from eva_cttv_pipeline.evidence_string_generation import checkpoint
 from eva_cttv_pipeline.evidence_string_generation import efo_term
 from eva_cttv_pipeline.evidence_string_generation import config
 from eva_cttv_pipeline.evidence_string_generation import evidence_strings
 from eva_cttv_pipeline.evidence_string_generation import clinvar
+from eva_cttv_pipeline.evidence_string_generation import deduplication
+from eva_cttv_pipeline.evidence_string_generation import incremental
+from eva_cttv_pipeline.evidence_string_generation import shards
+from eva_cttv_pipeline.evidence_string_generation import stage_timings
 from eva_cttv_pipeline.evidence_string_generation import utilities
+from eva_cttv_pipeline.evidence_string_generation import validation
 from eva_cttv_pipeline.evidence_string_generation import consequence_type as CT
 from eva_cttv_pipeline.evidence_string_generation import trait
 
 
+# What is added to the report for an evidence string once it is stored: its zooma record, the
+# trait and gene it is for, whether it is for an nsv, and the RecordProgress of its ClinVar record
+# with the index of its measure there
+EvidenceStringDetails = namedtuple("EvidenceStringDetails", [
+    "zooma_record", "trait", "ensembl_gene_id", "is_nsv", "record_progress", "measure_index"])
+
+
+class RecordProgress:
+
+    """
+    Number of evidence strings of each measure of a ClinVar record stored so far. The counters of
+    processed records are only added once every evidence string of the record has been generated
+    and, if in a validation stage, validated.
+    """
+
+    __slots__ = ("n_stored_by_measure", "n_pending", "finished")
+
+    def __init__(self, n_measures):
+        self.n_stored_by_measure = [0] * n_measures
+        self.n_pending = 0
+        self.finished = False
+
+
 class Report:
 
     """
-    Holds counters and other records of a pipeline run. Includes the list of evidence strings
-    generated in the running of the pipeline.
+    Holds counters and other records of a pipeline run. Evidence strings generated in the running
+    of the pipeline are either written straight to evidence_string_fh as they are produced or, if
+    no file handle is given, kept in evidence_string_list until write_output is called. The same
+    goes for the records of the zooma file, written to zooma_fh or kept in evidence_list.
+    Evidence strings failing validation stop the run, unless quarantine_fh is given, in which case
+    they are written there along with the validation error. If a validation_stage is given,
+    validation is carried out by it in separate processes. The time spent in each stage of the run
+    is kept in timings.
     Includes method to write to output files, and __str__ shows the summary of the report.
     One instance of this class is instantiated in the running of the pipeline.
     """
 
-    def __init__(self, trait_mappings=None, unavailable_efo=None):
+    def __init__(self, trait_mappings=None, unavailable_efo=None, evidence_string_fh=None,
+                 quarantine_fh=None, validation_stage=None, timings=None, zooma_fh=None):
         if unavailable_efo is None:
             self.unavailable_efo = set()
         else:
             self.unavailable_efo = unavailable_efo
 
+        # Not changed, the mappings not used being those of trait names not in used_trait_names
         if trait_mappings is None:
             self.trait_mappings = {}
         else:
-            self.trait_mappings = copy.deepcopy(trait_mappings)
+            self.trait_mappings = trait_mappings
 
         self.unrecognised_clin_sigs = set()
         self.ensembl_gene_id_uris = set()
@@ -45,15 +84,41 @@ class Report:
         self.n_unrecognised_allele_origin = defaultdict(int)
         self.nsv_list = []
         self.unmapped_traits = defaultdict(int)
+        self.evidence_string_fh = evidence_string_fh
         self.evidence_string_list = []
+        # If a list, the output keys (see evidence_strings.get_output_keys) of the evidence strings
+        # written to evidence_string_fh, for a partial report to be merged into one writing its
+        # evidence strings with write_evidence_string
+        self.output_keys = None
+        self.quarantine_fh = quarantine_fh
+        self.validation_stage = validation_stage
         self.evidence_list = []  # To store Helen Parkinson records of the form
+        self.zooma_fh = zooma_fh
+        self.zooma_date = strftime("%d/%m/%y %H:%M", gmtime())
+        self.used_trait_names = set()
+        # With --preFilterClinSig, records without an allowed clinical significance are skipped
+        # before being parsed, so their nsvs, allele origins and unmapped traits aren't counted,
+        # nor written to the nsv list or the unmapped traits file
+        self.prefiltered_clin_sig = False
         self.counters = self.__get_counters()
+        self.timings = timings if timings is not None else stage_timings.StageTimings()
 
     def __str__(self):
+        # Counts of every record processed, which don't include those skipped by the prefilter
+        prefilter_note = ' (not counting ClinVar records skipped by --preFilterClinSig)' \
+            if self.prefiltered_clin_sig else ''
 
         report_strings = [
             str(self.counters["record_counter"]) + ' ClinVar records in total',
-            str(len(self.evidence_string_list)) + ' evidence string jsons generated',
+            str(self.counters["n_prefiltered_clin_sig"]) +
+            ' ClinVar records were skipped before processing because of a different clinical ' +
+            'significance, and are not included in any other count',
+            str(self.counters["n_evidence_strings"]) + ' evidence string jsons generated',
+            str(self.counters["n_duplicate_evidence_strings"]) +
+            ' evidence string jsons were not written as duplicates of another one',
+            str(self.counters["n_quarantined_evidence_strings"]) +
+            ' evidence string jsons failed validation and were written to ' +
+            config.QUARANTINE_FILE_NAME,
             str(self.counters["n_processed_clinvar_records"]) +
             ' ClinVar records generated at least one evidence string',
             str(len(self.unrecognised_clin_sigs)) +
@@ -76,7 +141,7 @@ class Report:
             str(self.counters["n_germline_somatic"]) +
             ' ClinVar records with germline and somatic origins',
             str(self.counters["n_multiple_allele_origin"]) +
-            ' ClinVar records with more than one allele origin',
+            ' ClinVar records with more than one allele origin' + prefilter_note,
             'Number valid ClinVar records with unprocessed allele origins:'
         ]
 
@@ -92,7 +157,7 @@ class Report:
             str(self.counters["n_missed_strings_unmapped_traits"]) +
             ' ClinVar records with allowed clinical significance, valid rs id and ' +
             'Variant->ENSG mapping were skipped due to a lack of EFO mapping (see ' +
-            config.UNMAPPED_TRAITS_FILE_NAME + ').',
+            config.UNMAPPED_TRAITS_FILE_NAME + ')' + prefilter_note + '.',
             str(self.counters["n_records_no_recognised_allele_origin"]) +
             ' ClinVar records with allowed clinical significance, ' +
             'valid rs id, valid Variant->ENSG' +
@@ -103,7 +168,9 @@ class Report:
             ' evidence strings were generated with traits without EFO correspondence',
             str(self.counters["n_valid_rs_and_nsv"]) +
             ' evidence strings were generated from ClinVar records with rs and nsv ids',
-            str(self.counters["n_nsvs"]) + ' total nsvs found',
+            str(self.counters["n_nsvs"]) + ' total nsvs found' + prefilter_note,
+            'ClinVar nsvs skipped because of a different clinical significance are not counted '
+            'with --preFilterClinSig' if self.prefiltered_clin_sig else
             str(self.counters["n_nsv_skipped_clin_sig"]) +
             ' ClinVar nsvs were skipped because of a different clinical significance',
             str(self.counters["n_nsv_skipped_wrong_ref_alt"]) +
@@ -112,25 +179,137 @@ class Report:
 
         return '\n'.join(report_strings)
 
-    def add_evidence_string(self, ev_string, clinvar_record, trait, ensembl_gene_id):
+    def add_evidence_string(self, ev_string, clinvar_record, trait, ensembl_gene_id,
+                            details=None):
+        """
+        Validate and store an evidence string, returning whether it was stored. If it is rather
+        submitted to the validation stage, False is returned, and once validated and stored its
+        EvidenceStringDetails, if given, are added by add_validated_evidence_string.
+        """
+        # Serialised once, for both validating and writing it
+        with self.timings["output"]:
+            evidence_string_line = evidence_strings.evidence_string_to_json(ev_string)
+        if self.validation_stage is not None:
+            if details is not None:
+                details.record_progress.n_pending += 1
+            with self.timings["validation"]:
+                validated_list = self.validation_stage.submit(ev_string, evidence_string_line,
+                                                              details)
+            for validated in validated_list:
+                self.add_validated_evidence_string(*validated)
+            return False
+
         try:
-            ev_string.validate()
+            with self.timings["validation"]:
+                ev_string.validate(json_codec.loads(evidence_string_line))
+        except (jsonschema.exceptions.ValidationError,
+                efo_term.EFOTerm.IsObsoleteException) as err:
+            if self.quarantine_fh is not None:
+                self.quarantine_evidence_string(ev_string, err)
+                return False
+            self.exit_on_invalid_evidence_string(ev_string, err, clinvar_record, trait,
+                                                 ensembl_gene_id)
+
+        self.store_evidence_string(ev_string, evidence_string_line)
+        return True
+
+    def add_validated_evidence_string(self, ev_string, evidence_string_line, error,
+                                      details=None):
+        """Handle an evidence string which has been through the validation stage"""
+        if error is None:
+            self.store_evidence_string(ev_string, evidence_string_line)
+        elif self.quarantine_fh is not None:
+            self.quarantine_evidence_string(ev_string, error)
+        else:
+            print('Error: evidence_string is not valid.')
+            print(error)
+            print(evidence_string_line)
+            sys.exit(1)
+        if details is not None:
+            if error is None:
+                self.add_evidence_string_details(details)
+            details.record_progress.n_pending -= 1
+            self.add_record_progress(details.record_progress)
+
+    def add_evidence_string_details(self, details):
+        """Add the records of a stored evidence string to the report"""
+        self.add_evidence_record(details.zooma_record)
+        self.counters["n_valid_rs_and_nsv"] += details.is_nsv
+        self.traits.add(details.trait.ontology_id)
+        self.add_used_trait_name(details.trait.clinvar_name)
+        self.ensembl_gene_id_uris.add(
+            evidence_strings.get_ensembl_gene_id_uri(details.ensembl_gene_id))
+        details.record_progress.n_stored_by_measure[details.measure_index] += 1
+
+    def add_record_progress(self, record_progress):
+        """
+        Add the counters of processed records for a ClinVar record, once all its evidence strings
+        have been generated and none are waiting to be validated
+        """
+        if not record_progress.finished or record_progress.n_pending:
+            return
+        # Counted after each measure, by the evidence strings of the record up to it
+        n_stored = 0
+        for n_stored_by_measure in record_progress.n_stored_by_measure:
+            n_stored += n_stored_by_measure
+            if n_stored > 0:
+                self.counters["n_processed_clinvar_records"] += 1
+                if n_stored > 1:
+                    self.counters["n_multiple_evidence_strings"] += 1
+
+    def close_validation_stage(self):
+        """Wait for the validation stage to finish, adding the evidence strings still in it"""
+        if self.validation_stage is not None:
+            with self.timings["validation"]:
+                validated_list = self.validation_stage.close()
+            for validated in validated_list:
+                self.add_validated_evidence_string(*validated)
+            self.validation_stage = None
+
+    def store_evidence_string(self, ev_string, evidence_string_line=None):
+        self.counters["n_evidence_strings"] += 1
+        if self.evidence_string_fh is not None:
+            with self.timings["output"]:
+                if evidence_string_line is None:
+                    evidence_string_line = evidence_strings.evidence_string_to_json(ev_string)
+                # Writers which tell evidence strings apart are given their keys, so they don't
+                # parse them again
+                write_evidence_string = getattr(self.evidence_string_fh, "write_evidence_string",
+                                                None)
+                if write_evidence_string is not None:
+                    write_evidence_string(evidence_string_line,
+                                          *evidence_strings.get_output_keys(ev_string))
+                else:
+                    self.evidence_string_fh.write(evidence_string_line + '\n')
+                    if self.output_keys is not None:
+                        self.output_keys.append(evidence_strings.get_output_keys(ev_string))
+        else:
             self.evidence_string_list.append(ev_string)
-        except jsonschema.exceptions.ValidationError as err:
+
+    def quarantine_evidence_string(self, ev_string, error):
+        self.counters["n_quarantined_evidence_strings"] += 1
+        # Same as json.dumps of the dict, without converting the evidence string to a dict
+        with self.timings["output"]:
+            self.quarantine_fh.write('{"error": ' + json_codec.dumps(str(error)) +
+                                     ', "evidence_string": ' +
+                                     evidence_strings.evidence_string_to_json(ev_string) + '}\n')
+
+    @staticmethod
+    def exit_on_invalid_evidence_string(ev_string, err, clinvar_record, trait, ensembl_gene_id):
+        if isinstance(err, jsonschema.exceptions.ValidationError):
             print('Error: evidence_string does not validate against schema.')
             # print('ClinVar accession: ' + record.clinvarRecord.accession)
             print(err)
-            print(json.dumps(ev_string))
+            print(evidence_strings.evidence_string_to_json(ev_string))
             print("clinvar record:\n%s" % clinvar_record)
             print("trait:\n%s" % trait)
             print("ensembl gene id: %s" % ensembl_gene_id)
-            sys.exit(1)
-        except efo_term.EFOTerm.IsObsoleteException as err:
+        else:
             print('Error: obsolete EFO term.')
-            print('Term: ' + ev_string.get_disease().efoid)
+            print('Term: ' + str(trait.ontology_id))
             print(err)
-            print(json.dumps(ev_string))
-            sys.exit(1)
+            print(evidence_strings.evidence_string_to_json(ev_string))
+        sys.exit(1)
 
     def write_output(self, dir_out):
         write_string_list_to_file(self.nsv_list, dir_out + '/' + config.NSV_LIST_FILE)
@@ -148,23 +327,53 @@ class Report:
             for clinvar_name in self.unavailable_efo:
                 fdw.write(clinvar_name + "\n")
 
-        with utilities.open_file(dir_out + '/' + config.EVIDENCE_STRINGS_FILE_NAME, 'wt') as fdw:
-            for evidence_string in self.evidence_string_list:
-                fdw.write(json.dumps(evidence_string) + '\n')
+        # When streaming, evidence strings have already been written as they were generated
+        if self.evidence_string_fh is None:
+            with utilities.open_file(dir_out + '/' + config.EVIDENCE_STRINGS_FILE_NAME,
+                                     'wt') as fdw:
+                for evidence_string in self.evidence_string_list:
+                    fdw.write(evidence_strings.evidence_string_to_json(evidence_string) + '\n')
 
         self.write_zooma_file(dir_out)
 
+    def write_metrics(self, dir_out):
+        """Write the counters and stage timings of the run, to compare the performance of runs"""
+        wall_time = self.timings.get_wall_time()
+        metrics = {"created": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+                   "counters": self.counters,
+                   "prefiltered_clin_sig": self.prefiltered_clin_sig,
+                   "records_per_second":
+                       self.counters["record_counter"] / wall_time if wall_time else None,
+                   "evidence_strings_per_second":
+                       self.counters["n_evidence_strings"] / wall_time if wall_time else None}
+        metrics.update(self.timings.to_dict())
+        with utilities.open_file(os.path.join(dir_out, config.METRICS_FILE_NAME), 'wt') as fdw:
+            fdw.write(json_codec.dumps(metrics) + '\n')
+
     def write_zooma_file(self, dir_out):
         """Write zooma records to zooma file"""
+        # When streaming, zooma records have already been written, and the unused trait mappings
+        # are written by write_unused_trait_mappings before the file is closed
+        if self.zooma_fh is not None:
+            return
         with utilities.open_file(os.path.join(dir_out, config.ZOOMA_FILE_NAME), "wt") as zooma_fh:
-
-            zooma_fh.write("STUDY\tBIOENTITY\tPROPERTY_TYPE\tPROPERTY_VALUE\tSEMANTIC_TAG\tANNOTATOR\tANNOTATION_DATE\n")
-            date = strftime("%d/%m/%y %H:%M", gmtime())
+            write_zooma_header(zooma_fh)
             for evidence_record in self.evidence_list:
-                self.write_zooma_record_to_zooma_file(evidence_record, zooma_fh, date)
+                self.write_zooma_record_to_zooma_file(evidence_record, zooma_fh, self.zooma_date)
+            self.write_unused_trait_mappings(zooma_fh)
 
-            for trait_name, ontology_tuple_list in self.trait_mappings.items():
-                self.write_extra_trait_to_zooma_file(ontology_tuple_list, trait_name, date, zooma_fh)
+    def add_evidence_record(self, evidence_record):
+        """Add the zooma record of an evidence string, writing it straight away when streaming"""
+        if self.zooma_fh is not None:
+            self.write_zooma_record_to_zooma_file(evidence_record, self.zooma_fh, self.zooma_date)
+        else:
+            self.evidence_list.append(evidence_record)
+
+    def write_unused_trait_mappings(self, zooma_fh):
+        for trait_name, ontology_tuple_list in self.trait_mappings.items():
+            if trait_name not in self.used_trait_names:
+                self.write_extra_trait_to_zooma_file(ontology_tuple_list, trait_name,
+                                                     self.zooma_date, zooma_fh)
 
     def write_zooma_record_to_zooma_file(self, evidence_record, zooma_fh, date):
         """Write an zooma record to zooma file"""
@@ -199,9 +408,73 @@ class Report:
 
             zooma_fh.write('\t'.join(zooma_output_list) + '\n')
 
-    def remove_trait_mapping(self, trait_name):
-        if trait_name in self.trait_mappings:
-            del self.trait_mappings[trait_name]
+    def add_used_trait_name(self, trait_name):
+        self.used_trait_names.add(trait_name)
+
+    def merge(self, evidence_strings_text, partial_report, quarantine_text=''):
+        """
+        Add the evidence strings and records of a partial report, produced by a worker process for
+        a batch of ClinVar records, to this report. Partial reports must be merged in input order.
+        """
+        with self.timings["output"]:
+            write_evidence_string = getattr(self.evidence_string_fh, "write_evidence_string",
+                                            None)
+            if write_evidence_string is not None and partial_report.output_keys is not None:
+                # The text ends with a newline, so the empty string after it has no output keys
+                for evidence_string_line, output_keys in zip(evidence_strings_text.split('\n'),
+                                                             partial_report.output_keys):
+                    write_evidence_string(evidence_string_line, *output_keys)
+            elif self.evidence_string_fh is not None:
+                self.evidence_string_fh.write(evidence_strings_text)
+            else:
+                self.evidence_string_list.extend(
+                    json_codec.loads(line) for line in evidence_strings_text.splitlines())
+            if quarantine_text:
+                self.quarantine_fh.write(quarantine_text)
+
+        self.unrecognised_clin_sigs.update(partial_report.unrecognised_clin_sigs)
+        self.ensembl_gene_id_uris.update(partial_report.ensembl_gene_id_uris)
+        self.traits.update(partial_report.traits)
+        for allele_origin, count in partial_report.n_unrecognised_allele_origin.items():
+            self.n_unrecognised_allele_origin[allele_origin] += count
+        self.nsv_list.extend(partial_report.nsv_list)
+        for trait_name, count in partial_report.unmapped_traits.items():
+            self.unmapped_traits[trait_name] += count
+        with self.timings["output"]:
+            for evidence_record in partial_report.evidence_list:
+                self.add_evidence_record(evidence_record)
+        self.used_trait_names.update(partial_report.used_trait_names)
+        for counter, count in partial_report.counters.items():
+            self.counters[counter] += count
+        self.timings.merge(partial_report.timings)
+
+    def to_dict(self):
+        """The records of a partial report merged by merge, as a dict which can be stored as json"""
+        return {"unrecognised_clin_sigs": sorted(self.unrecognised_clin_sigs),
+                "ensembl_gene_id_uris": sorted(self.ensembl_gene_id_uris),
+                "traits": sorted(self.traits),
+                "n_unrecognised_allele_origin": self.n_unrecognised_allele_origin,
+                "nsv_list": self.nsv_list,
+                "unmapped_traits": self.unmapped_traits,
+                "evidence_list": self.evidence_list,
+                "used_trait_names": sorted(self.used_trait_names),
+                "counters": {counter: count for counter, count in self.counters.items() if count}}
+
+    @classmethod
+    def from_dict(cls, report_dict):
+        """Partial report with the records of a dict returned by to_dict, to be merged"""
+        report = cls()
+        report.unrecognised_clin_sigs.update(report_dict["unrecognised_clin_sigs"])
+        report.ensembl_gene_id_uris.update(report_dict["ensembl_gene_id_uris"])
+        report.traits.update(report_dict["traits"])
+        report.n_unrecognised_allele_origin.update(report_dict["n_unrecognised_allele_origin"])
+        report.nsv_list.extend(report_dict["nsv_list"])
+        report.unmapped_traits.update(report_dict["unmapped_traits"])
+        # Not in the reports of checkpoints when the zooma file is streamed
+        report.evidence_list.extend(report_dict.get("evidence_list", []))
+        report.used_trait_names.update(report_dict["used_trait_names"])
+        report.counters.update(report_dict["counters"])
+        return report
 
 
     @staticmethod
@@ -220,99 +493,458 @@ class Report:
                 "n_valid_rs_and_nsv": 0,
                 "n_nsv_skipped_clin_sig": 0,
                 "n_nsv_skipped_wrong_ref_alt": 0,
+                "n_prefiltered_clin_sig": 0,
                 "record_counter": 0,
+                "n_evidence_strings": 0,
+                "n_quarantined_evidence_strings": 0,
+                "n_duplicate_evidence_strings": 0,
                 "n_total_clinvar_records": 0}
 
 
 def launch_pipeline(dir_out, allowed_clinical_significance, efo_mapping_file,
-                    snp_2_gene_file, json_file):
+                    snp_2_gene_file, json_file, workers=1, quarantine=False,
+                    validation_workers=0, prefilter_clin_sig=False,
+                    most_severe_consequence=False, incremental=False, previous_run_dir=None,
+                    checkpoints=False, resume=False, shard_by=None, shard_limit=None,
+                    deduplicate=None, consequence_type_index_dir=None):
 
     allowed_clinical_significance = allowed_clinical_significance.split(',') if \
         allowed_clinical_significance else get_default_allowed_clinical_significance()
 
-    mappings = get_mappings(efo_mapping_file, snp_2_gene_file)
-
-    report = clinvar_to_evidence_strings(allowed_clinical_significance, mappings, json_file)
-
+    # The options, and the settings of a run to resume, are all checked before loading the
+    # mappings, which can take minutes
+    manifest_file = os.path.join(dir_out, config.MANIFEST_FILE_NAME) \
+        if incremental or previous_run_dir is not None else None
+    # The evidence strings of the previous run are read while those of this one are written
+    if previous_run_dir is not None and \
+            os.path.abspath(previous_run_dir) == os.path.abspath(dir_out):
+        raise ValueError("The previous run must be in a different directory to the output")
+
+    # Both rely on the position of evidence strings in the single evidence strings file
+    if shard_by is not None and (manifest_file is not None or checkpoints or resume):
+        raise ValueError("Sharded output can not be used in incremental mode or with checkpoints")
+    # Both write the evidence strings of part of the ClinVar records, whose duplicates would then
+    # not be found
+    if deduplicate is not None and (manifest_file is not None or checkpoints or resume):
+        raise ValueError("Duplicate evidence strings can not be removed in incremental mode or "
+                         "with checkpoints")
+    # Both process ClinVar records in batches of their own, where evidence strings are validated
+    # as they are generated
+    if validation_workers > 0 and (manifest_file is not None or checkpoints or resume):
+        raise ValueError("A validation stage can not be used in incremental mode or with "
+                         "checkpoints")
+    if (checkpoints or resume) and manifest_file is not None:
+        raise ValueError("Runs in incremental mode can not be checkpointed")
+    if shard_by is not None:
+        shards.check_shard_settings(shard_by, shard_limit)
+    if deduplicate is not None:
+        deduplication.check_policy(deduplicate)
+
+    checkpointer = None
+    resume_from = None
+    if checkpoints or resume:
+        checkpointer = checkpoint.Checkpointer(
+            os.path.join(dir_out, config.CHECKPOINT_FILE_NAME),
+            checkpoint.get_settings(json_file, efo_mapping_file, snp_2_gene_file,
+                                    allowed_clinical_significance, prefilter_clin_sig, quarantine,
+                                    most_severe_consequence))
+        if resume:
+            resume_from = checkpointer.load()
+            if resume_from is None:
+                print('No checkpoint in ' + dir_out + ', starting from the first ClinVar record')
+
+    timings = stage_timings.StageTimings()
+    with timings["mappings"]:
+        mappings = get_mappings(efo_mapping_file, snp_2_gene_file, consequence_type_index_dir)
+    if most_severe_consequence:
+        mappings.consequence_type_dict = \
+            CT.MostSevereConsequenceTypes(mappings.consequence_type_dict)
+
+    evidence_strings_file = os.path.join(dir_out, config.EVIDENCE_STRINGS_FILE_NAME)
+    quarantine_file = os.path.join(dir_out, config.QUARANTINE_FILE_NAME)
+    zooma_file = os.path.join(dir_out, config.ZOOMA_FILE_NAME)
+    output_mode = 'wt'
+    if resume_from is not None:
+        # Drop any output written after the checkpoint
+        os.truncate(evidence_strings_file, resume_from.evidence_strings_size)
+        os.truncate(zooma_file, resume_from.zooma_size)
+        if quarantine:
+            os.truncate(quarantine_file, resume_from.quarantine_size)
+        output_mode = 'at'
+
+    # Evidence strings and zooma records are streamed to the output files as they are generated,
+    # so memory use does not grow with the size of the ClinVar release
+    with contextlib.ExitStack() as stack:
+        if shard_by is not None:
+            evidence_string_fh = stack.enter_context(shards.ShardedEvidenceStringWriter(
+                dir_out, shard_by, shard_limit))
+        else:
+            evidence_string_fh = stack.enter_context(utilities.open_file(evidence_strings_file,
+                                                                         output_mode))
+        deduplicator = None
+        if deduplicate is not None:
+            deduplicator = stack.enter_context(deduplication.DeduplicatingWriter(
+                evidence_string_fh, deduplicate))
+            evidence_string_fh = deduplicator
+        quarantine_fh = stack.enter_context(utilities.open_file(
+            quarantine_file, output_mode)) if quarantine else None
+        zooma_fh = stack.enter_context(utilities.open_file(zooma_file, output_mode))
+        if resume_from is None:
+            write_zooma_header(zooma_fh)
+        report = clinvar_to_evidence_strings(allowed_clinical_significance, mappings, json_file,
+                                             evidence_string_fh=evidence_string_fh,
+                                             workers=workers, quarantine_fh=quarantine_fh,
+                                             validation_workers=validation_workers,
+                                             prefilter_clin_sig=prefilter_clin_sig,
+                                             manifest_file=manifest_file,
+                                             previous_run_dir=previous_run_dir,
+                                             checkpointer=checkpointer,
+                                             resume_from=resume_from, timings=timings,
+                                             zooma_fh=zooma_fh)
+        with report.timings["output"]:
+            report.write_unused_trait_mappings(zooma_fh)
+
+    if deduplicator is not None:
+        report.counters["n_duplicate_evidence_strings"] = deduplicator.n_duplicates
     output(report, dir_out)
+    if checkpointer is not None:
+        checkpointer.remove()
 
 
 def output(report, dir_out):
-    report.write_output(dir_out)
+    with report.timings["output"]:
+        report.write_output(dir_out)
+    report.write_metrics(dir_out)
     print(report)
+    print(report.timings)
+
+
+def clinvar_to_evidence_strings(allowed_clinical_significance, mappings, json_file,
+                                evidence_string_fh=None, workers=1, quarantine_fh=None,
+                                validation_workers=0, prefilter_clin_sig=False,
+                                manifest_file=None, previous_run_dir=None, checkpointer=None,
+                                resume_from=None, timings=None, zooma_fh=None):
+
+    report = Report(unavailable_efo=mappings.unavailable_efo, trait_mappings=mappings.trait_2_efo,
+                    evidence_string_fh=evidence_string_fh, quarantine_fh=quarantine_fh,
+                    timings=timings, zooma_fh=zooma_fh)
+    report.prefiltered_clin_sig = prefilter_clin_sig
+
+    # Records skipped by the filter never reach process_clinvar_record, so they are only counted
+    # in n_prefiltered_clin_sig
+    clin_sig_filter = cellbase_records.ClinicalSignificanceFilter(
+        allowed_clinical_significance) if prefilter_clin_sig else None
+    cell_recs = cellbase_records.CellbaseRecords(json_file=json_file,
+                                                 clinical_significance_filter=clin_sig_filter)
+
+    if resume_from is not None:
+        cell_recs.start_line = resume_from.n_lines
+        if clin_sig_filter is not None:
+            clin_sig_filter.n_skipped = resume_from.n_skipped_lines
+        for report_dict in resume_from.reports:
+            report.merge('', Report.from_dict(report_dict))
+    if checkpointer is not None:
+        checkpointer.start(resumed=resume_from is not None)
+
+    if manifest_file is not None:
+        incremental_clinvar_to_evidence_strings(allowed_clinical_significance, mappings,
+                                                cell_recs, report, manifest_file,
+                                                previous_run_dir)
+        return report
+
+    # With multiple workers evidence strings are already validated away from the main process
+    if workers > 1:
+        parallel_clinvar_to_evidence_strings(allowed_clinical_significance, mappings, cell_recs,
+                                             report, workers, checkpointer)
+        report.counters["n_prefiltered_clin_sig"] += cell_recs.n_skipped
+        return report
+
+    if checkpointer is not None:
+        batched_clinvar_to_evidence_strings(allowed_clinical_significance, mappings, cell_recs,
+                                            report, checkpointer)
+        report.counters["n_prefiltered_clin_sig"] += cell_recs.n_skipped
+        return report
+
+    if validation_workers > 0:
+        report.validation_stage = validation.ValidationStage(validation_workers)
+
+    try:
+        for cellbase_record in cell_recs.records(report.timings):
+            process_clinvar_record(cellbase_record, allowed_clinical_significance, mappings,
+                                   report)
+        report.counters["n_prefiltered_clin_sig"] += cell_recs.n_skipped
+
+        report.close_validation_stage()
+    finally:
+        # Only still there if the run stopped, including by sys.exit on an invalid evidence
+        # string, and its workers would otherwise be left behind
+        if report.validation_stage is not None:
+            report.validation_stage.terminate()
+            report.validation_stage = None
 
+    return report
 
-def clinvar_to_evidence_strings(allowed_clinical_significance, mappings, json_file):
-
-    report = Report(unavailable_efo=mappings.unavailable_efo, trait_mappings=mappings.trait_2_efo)
-
-    cell_recs = cellbase_records.CellbaseRecords(json_file=json_file)
 
-    for cellbase_record in cell_recs:
-        n_ev_strings_per_record = 0
+def process_clinvar_record(cellbase_record, allowed_clinical_significance, mappings, report):
+    timings = report.timings
+    with timings["clinvar_record"]:
         clinvar_record = clinvar.ClinvarRecord(cellbase_record['clinvarSet'])
+    record_progress = RecordProgress(len(clinvar_record.measures))
 
-        for clinvar_record_measure in clinvar_record.measures:
-            report.counters["record_counter"] += 1
-            report.counters["n_nsvs"] += (clinvar_record_measure.nsv_id is not None)
-            append_nsv(report.nsv_list, clinvar_record_measure)
+    for measure_index, clinvar_record_measure in enumerate(clinvar_record.measures):
+        report.counters["record_counter"] += 1
+        report.counters["n_nsvs"] += (clinvar_record_measure.nsv_id is not None)
+        append_nsv(report.nsv_list, clinvar_record_measure)
 
-            report.counters["n_multiple_allele_origin"] += (len(clinvar_record.allele_origins) > 1)
+        report.counters["n_multiple_allele_origin"] += (len(clinvar_record.allele_origins) > 1)
 
+        with timings["traits"]:
             traits = create_traits(clinvar_record.traits, mappings.trait_2_efo, report)
 
-            converted_allele_origins = convert_allele_origins(clinvar_record.allele_origins)
+        converted_allele_origins = convert_allele_origins(clinvar_record.allele_origins)
 
-            for consequence_type, trait, allele_origin in itertools.product(
-                    get_consequence_types(clinvar_record_measure, mappings.consequence_type_dict),
-                    traits,
-                    converted_allele_origins):
+        with timings["consequence_types"]:
+            consequence_types = get_consequence_types(clinvar_record_measure,
+                                                      mappings.consequence_type_dict)
 
-                if skip_record(clinvar_record, clinvar_record_measure, consequence_type, allele_origin,
-                               allowed_clinical_significance, report):
-                    continue
+        for consequence_type, trait, allele_origin in itertools.product(
+                consequence_types,
+                traits,
+                converted_allele_origins):
 
+            if skip_record(clinvar_record, clinvar_record_measure, consequence_type, allele_origin,
+                           allowed_clinical_significance, report):
+                continue
+
+            with timings["evidence_strings"]:
                 if allele_origin == 'germline':
-                    evidence_string = evidence_strings.CTTVGeneticsEvidenceString(clinvar_record,
-                                                                                  clinvar_record_measure,
-                                                                                  report,
-                                                                                  trait,
-                                                                                  consequence_type)
+                    evidence_string = evidence_strings.CompactGeneticsEvidenceString(
+                        clinvar_record, clinvar_record_measure, report, trait, consequence_type)
                 elif allele_origin == 'somatic':
-                    evidence_string = evidence_strings.CTTVSomaticEvidenceString(clinvar_record,
-                                                                                 clinvar_record_measure,
-                                                                                 report,
-                                                                                 trait,
-                                                                                 consequence_type)
-                report.add_evidence_string(evidence_string, clinvar_record, trait,
-                                           consequence_type.ensembl_gene_id)
-                report.evidence_list.append([clinvar_record.accession,
-                                             clinvar_record_measure.rs_id,
-                                             trait.clinvar_name,
-                                             trait.ontology_id])
-                report.counters["n_valid_rs_and_nsv"] += (clinvar_record_measure.nsv_id is not None)
-                report.traits.add(trait.ontology_id)
-                report.remove_trait_mapping(trait.clinvar_name)
-                report.ensembl_gene_id_uris.add(
-                    evidence_strings.get_ensembl_gene_id_uri(consequence_type.ensembl_gene_id))
-
-                n_ev_strings_per_record += 1
-
-            if n_ev_strings_per_record > 0:
-                report.counters["n_processed_clinvar_records"] += 1
-                if n_ev_strings_per_record > 1:
-                    report.counters["n_multiple_evidence_strings"] += 1
+                    evidence_string = evidence_strings.CompactSomaticEvidenceString(
+                        clinvar_record, clinvar_record_measure, report, trait, consequence_type)
+            # Only added to the report if the evidence string is stored, and not quarantined
+            details = EvidenceStringDetails(
+                [clinvar_record.accession, clinvar_record_measure.rs_id, trait.clinvar_name,
+                 trait.ontology_id],
+                trait, consequence_type.ensembl_gene_id, clinvar_record_measure.nsv_id is not None,
+                record_progress, measure_index)
+            if report.add_evidence_string(evidence_string, clinvar_record, trait,
+                                          consequence_type.ensembl_gene_id, details):
+                report.add_evidence_string_details(details)
+
+    record_progress.finished = True
+    report.add_record_progress(record_progress)
+
+
+# Set in each worker process by _init_worker, so the mappings are only sent to a worker once
+_worker_args = SimpleNamespace()
+
+
+def _init_worker(allowed_clinical_significance, mappings, quarantine, clin_sig_filter,
+                 keep_output_keys):
+    _worker_args.allowed_clinical_significance = allowed_clinical_significance
+    _worker_args.keep_output_keys = keep_output_keys
+    _worker_args.clin_sig_filter = clin_sig_filter
+    _worker_args.mappings = mappings
+    _worker_args.quarantine = quarantine
+
+
+def process_clinvar_records_separately(cellbase_records, allowed_clinical_significance,
+                                      mappings, quarantine, clin_sig_filter=None, timings=None,
+                                      keep_output_keys=False):
+    """
+    Generates the evidence strings for ClinVar records into a partial Report of their own, to be
+    merged into the report of the run, returning them already serialised along with the partial
+    report and any evidence strings which failed validation. timings, if given, are those of the
+    partial report, so that the time spent decoding cellbase_records can already be in them. If
+    keep_output_keys, the partial report keeps the output keys of the evidence strings.
+    """
+    evidence_string_fh = io.StringIO()
+    quarantine_fh = io.StringIO() if quarantine else None
+    partial_report = Report(evidence_string_fh=evidence_string_fh, quarantine_fh=quarantine_fh,
+                            timings=timings)
+    if keep_output_keys:
+        partial_report.output_keys = []
+    for cellbase_record in cellbase_records:
+        if clin_sig_filter is not None and not clin_sig_filter.record_passes(cellbase_record):
+            partial_report.counters["n_prefiltered_clin_sig"] += 1
+            continue
+        process_clinvar_record(cellbase_record, allowed_clinical_significance, mappings,
+                               partial_report)
+    # File handles can not be sent back to the main process
+    partial_report.evidence_string_fh = None
+    partial_report.quarantine_fh = None
+    quarantine_text = quarantine_fh.getvalue() if quarantine_fh is not None else ''
+    return evidence_string_fh.getvalue(), partial_report, quarantine_text
+
+
+def _process_record_batch(lines):
+    """Runs in a worker process. Processes a batch of ClinVar json lines separately."""
+    try:
+        # The lines were only checked undecoded by the main process
+        timings = stage_timings.StageTimings()
+        return process_clinvar_records_separately(
+            decode_lines(lines, timings), _worker_args.allowed_clinical_significance,
+            _worker_args.mappings, _worker_args.quarantine, _worker_args.clin_sig_filter, timings,
+            _worker_args.keep_output_keys)
+    except SystemExit as err:
+        # sys.exit in a pool worker would kill the worker and leave the pool waiting forever
+        raise RuntimeError("Worker stopped while processing a batch of ClinVar records") from err
+
+
+def decode_lines(lines, timings):
+    """Yields the ClinVar record of each json line, adding the time spent to the decode stage"""
+    decode_stage = timings["decode"]
+    for line in lines:
+        with decode_stage:
+            cellbase_record = json_codec.loads(line)
+        yield cellbase_record
+
+
+def merge_batch(report, batch_output, n_records, position, checkpointer=None):
+    """
+    Merge the output of process_clinvar_records_separately for a batch of n_records ClinVar
+    records into report, and add it to the checkpoints of the run, if any. position is that of
+    the CellbaseRecords at the end of the batch.
+    """
+    report.merge(*batch_output)
+    if checkpointer is not None:
+        checkpointer.add(batch_output[1], n_records, position, report)
+
+
+def batched_clinvar_to_evidence_strings(allowed_clinical_significance, mappings, cell_recs,
+                                        report, checkpointer):
+    """Processes batches of ClinVar records separately, so that the run can be checkpointed"""
+    # Decoded records are checked against a filter of their own, as they are in worker processes,
+    # so they are only counted in the partial reports
+    clin_sig_filter = None
+    if cell_recs.clinical_significance_filter is not None:
+        clin_sig_filter = cellbase_records.ClinicalSignificanceFilter(allowed_clinical_significance)
+    for lines in cell_recs.raw_record_batches(config.WORKER_BATCH_SIZE, report.timings):
+        timings = stage_timings.StageTimings()
+        batch_output = process_clinvar_records_separately(
+            decode_lines(lines, timings), allowed_clinical_significance, mappings,
+            report.quarantine_fh is not None, clin_sig_filter, timings,
+            hasattr(report.evidence_string_fh, "write_evidence_string"))
+        merge_batch(report, batch_output, len(lines), cell_recs.position, checkpointer)
+
+
+def parallel_clinvar_to_evidence_strings(allowed_clinical_significance, mappings, cell_recs,
+                                         report, workers, checkpointer=None):
+    """
+    Distributes batches of ClinVar records across a pool of worker processes and merges their
+    partial reports into report in input order, so the output is the same as that of a
+    single-process run.
+    """
+    # fork, so the workers share the hash seed of this process and set iteration order (and so
+    # the order of references within evidence strings) is the same as in a single-process run
+    context = multiprocessing.get_context('fork')
+    pending = deque()
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(allowed_clinical_significance, mappings,
+                                report.quarantine_fh is not None,
+                                cell_recs.clinical_significance_filter,
+                                hasattr(report.evidence_string_fh,
+                                        "write_evidence_string"))) as pool:
+        for lines in cell_recs.raw_record_batches(config.WORKER_BATCH_SIZE, report.timings):
+            pending.append((pool.apply_async(_process_record_batch, (lines,)), len(lines),
+                            cell_recs.position))
+            # Bound the number of batches in flight so memory use stays flat
+            if len(pending) >= 2 * workers:
+                batch_result, n_records, position = pending.popleft()
+                merge_batch(report, batch_result.get(), n_records, position, checkpointer)
+        while pending:
+            batch_result, n_records, position = pending.popleft()
+            merge_batch(report, batch_result.get(), n_records, position, checkpointer)
+
+
+def incremental_clinvar_to_evidence_strings(allowed_clinical_significance, mappings, cell_recs,
+                                            report, manifest_file, previous_run_dir=None):
+    """
+    Generates the evidence strings of each ClinVar record separately, writing the manifest of the
+    run to manifest_file. The evidence strings and report records of a ClinVar record which, along
+    with the mappings used for it, is the same as in the previous run in previous_run_dir are
+    taken from that run instead. Evidence strings are in the same order as in a full run.
+    """
+    if report.evidence_string_fh is None:
+        raise ValueError("Evidence strings must be written to a file to be reused by later runs")
+    run_key = incremental.get_run_key(allowed_clinical_significance)
+    previous_run = incremental.PreviousRun.open(previous_run_dir, run_key) \
+        if previous_run_dir is not None else None
+    clin_sig_filter = cell_recs.clinical_significance_filter
+    n_records = n_reused_records = 0
+    # Position in the evidence strings file of the evidence strings of the next record
+    offset = 0
+
+    with incremental.ManifestWriter(manifest_file, run_key) as manifest:
+        for line in report.timings.iterate("read", cell_recs.raw_records()):
+            line = line.rstrip()
+            with report.timings["decode"]:
+                cellbase_record = json_codec.loads(line)
+            if clin_sig_filter is not None and not clin_sig_filter.record_passes(cellbase_record):
+                continue
+            n_records += 1
+            clinvar_record = clinvar.ClinvarRecord(cellbase_record['clinvarSet'])
+            record_hash = incremental.hash_text(line)
+            mappings_hash = get_mappings_hash(clinvar_record, mappings)
+
+            entry = previous_run.get(clinvar_record.accession) \
+                if previous_run is not None else None
+            if entry is not None and entry.record_hash == record_hash and \
+                    entry.mappings_hash == mappings_hash:
+                n_reused_records += 1
+                evidence_strings_text = previous_run.read_evidence_strings(entry)
+                report_json = entry.report
+                report.merge(evidence_strings_text, Report.from_dict(json_codec.loads(report_json)))
+            else:
+                evidence_strings_text, partial_report, quarantine_text = \
+                    process_clinvar_records_separately([cellbase_record],
+                                                       allowed_clinical_significance, mappings,
+                                                       report.quarantine_fh is not None)
+                report.merge(evidence_strings_text, partial_report, quarantine_text)
+                # Records with invalid evidence strings are processed again in every run
+                if partial_report.counters["n_quarantined_evidence_strings"]:
+                    offset += len(evidence_strings_text.encode())
+                    continue
+                report_json = json_codec.dumps(partial_report.to_dict())
 
-    return report
+            length = len(evidence_strings_text.encode())
+            manifest.add(clinvar_record.accession, incremental.ManifestEntry(
+                record_hash, mappings_hash, offset, length, report_json))
+            offset += length
+
+    if previous_run is not None:
+        previous_run.close()
+    report.counters["n_prefiltered_clin_sig"] += cell_recs.n_skipped
+    print("{} of {} ClinVar records reused from the previous run".format(n_reused_records,
+                                                                        n_records))
+
+
+def write_zooma_header(zooma_fh):
+    zooma_fh.write("STUDY\tBIOENTITY\tPROPERTY_TYPE\tPROPERTY_VALUE\tSEMANTIC_TAG\tANNOTATOR\t"
+                   "ANNOTATION_DATE\n")
+
+
+def get_mappings_hash(clinvar_record, mappings):
+    """Hash of the trait mappings and consequence types used for a ClinVar record"""
+    trait_mappings = [trait.map_efo(mappings.trait_2_efo, name_list)
+                      for name_list in clinvar_record.traits]
+    consequence_types = [
+        [None if consequence_type is None else
+         (consequence_type.ensembl_gene_id, consequence_type.so_term.so_name)
+         for consequence_type in get_consequence_types(measure, mappings.consequence_type_dict)]
+        for measure in clinvar_record.measures]
+    return incremental.hash_text(json_codec.dumps([trait_mappings, consequence_types]))
 
 
-def get_mappings(efo_mapping_file, snp_2_gene_file):
+def get_mappings(efo_mapping_file, snp_2_gene_file, consequence_type_index_dir=None):
     mappings = SimpleNamespace()
     mappings.trait_2_efo, mappings.unavailable_efo = \
         load_efo_mapping(efo_mapping_file)
 
     mappings.consequence_type_dict = \
-        CT.process_consequence_type_file(snp_2_gene_file)
+        CT.process_consequence_type_file(snp_2_gene_file, consequence_type_index_dir)
 
     return mappings
 
@@ -340,21 +972,18 @@ def get_consequence_types(clinvar_record_measure, consequence_type_dict):
     coord_id = "{}:{}-{}:1/{}".format(clinvar_record_measure.chr, clinvar_record_measure.start,
                                       clinvar_record_measure.stop, alt_str)
 
-    consequence_type_dict_id = None
-
-    if clinvar_record_measure.rs_id is not None and \
-                    clinvar_record_measure.rs_id in consequence_type_dict:
-        consequence_type_dict_id = clinvar_record_measure.rs_id
-    elif clinvar_record_measure.nsv_id is not None and \
-                    clinvar_record_measure.nsv_id in consequence_type_dict:
-        consequence_type_dict_id = clinvar_record_measure.nsv_id
-    elif coord_id in consequence_type_dict:
-        consequence_type_dict_id = coord_id
-    elif clinvar_record_measure.clinvar_record.accession in consequence_type_dict:
-        consequence_type_dict_id = clinvar_record_measure.clinvar_record.accession  # todo change this depending upon OT gene mapping file
-
-    return consequence_type_dict[consequence_type_dict_id] \
-        if consequence_type_dict_id is not None else [None]
+    # The ids are tried in this order, each looked up once as with the index a lookup is a query.
+    # todo change the accession depending upon OT gene mapping file
+    consequence_type_dict_ids = (clinvar_record_measure.rs_id, clinvar_record_measure.nsv_id,
+                                 coord_id, clinvar_record_measure.clinvar_record.accession)
+    for consequence_type_dict_id in consequence_type_dict_ids:
+        if consequence_type_dict_id is None:
+            continue
+        consequence_types = consequence_type_dict.get(consequence_type_dict_id)
+        if consequence_types is not None:
+            return consequence_types
+
+    return [None]
 
 
 def create_traits(clinvar_traits, trait_2_efo_dict, report):
@@ -4,6 +4,11 @@ LOCAL_SCHEMA = "resources/schema_local"
 SPARQLEP = ""
 SPARQL_USER = ""
 SPARQL_PASSWORD = ""
+# Obsolete and available EFO terms are queried from SPARQLEP and saved here (relative to the
+# package, unless an absolute path), to be used for this many seconds before being queried again.
+# Refresh it with bin/refresh_efo_terms_snapshot.py
+EFO_TERMS_SNAPSHOT = "resources/efo_terms_snapshot.json"
+EFO_TERMS_SNAPSHOT_TTL = 7 * 24 * 60 * 60
 
 
 #########################################
@@ -13,6 +18,28 @@ SPARQL_PASSWORD = ""
 BATCH_SIZE = 200
 HOST = 'wwwdev.ebi.ac.uk'
 
+# number of ClinVar records sent to a worker process at a time when running with --workers
+WORKER_BATCH_SIZE = 500
+# number of ClinVar json lines read at a time by a single process, each batch being timed as a
+# whole
+READ_BATCH_SIZE = 100
+# number of evidence strings sent to a validation process at a time with --validationWorkers
+VALIDATION_BATCH_SIZE = 500
+
+# gzipped input files are decompressed by the first of these which is installed, running as a
+# separate process, or by the gzip module if none is or PARALLEL_DECOMPRESSION is False
+PARALLEL_DECOMPRESSION = True
+DECOMPRESSORS = [["pigz", "-dc"], ["igzip", "-dc"], ["gzip", "-dc"]]
+# size in bytes of the buffer for reading the output of the decompressor
+DECOMPRESSION_BUFFER_SIZE = 1024 * 1024
+
+# the snp2gene file is loaded into a SQLite index, built once in this directory (by default a
+# directory in the system's temporary directory, or that given by --consequenceTypeIndexDir) and
+# queried for each ClinVar record, rather than into memory. Building the index of a changed file
+# removes the old one.
+CONSEQUENCE_TYPE_INDEX = True
+CONSEQUENCE_TYPE_INDEX_DIR = None
+
 # output settings
 EVIDENCE_STRINGS_FILE_NAME = 'evidence_strings.json'
 EVIDENCE_RECORDS_FILE_NAME = 'evidence_records.tsv'
@@ -20,6 +47,28 @@ ZOOMA_FILE_NAME = 'eva_clinvar.txt'
 UNMAPPED_TRAITS_FILE_NAME = 'unmappedTraits.tsv'
 UNAVAILABLE_EFO_FILE_NAME = 'unavailableefo.tsv'
 NSV_LIST_FILE = 'nsvlist.txt'
+QUARANTINE_FILE_NAME = 'invalid_evidence_strings.json'
+# manifest of the ClinVar records of a run, to reuse their evidence strings in the next run
+MANIFEST_FILE_NAME = 'manifest.sqlite'
+# checkpoints of a run, written every CHECKPOINT_INTERVAL ClinVar records, to resume it if stopped
+CHECKPOINT_FILE_NAME = 'checkpoint.json'
+CHECKPOINT_INTERVAL = 10000
+# with --shardBy, evidence strings are written to gzipped shards, listed with their checksums in
+# the shard manifest. Shards are compressed in chunks of SHARD_CHUNK_SIZE bytes
+SHARD_FILE_NAME = 'evidence_strings.{:05d}.json.gz'
+SHARD_MANIFEST_FILE_NAME = 'evidence_strings_manifest.json'
+SHARD_COMPRESSION_LEVEL = 6
+SHARD_CHUNK_SIZE = 1024 * 1024
+# Every shard is open at once when sharding by hash, each with a thread, a gzip stream and up to
+# three chunks, so there can be no more than SHARD_MAX_HASH_SHARDS of them
+SHARD_MAX_HASH_SHARDS = 64
+# with --deduplicate, the hashes of up to DEDUPLICATION_MEMORY_KEYS associations are kept in
+# memory, and any more in a temporary directory in DEDUPLICATION_TEMP_DIR (by default the system's
+# temporary directory), along with the evidence strings when they can't be written straight away
+DEDUPLICATION_MEMORY_KEYS = 5000000
+DEDUPLICATION_TEMP_DIR = None
+# counters and time spent in each stage of a run, to compare the performance of releases
+METRICS_FILE_NAME = 'metrics.json'
 
 ######
 
@@ -31,5 +80,8 @@ GEN_EV_STRING_JSON = "resources/CTTVGeneticsEvidenceString.json"
 SOM_EV_STRING_JSON = "resources/CTTVSomaticEvidenceString.json"
 GEN_SCHEMA_FILE = LOCAL_SCHEMA + "/src/genetics.json"
 SOM_SCHEMA_FILE = LOCAL_SCHEMA + "/src/literature_curated.json"
+# Validate evidence strings with code generated from the schema, cached here
+COMPILE_SCHEMA = True
+COMPILED_SCHEMA_DIR = LOCAL_SCHEMA + "/compiled"
 
 #############
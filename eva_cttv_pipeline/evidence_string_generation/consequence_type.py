@@ -1,16 +1,26 @@
-from collections import defaultdict
-
+import collections.abc
+import hashlib
+import os
+import re
+import sqlite3
+import tempfile
+from collections import defaultdict, OrderedDict
+from urllib.request import pathname2url
+
+from eva_cttv_pipeline.evidence_string_generation import config
 from eva_cttv_pipeline.evidence_string_generation import utilities
 
 
+# Increase when the layout of the index changes, so that previously built indexes are not used
+INDEX_VERSION = 2
+
+
 def process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term):
     consequence_type_dict[variant_id].append(ConsequenceType(ensembl_gene_id, SoTerm(so_term)))
 
 
-def process_consequence_type_file_tsv(snp_2_gene_filepath):
-    consequence_type_dict = defaultdict(list)
-    one_rs_multiple_genes = set()
-
+def iter_consequence_type_file_tsv(snp_2_gene_filepath):
+    """Yields the variant id, ensembl gene id and SO term name of each line of a snp2gene file"""
     with utilities.open_file(snp_2_gene_filepath, "rt") as snp_2_gene_file:
         for line in snp_2_gene_file:
             line = line.rstrip()
@@ -19,21 +29,180 @@ def process_consequence_type_file_tsv(snp_2_gene_filepath):
             if len(line_list) < 6:
                 continue
 
-            variant_id = line_list[0]
-            ensembl_gene_id = line_list[2]
-            so_term = line_list[4]
+            yield line_list[0], line_list[2], line_list[4]
+
+
+def process_consequence_type_file_tsv(snp_2_gene_filepath):
+    consequence_type_dict = defaultdict(list)
+    one_rs_multiple_genes = set()
 
-            process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term)
+    for variant_id, ensembl_gene_id, so_term in \
+            iter_consequence_type_file_tsv(snp_2_gene_filepath):
+        process_gene(consequence_type_dict, variant_id, ensembl_gene_id, so_term)
 
     return consequence_type_dict, one_rs_multiple_genes
 
 
-def process_consequence_type_file(snp_2_gene_file):
+def get_consequence_type_index_path(snp_2_gene_filepath, index_dir):
+    """
+    Path of the index of a snp2gene file. It is named after the path of the file, followed by its
+    size and modification time, so a changed file gets a new index.
+    """
+    stat = os.stat(snp_2_gene_filepath)
+    key = "{} {} {}".format(INDEX_VERSION, stat.st_size, stat.st_mtime_ns)
+    return os.path.join(index_dir, "{}_{}.sqlite".format(
+        get_consequence_type_index_name(snp_2_gene_filepath),
+        hashlib.sha256(key.encode()).hexdigest()[:16]))
+
+
+def get_consequence_type_index_name(snp_2_gene_filepath):
+    """
+    Prefix of the names of the indexes of a snp2gene file: its name and a hash of its absolute
+    path, so files of the same name in different directories never share indexes
+    """
+    path_hash = hashlib.sha256(os.path.abspath(snp_2_gene_filepath).encode()).hexdigest()[:16]
+    return "{}_{}".format(os.path.basename(snp_2_gene_filepath).split(".")[0], path_hash)
+
+
+def remove_old_consequence_type_indexes(snp_2_gene_filepath, index_path):
+    """
+    Remove the indexes in the directory of index_path built for earlier versions of the same
+    snp2gene file, or by an earlier INDEX_VERSION, so that they don't pile up there.
+    """
+    index_dir = os.path.dirname(index_path) or "."
+    index_name_pattern = re.compile(r"^{}_[0-9a-f]{{16}}\.sqlite$".format(
+        re.escape(get_consequence_type_index_name(snp_2_gene_filepath))))
+    for file_name in os.listdir(index_dir):
+        old_index_path = os.path.join(index_dir, file_name)
+        if index_name_pattern.match(file_name) and \
+                os.path.abspath(old_index_path) != os.path.abspath(index_path):
+            try:
+                os.remove(old_index_path)
+            except FileNotFoundError:
+                # Removed by another process at the same time
+                pass
+
+
+def build_consequence_type_index(snp_2_gene_filepath, index_path):
+    """Write the consequence types of a snp2gene file to a SQLite database indexed by variant id"""
+    os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+    # Built in a temporary file first so other processes never open a partial index
+    temp_path = "{}.{}.tmp".format(index_path, os.getpid())
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+    try:
+        connection = sqlite3.connect(temp_path)
+        try:
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.execute("CREATE TABLE consequence_type "
+                               "(variant_id TEXT, ensembl_gene_id TEXT, so_term TEXT)")
+            connection.executemany("INSERT INTO consequence_type VALUES (?, ?, ?)",
+                                   iter_consequence_type_file_tsv(snp_2_gene_filepath))
+            connection.execute("CREATE INDEX consequence_type_variant_id "
+                               "ON consequence_type (variant_id)")
+            # Counted once here, so opening the index doesn't go through all of it
+            connection.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value)")
+            connection.execute("INSERT INTO metadata SELECT 'n_variants', "
+                               "count(DISTINCT variant_id) FROM consequence_type")
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(temp_path, index_path)
+    finally:
+        # Left behind only if the build failed
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class ConsequenceTypeStore(collections.abc.Mapping):
+
+    """
+    Read-only mapping of variant ids (rs ids, nsv ids, coordinate ids and ClinVar accessions) to
+    lists of ConsequenceType, as returned by process_consequence_type_file_tsv, looked up in an
+    index built by build_consequence_type_index instead of being held in memory.
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        self._connection = None
+        self._connection_pid = None
+        self._len = None
+
+    def _get_connection(self):
+        # A SQLite connection must not be used across a fork, so each worker process opens its own
+        if self._connection_pid != os.getpid():
+            self._connection = sqlite3.connect(
+                "file:{}?mode=ro".format(pathname2url(os.path.abspath(self.index_path))),
+                uri=True)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_connection"] = state["_connection_pid"] = None
+        return state
+
+    def get(self, variant_id, default=None):
+        # A single query, where `in` followed by [] would make two
+        rows = self._get_connection().execute(
+            "SELECT ensembl_gene_id, so_term FROM consequence_type WHERE variant_id = ? "
+            "ORDER BY rowid", (variant_id,)).fetchall()
+        if not rows:
+            return default
+        return [ConsequenceType(ensembl_gene_id, SoTerm(so_term))
+                for ensembl_gene_id, so_term in rows]
+
+    def __getitem__(self, variant_id):
+        consequence_types = self.get(variant_id)
+        if consequence_types is None:
+            raise KeyError(variant_id)
+        return consequence_types
+
+    def __contains__(self, variant_id):
+        return self._get_connection().execute(
+            "SELECT 1 FROM consequence_type WHERE variant_id = ? LIMIT 1",
+            (variant_id,)).fetchone() is not None
+
+    def __iter__(self):
+        rows = self._get_connection().execute(
+            "SELECT variant_id FROM consequence_type GROUP BY variant_id ORDER BY min(rowid)")
+        return (variant_id for variant_id, in rows)
+
+    def __len__(self):
+        if self._len is None:
+            self._len = self._get_connection().execute(
+                "SELECT value FROM metadata WHERE key = 'n_variants'").fetchone()[0]
+        return self._len
+
+
+def open_consequence_type_store(snp_2_gene_filepath, index_dir=None):
+    """
+    Return a ConsequenceTypeStore for a snp2gene file, building its index in index_dir (by default
+    config.CONSEQUENCE_TYPE_INDEX_DIR, or the temporary directory) if it hasn't been already.
+    Once built, the old indexes of the file are removed.
+    """
+    if index_dir is None:
+        index_dir = config.CONSEQUENCE_TYPE_INDEX_DIR or \
+            os.path.join(tempfile.gettempdir(), "eva_cttv_pipeline")
+    index_path = get_consequence_type_index_path(snp_2_gene_filepath, index_dir)
+    if not os.path.exists(index_path):
+        print('Building index of rs->ENSG/SOterms mappings in ' + index_path)
+        build_consequence_type_index(snp_2_gene_filepath, index_path)
+        remove_old_consequence_type_indexes(snp_2_gene_filepath, index_path)
+    return ConsequenceTypeStore(index_path)
+
+
+def process_consequence_type_file(snp_2_gene_file, index_dir=None):
 
     print('Loading mapping rs->ENSG/SOterms')
 
-    consequence_type_dict, one_rs_multiple_genes = \
-        process_consequence_type_file_tsv(snp_2_gene_file)
+    if config.CONSEQUENCE_TYPE_INDEX:
+        consequence_type_dict = open_consequence_type_store(snp_2_gene_file, index_dir)
+        one_rs_multiple_genes = set()
+    else:
+        consequence_type_dict, one_rs_multiple_genes = \
+            process_consequence_type_file_tsv(snp_2_gene_file)
 
     print(str(len(consequence_type_dict)) + ' rs->ENSG/SOterms mappings loaded')
     print(str(len(one_rs_multiple_genes)) + ' rsIds with multiple gene associations')
@@ -137,28 +306,29 @@ class SoTerm(object):
                             'feature_truncation',
                             'intergenic_variant']
 
-    def __init__(self, so_name):
-        self.so_name = so_name
-        if so_name in SoTerm.so_accession_name_dict:
-            self._so_accession = SoTerm.so_accession_name_dict[so_name]
-        else:
-            self._so_accession = None
-
-    @property
-    def accession(self):
-        if self._so_accession is not None:
-            accession_number_str = str(self._so_accession)
-            return 'SO:' + accession_number_str.rjust(7, '0')
-        else:
-            return None
-
-    @property
-    def rank(self):
-        # If So name not in Ensembl's ranked list, return the least severe rank
-        if self.so_name not in SoTerm.ranked_so_names_list:
-            return len(SoTerm.ranked_so_names_list)
-        else:
-            return SoTerm.ranked_so_names_list.index(self.so_name)
+    # Rank of each SO name in Ensembl's list, from the most severe
+    so_name_rank = {so_name: rank for rank, so_name in enumerate(ranked_so_names_list)}
+
+    # There is a single instance for each SO name, its accession and rank computed when created
+    _instances = {}
+
+    def __new__(cls, so_name):
+        so_term = cls._instances.get(so_name)
+        if so_term is None:
+            so_term = super().__new__(cls)
+            so_term.so_name = so_name
+            so_term._so_accession = cls.so_accession_name_dict.get(so_name)
+            if so_term._so_accession is not None:
+                so_term.accession = 'SO:' + str(so_term._so_accession).rjust(7, '0')
+            else:
+                so_term.accession = None
+            # If So name not in Ensembl's ranked list, it has the least severe rank
+            so_term.rank = cls.so_name_rank.get(so_name, len(cls.ranked_so_names_list))
+            cls._instances[so_name] = so_term
+        return so_term
+
+    def __getnewargs__(self):
+        return self.so_name,
 
     def __eq__(self, other):
         return self.accession == other.accession
@@ -167,6 +337,49 @@ class SoTerm(object):
         return hash(self._so_accession)
 
 
+def most_severe_consequence_types(consequence_types):
+    """
+    Keep only the most severe consequence type of each gene in a list of consequence types, in the
+    order the genes first appear. Of equally severe ones, the first is kept.
+    """
+    gene_consequence_types = OrderedDict()
+    for consequence_type in consequence_types:
+        most_severe = gene_consequence_types.get(consequence_type.ensembl_gene_id)
+        if most_severe is None or consequence_type.so_term.rank < most_severe.so_term.rank:
+            gene_consequence_types[consequence_type.ensembl_gene_id] = consequence_type
+    return list(gene_consequence_types.values())
+
+
+class MostSevereConsequenceTypes(collections.abc.Mapping):
+
+    """
+    Read-only view of a mapping of variant ids to lists of ConsequenceType, such as the one
+    returned by process_consequence_type_file, with only the most severe consequence type of each
+    gene in each list.
+    """
+
+    def __init__(self, consequence_type_dict):
+        self.consequence_type_dict = consequence_type_dict
+
+    def get(self, variant_id, default=None):
+        consequence_types = self.consequence_type_dict.get(variant_id)
+        if consequence_types is None:
+            return default
+        return most_severe_consequence_types(consequence_types)
+
+    def __getitem__(self, variant_id):
+        return most_severe_consequence_types(self.consequence_type_dict[variant_id])
+
+    def __contains__(self, variant_id):
+        return variant_id in self.consequence_type_dict
+
+    def __iter__(self):
+        return iter(self.consequence_type_dict)
+
+    def __len__(self):
+        return len(self.consequence_type_dict)
+
+
 class ConsequenceType:
 
     """
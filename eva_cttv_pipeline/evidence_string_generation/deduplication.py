@@ -0,0 +1,224 @@
+"""
+Removal of evidence strings with the same unique_association_fields as another one, as an output
+stage between the report and the evidence strings file (or shards). Duplicates come from the
+several consequence types of a variant on the same gene, or from several measures of a ClinVar
+record, so the same association can be in several evidence strings. The policy decides which of
+them is kept:
+
+* "first", the first one, so evidence strings are still written as they are generated;
+* "last", the last one;
+* "most_severe", that with the most severe functional consequence, or of equally severe ones the
+  first.
+
+Associations are told apart by a 128 bit hash of their unique_association_fields, so that
+different associations having the same hash is not a concern even for billions of evidence
+strings. The association key and functional consequence of each evidence string are given by the
+Report along with it, through write_evidence_string, so evidence strings aren't parsed again here.
+With "first", the hashes of the associations seen are kept in memory, up to
+config.DEDUPLICATION_MEMORY_KEYS of them, beyond which they are moved to a SQLite table on disk.
+With the other policies, evidence strings are written to a temporary file and the one to keep of
+each association is found in a SQLite table, so that memory use doesn't grow with the number of
+evidence strings. The evidence strings kept are written once all have been seen, in the order
+they were generated.
+"""
+
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import consequence_type as CT
+from eva_cttv_pipeline.evidence_string_generation import evidence_strings
+
+
+POLICIES = ("first", "last", "most_severe")
+
+# Rank of the functional consequences of evidence strings, the most severe first
+FUNCTIONAL_CONSEQUENCE_RANK = {
+    evidence_strings.get_functional_consequence(CT.SoTerm(so_name)): CT.SoTerm(so_name).rank
+    for so_name in CT.SoTerm.ranked_so_names_list}
+
+
+def get_association_hash(association_key):
+    """Hash of the association key of an evidence string, as 16 bytes"""
+    return hashlib.md5(association_key.encode()).digest()
+
+
+def get_functional_consequence_rank(functional_consequence):
+    return FUNCTIONAL_CONSEQUENCE_RANK.get(functional_consequence,
+                                           len(CT.SoTerm.ranked_so_names_list))
+
+
+def check_policy(policy):
+    """Raise ValueError if policy isn't one of POLICIES"""
+    if policy not in POLICIES:
+        raise ValueError("Duplicate evidence strings can only be removed keeping one of: " +
+                         ", ".join(POLICIES))
+
+
+class AssociationHashes:
+
+    """
+    Set of association hashes, kept in memory up to config.DEDUPLICATION_MEMORY_KEYS and in a
+    SQLite table in temp_dir beyond that
+    """
+
+    def __init__(self, temp_dir):
+        self.temp_dir = temp_dir
+        self.hashes = set()
+        self.connection = None
+
+    def add(self, association_hash):
+        """Add association_hash to the set, returning whether it wasn't already there"""
+        if association_hash in self.hashes:
+            return False
+        if self.connection is not None and self.connection.execute(
+                "SELECT 1 FROM association WHERE hash = ?", (association_hash,)).fetchone():
+            return False
+        self.hashes.add(association_hash)
+        if len(self.hashes) >= config.DEDUPLICATION_MEMORY_KEYS:
+            self._spill()
+        return True
+
+    def _spill(self):
+        if self.connection is None:
+            self.connection = sqlite3.connect(os.path.join(self.temp_dir, "associations.sqlite"))
+            self.connection.execute("PRAGMA journal_mode = OFF")
+            self.connection.execute("PRAGMA synchronous = OFF")
+            self.connection.execute("CREATE TABLE association (hash BLOB PRIMARY KEY) "
+                                    "WITHOUT ROWID")
+        self.connection.executemany("INSERT INTO association VALUES (?)",
+                                    ((association_hash,) for association_hash in self.hashes))
+        self.hashes.clear()
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+class DeduplicatingWriter:
+
+    """
+    Writes evidence strings to evidence_string_fh without duplicates, as a file handle to which
+    the serialised evidence strings are written a line each, or, without having to parse them,
+    through write_evidence_string along with their keys. evidence_string_fh must be closed
+    after this, which only writes the evidence strings kept by policies other than "first" when
+    closed. n_duplicates is the number of evidence strings removed, once closed.
+    """
+
+    def __init__(self, evidence_string_fh, policy="first"):
+        check_policy(policy)
+        self.evidence_string_fh = evidence_string_fh
+        self.policy = policy
+        self.n_duplicates = 0
+        self.n_evidence_strings = 0
+        self.partial_line = ''
+        self.temp_dir = tempfile.mkdtemp(dir=config.DEDUPLICATION_TEMP_DIR)
+
+        if policy == "first":
+            self.association_hashes = AssociationHashes(self.temp_dir)
+        else:
+            self.spill_fh = open(os.path.join(self.temp_dir, "evidence_strings.json"), "wb")
+            self.connection = sqlite3.connect(os.path.join(self.temp_dir, "kept.sqlite"))
+            self.connection.execute("PRAGMA journal_mode = OFF")
+            self.connection.execute("PRAGMA synchronous = OFF")
+            # The association key is kept for the evidence string to be written with at the end
+            self.connection.execute("CREATE TABLE kept (hash BLOB PRIMARY KEY, "
+                                    "association_key TEXT, offset INTEGER, length INTEGER, "
+                                    "rank INTEGER)")
+
+    def write(self, text):
+        # Serialised evidence strings never contain a newline, which json escapes
+        lines = (self.partial_line + text).split('\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            evidence_string = json_codec.loads(line)
+            self.write_evidence_string(
+                line, evidence_strings.get_association_key(
+                    evidence_string["unique_association_fields"]),
+                evidence_strings.get_dict_functional_consequence(evidence_string))
+        return len(text)
+
+    def write_evidence_string(self, evidence_string_line, association_key,
+                              functional_consequence=None):
+        """
+        Write a serialised evidence string, without a newline, given its association key and
+        functional consequence (see evidence_strings.get_output_keys)
+        """
+        association_hash = get_association_hash(association_key)
+        self.n_evidence_strings += 1
+        if self.policy == "first":
+            if self.association_hashes.add(association_hash):
+                self._write_evidence_string(evidence_string_line, association_key,
+                                            functional_consequence)
+            else:
+                self.n_duplicates += 1
+            return
+
+        # The evidence string with the lowest rank is kept, or of those with the same rank the
+        # first one
+        if self.policy == "last":
+            rank = -self.n_evidence_strings
+        else:
+            rank = get_functional_consequence_rank(functional_consequence)
+        line_bytes = (evidence_string_line + '\n').encode()
+        offset = self.spill_fh.tell()
+        # Not an upsert, which older versions of SQLite don't have
+        if self.connection.execute(
+                "INSERT OR IGNORE INTO kept VALUES (?, ?, ?, ?, ?)",
+                (association_hash, association_key, offset, len(line_bytes), rank)).rowcount == 0:
+            self.connection.execute(
+                "UPDATE kept SET offset = ?, length = ?, rank = ? WHERE hash = ? AND rank > ?",
+                (offset, len(line_bytes), rank, association_hash, rank))
+        self.spill_fh.write(line_bytes)
+
+    def _write_evidence_string(self, evidence_string_line, association_key,
+                               functional_consequence):
+        # The association key is passed on to a writer which also uses it, such as that of shards
+        if hasattr(self.evidence_string_fh, "write_evidence_string"):
+            self.evidence_string_fh.write_evidence_string(evidence_string_line, association_key,
+                                                          functional_consequence)
+        else:
+            self.evidence_string_fh.write(evidence_string_line + '\n')
+
+    def _write_kept(self):
+        self.spill_fh.close()
+        n_kept = 0
+        with open(self.spill_fh.name, "rb") as spill_fh:
+            for association_key, offset, length in self.connection.execute(
+                    "SELECT association_key, offset, length FROM kept ORDER BY offset"):
+                spill_fh.seek(offset)
+                # Without its newline
+                evidence_string_line = spill_fh.read(length - 1).decode()
+                self._write_evidence_string(evidence_string_line, association_key, None)
+                n_kept += 1
+        return n_kept
+
+    def _close_temp_files(self):
+        if self.policy == "first":
+            self.association_hashes.close()
+        else:
+            self.spill_fh.close()
+            self.connection.close()
+        shutil.rmtree(self.temp_dir)
+
+    def close(self):
+        try:
+            if self.partial_line:
+                self.write('\n')
+            if self.policy != "first":
+                self.n_duplicates = self.n_evidence_strings - self._write_kept()
+        finally:
+            self._close_temp_files()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_temp_files()
@@ -1,6 +1,10 @@
 import os
+import subprocess
+import time
 
+from eva_cttv_pipeline import json_codec
 from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import utilities
 
 
 def get_available_terms(sparqlep, user, password):
@@ -28,14 +32,14 @@ def get_obsolete_terms(sparqlep, user, password):
 
 
 def execute_query(sparqlep, user, password, query):
-    cmd = "curl --post301 -L --data-urlencode \"query=" + query + " -u " + user + ":" + \
-          password + " -H \"Accept: text/tab-separated-values\" " + sparqlep
-    fd = os.popen(cmd)
+    cmd = ["curl", "--silent", "--show-error", "--fail", "--post301", "-L",
+           "--data-urlencode", "query=" + query, "-u", user + ":" + password,
+           "-H", "Accept: text/tab-separated-values", sparqlep]
     print('Loading obsolete terms...')
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, universal_newlines=True, check=True)
     terms = {}
-    fd.readline()
-    for line in fd.readlines():
-        parts = line.rstrip("\n").split('\t')
+    for line in result.stdout.splitlines()[1:]:
+        parts = line.split('\t')
         if len(parts) > 1:
             terms[parts[0].rstrip('"').lstrip('"')] = parts[1].lstrip('"').rstrip('"')
     print('Done.')
@@ -43,6 +47,89 @@ def execute_query(sparqlep, user, password, query):
     return terms
 
 
+def get_terms_snapshot_path():
+    if os.path.isabs(config.EFO_TERMS_SNAPSHOT):
+        return config.EFO_TERMS_SNAPSHOT
+    return utilities.get_resource_file(__package__, config.EFO_TERMS_SNAPSHOT)
+
+
+def write_terms_snapshot(snapshot_path, obsolete_terms, cttv_available_terms):
+    snapshot = {"created": time.time(), "obsolete_terms": obsolete_terms,
+                "cttv_available_terms": cttv_available_terms}
+    # Written to a temporary file first so other processes never read a partial snapshot
+    temp_path = "{}.{}.tmp".format(snapshot_path, os.getpid())
+    with utilities.open_file(temp_path, "wt") as f:
+        f.write(json_codec.dumps(snapshot))
+    os.replace(temp_path, snapshot_path)
+
+
+def read_terms_snapshot(snapshot_path):
+    with utilities.open_file(snapshot_path, "rt") as f:
+        return json_codec.loads(f.read())
+
+
+def refresh_terms_snapshot(snapshot_path=None):
+    """Query the EFO SPARQL endpoint for the obsolete and available terms and save them"""
+    snapshot_path = snapshot_path or get_terms_snapshot_path()
+    print('Querying EFO  web services for valid terms...')
+    obsolete_terms = get_obsolete_terms(config.SPARQLEP, config.SPARQL_USER,
+                                        config.SPARQL_PASSWORD)
+    cttv_available_terms = get_available_terms(config.SPARQLEP, config.SPARQL_USER,
+                                               config.SPARQL_PASSWORD)
+    write_terms_snapshot(snapshot_path, obsolete_terms, cttv_available_terms)
+    return read_terms_snapshot(snapshot_path)
+
+
+def load_terms_snapshot(snapshot_path=None):
+    """
+    Return the snapshot of obsolete and available EFO terms, refreshing it first if it is older
+    than config.EFO_TERMS_SNAPSHOT_TTL seconds and a SPARQL endpoint is configured. An out of date
+    snapshot is still used if the endpoint can't be queried; with no snapshot at all, no term is
+    known to be obsolete or available.
+    """
+    snapshot_path = snapshot_path or get_terms_snapshot_path()
+    snapshot = read_terms_snapshot(snapshot_path) if os.path.exists(snapshot_path) else None
+    if snapshot is not None and time.time() - snapshot["created"] < config.EFO_TERMS_SNAPSHOT_TTL:
+        return snapshot
+
+    if config.SPARQLEP:
+        try:
+            return refresh_terms_snapshot(snapshot_path)
+        except (OSError, subprocess.CalledProcessError) as err:
+            print('Could not query EFO web services for valid terms: ' + str(err))
+
+    if snapshot is not None:
+        print('Using out of date snapshot of EFO terms ' + snapshot_path)
+        return snapshot
+    print('No snapshot of EFO terms ' + snapshot_path + ', no terms will be found obsolete')
+    return {"created": None, "obsolete_terms": {}, "cttv_available_terms": {}}
+
+
+def use_efo_index(efo_index):
+    """Check terms against an eva_cttv_pipeline.efo_index.EFOIndex rather than the snapshot"""
+    EFOTerm.obsolete_terms = efo_index.get_obsolete_terms()
+    EFOTerm.cttv_available_terms = efo_index.get_cttv_available_terms()
+
+
+class _LazyTerms:
+
+    """
+    Class attribute of EFOTerm holding one of the sets of terms of the snapshot, which is only
+    loaded when first used. It replaces itself with the terms once loaded, so (as in the tests)
+    the terms can also simply be assigned.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        snapshot = load_terms_snapshot()
+        for name in ("obsolete_terms", "cttv_available_terms"):
+            if isinstance(owner.__dict__.get(name), _LazyTerms):
+                setattr(owner, name, snapshot[name])
+        return getattr(owner, self.name)
+
+
 class EFOTerm:
 
     """
@@ -51,14 +138,9 @@ class EFOTerm:
     Used in pipeline by mapping from a trait to the corresponding EFO term.
     """
 
-    print('Querying EFO  web services for valid terms...')
-    # CONNECTION PARAMETERS
-    sparqlep = config.SPARQLEP
-    user = config.SPARQL_USER
-    password = config.SPARQL_PASSWORD
-
-    obsolete_terms = get_obsolete_terms(sparqlep, user, password)
-    cttv_available_terms = get_available_terms(sparqlep, user, password)
+    # Loaded from the snapshot of EFO terms on first use, see load_terms_snapshot
+    obsolete_terms = _LazyTerms("obsolete_terms")
+    cttv_available_terms = _LazyTerms("cttv_available_terms")
 
     def __init__(self, efoid=None):
         self.efoid = efoid
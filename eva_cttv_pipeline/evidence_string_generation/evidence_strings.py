@@ -1,12 +1,12 @@
 import copy
 import json
-import sys
-
-import jsonschema
+import operator
 
+from eva_cttv_pipeline import json_codec
 from eva_cttv_pipeline.evidence_string_generation import config
 from eva_cttv_pipeline.evidence_string_generation import utilities
 from eva_cttv_pipeline.evidence_string_generation import efo_term
+from eva_cttv_pipeline.evidence_string_generation import validation
 
 
 utilities.check_for_local_schema()
@@ -60,6 +60,288 @@ def get_cttv_variant_type(clinvar_record_measure):
     return cttv_variant_type
 
 
+def get_target_activity(clinical_significance, report):
+    try:
+        return CLIN_SIG_TO_ACTIVITY[clinical_significance]
+    except KeyError:
+        report.unrecognised_clin_sigs.add(clinical_significance)
+        return 'http://identifiers.org/cttv.activity/unknown'
+
+
+def get_functional_consequence(so_term):
+    if so_term.accession is None:
+        return 'http://targetvalidation.org/sequence/' + so_term.so_name
+    return 'http://purl.obolibrary.org/obo/' + so_term.accession.replace(':', '_')
+
+
+def get_literature(ref_list):
+    return {'references': [{'lit_id': reference} for reference in ref_list]}
+
+
+def get_ref_list(clinvar_record, clinvar_record_measure, trait):
+    return list(set(clinvar_record.trait_refs_list[trait.trait_counter] +
+                    clinvar_record.observed_refs_list +
+                    clinvar_record_measure.refs_list))
+
+
+def evidence_string_to_json(evidence_string):
+    """JSON line for an evidence string, either a compact one or one using the dict interface"""
+    if isinstance(evidence_string, dict):
+        return json_codec.dumps(evidence_string)
+    return evidence_string.to_json()
+
+
+def get_association_key(unique_association_fields):
+    """The unique association fields of an evidence string as text, whatever their order"""
+    return "\t".join("{}={}".format(name, unique_association_fields[name])
+                     for name in sorted(unique_association_fields))
+
+
+def get_dict_functional_consequence(evidence_string_dict):
+    """Functional consequence of an evidence string as a dict, either genetic or somatic"""
+    evidence = evidence_string_dict.get("evidence", {})
+    if "gene2variant" in evidence:
+        return evidence["gene2variant"].get("functional_consequence")
+    known_mutations = evidence.get("known_mutations") or [{}]
+    return known_mutations[0].get("functional_consequence")
+
+
+def get_output_keys(evidence_string):
+    """
+    Association key and functional consequence of an evidence string, either a compact one or one
+    using the dict interface. Writers of evidence strings which tell them apart by these are given
+    them along with the serialised evidence string, so they don't need to parse it again.
+    """
+    if isinstance(evidence_string, dict):
+        return (get_association_key(evidence_string["unique_association_fields"]),
+                get_dict_functional_consequence(evidence_string))
+    return (get_association_key(evidence_string.unique_association_fields),
+            evidence_string.functional_consequence)
+
+
+class EvidenceTemplate:
+
+    """
+    Serialiser for evidence strings sharing the fixed JSON skeleton in base_json.
+    The skeleton is serialised once, leaving gaps for the variable fields, and an evidence
+    string's JSON is made by splicing its serialised fields into the gaps. The result is the same
+    as json.dumps of the whole evidence string as a dict.
+    slots is a list of (field name, path) pairs, path being the keys leading to the field in the
+    evidence string. A field can fill more than one path. Fields whose key isn't in base_json are
+    optional: they are added after the other keys of their object, in the order of slots, and
+    left out when their value is None.
+    """
+
+    def __init__(self, base_json, slots):
+        self.field_names = []
+        skeleton = copy.deepcopy(base_json)
+        gaps = []
+        for field_name, path in slots:
+            if field_name not in self.field_names:
+                self.field_names.append(field_name)
+            parent = skeleton
+            for key in path[:-1]:
+                parent = parent[key]
+            prefix = None if path[-1] in parent else ', ' + json.dumps(path[-1]) + ': '
+            placeholder = '\x00{}\x00'.format(len(gaps))
+            parent[path[-1]] = placeholder
+            gaps.append((json.dumps(placeholder), self.field_names.index(field_name), prefix))
+
+        # The literal text between the gaps, and the field and key prefix for each gap
+        self.literals = []
+        self.gaps = []
+        text = json.dumps(skeleton)
+        for placeholder, field_index, prefix in sorted(gaps, key=lambda gap: text.index(gap[0])):
+            literal, text = text.split(placeholder)
+            if prefix is not None:
+                if not literal.endswith(prefix):
+                    raise ValueError('Optional field {} must not be the first key of its '
+                                     'object'.format(self.field_names[field_index]))
+                literal = literal[:-len(prefix)]
+            self.literals.append(literal)
+            self.gaps.append((field_index, prefix))
+        self.literals.append(text)
+        self.get_values = operator.attrgetter(*self.field_names)
+
+    def to_json(self, evidence_string):
+        values = self.get_values(evidence_string)
+        parts = [self.literals[0]]
+        for (field_index, prefix), literal in zip(self.gaps, self.literals[1:]):
+            value = values[field_index]
+            if prefix is None:
+                parts.append(json.dumps(value))
+            elif value is not None:
+                parts.append(prefix)
+                parts.append(json.dumps(value))
+            parts.append(literal)
+        return ''.join(parts)
+
+
+class CompactEvidenceString:
+
+    """
+    Evidence string holding only the fields which vary between evidence strings. It is serialised
+    by its class' template without building the whole evidence string as nested dicts. to_dict()
+    gives the dict interface, for validation.
+    """
+
+    __slots__ = ('unique_association_fields', 'target_id', 'target_activity', 'literature',
+                 'disease_id', 'disease_source_name', 'disease_name', 'association', 'date',
+                 'db_xref_url', 'url', 'evidence_literature', 'clinical_significance')
+
+    COMMON_SLOTS = [('target_activity', ('target', 'activity')),
+                    ('target_id', ('target', 'id')),
+                    ('unique_association_fields', ('unique_association_fields',)),
+                    ('disease_id', ('disease', 'id')),
+                    ('disease_source_name', ('disease', 'source_name')),
+                    ('disease_name', ('disease', 'name')),
+                    ('literature', ('literature',))]
+
+    template = None
+    schema_file = None
+
+    def __init__(self, clinvar_record, ref_list, ensembl_gene_id, report, trait):
+        self.unique_association_fields = {}
+        if ensembl_gene_id:
+            self.unique_association_fields['gene'] = ensembl_gene_id
+        self.unique_association_fields['clinvarAccession'] = clinvar_record.accession
+
+        if ensembl_gene_id:
+            self.target_id = get_ensembl_gene_id_uri(ensembl_gene_id)
+            self.target_activity = get_target_activity(clinvar_record.clinical_significance,
+                                                       report)
+        else:
+            self.target_id = []
+            self.target_activity = None
+
+        self.literature = get_literature(ref_list) if ref_list else None
+
+        self.disease_id = trait.ontology_id
+        self.unique_association_fields['phenotype'] = trait.ontology_id
+        self.disease_source_name = trait.clinvar_name or None
+        self.disease_name = trait.ontology_label or None
+
+        self.date = clinvar_record.date
+        self.db_xref_url = 'http://identifiers.org/clinvar.record/' + clinvar_record.accession
+        self.url = 'http://www.ncbi.nlm.nih.gov/clinvar/' + clinvar_record.accession
+        self.association = clinvar_record.clinical_significance not in \
+                           ('non-pathogenic', 'probable-non-pathogenic', 'likely benign', 'benign')
+        self.evidence_literature = self.literature
+        self.clinical_significance = clinvar_record.clinical_significance or None
+
+    def to_json(self):
+        return self.template.to_json(self)
+
+    def to_dict(self):
+        return json_codec.loads(self.to_json())
+
+    def validate(self, evidence_string_dict=None):
+        """Validate the evidence string, or its dict if already parsed from its json"""
+        if evidence_string_dict is None:
+            evidence_string_dict = self.to_dict()
+        return validation.validate_evidence_string(evidence_string_dict, self.schema_file)
+
+
+class CompactGeneticsEvidenceString(CompactEvidenceString):
+
+    """Compact form of CTTVGeneticsEvidenceString, used when generating evidence strings"""
+
+    __slots__ = ('variant_id', 'variant_type', 'gene_2_var_ev_codes',
+                 'gene_2_var_func_consequence', 'unique_reference')
+
+    schema_file = utilities.get_resource_file(__package__, config.GEN_SCHEMA_FILE)
+    schema = validation.get_validator(schema_file).schema
+
+    with utilities.open_file(utilities.get_resource_file(__package__, config.GEN_EV_STRING_JSON),
+                             "rt") as gen_json_file:
+        base_json = json.load(gen_json_file)
+
+    template = EvidenceTemplate(base_json, [
+        ('variant_type', ('variant', 'type')),
+        ('variant_id', ('variant', 'id')),
+        *CompactEvidenceString.COMMON_SLOTS,
+        ('association', ('evidence', 'variant2disease', 'is_associated')),
+        ('url', ('evidence', 'variant2disease', 'urls', 0, 'url')),
+        ('db_xref_url',
+         ('evidence', 'variant2disease', 'provenance_type', 'database', 'dbxref', 'url')),
+        ('evidence_literature', ('evidence', 'variant2disease', 'provenance_type', 'literature')),
+        ('unique_reference', ('evidence', 'variant2disease', 'unique_experiment_reference')),
+        ('date', ('evidence', 'variant2disease', 'date_asserted')),
+        ('clinical_significance', ('evidence', 'variant2disease', 'clinical_significance')),
+        ('association', ('evidence', 'gene2variant', 'is_associated')),
+        ('gene_2_var_ev_codes', ('evidence', 'gene2variant', 'evidence_codes')),
+        ('url', ('evidence', 'gene2variant', 'urls', 0, 'url')),
+        ('db_xref_url',
+         ('evidence', 'gene2variant', 'provenance_type', 'database', 'dbxref', 'url')),
+        ('gene_2_var_func_consequence', ('evidence', 'gene2variant', 'functional_consequence')),
+        ('date', ('evidence', 'gene2variant', 'date_asserted'))])
+
+    def __init__(self, clinvar_record, clinvar_record_measure, report, trait, consequence_type):
+        ref_list = get_ref_list(clinvar_record, clinvar_record_measure, trait)
+
+        super().__init__(clinvar_record, ref_list, consequence_type.ensembl_gene_id, report, trait)
+
+        self.unique_association_fields['alleleOrigin'] = 'germline'
+        self.variant_type = get_cttv_variant_type(clinvar_record_measure)
+        if clinvar_record_measure.rs_id:
+            self.variant_id = 'http://identifiers.org/dbsnp/' + clinvar_record_measure.rs_id
+        elif clinvar_record_measure.nsv_id:
+            self.variant_id = 'http://identifiers.org/dbsnp/' + clinvar_record_measure.nsv_id
+        else:
+            self.variant_id = 'http://www.ncbi.nlm.nih.gov/clinvar/' + clinvar_record.accession
+        self.gene_2_var_ev_codes = ['http://identifiers.org/eco/cttv_mapping_pipeline']
+        self.gene_2_var_func_consequence = get_functional_consequence(consequence_type.so_term)
+
+        if len(ref_list) > 0:
+            # Arbitrarily select only one reference among all
+            self.unique_reference = ref_list[0]
+        else:
+            self.unique_reference = \
+                self.base_json['evidence']['variant2disease']['unique_experiment_reference']
+
+    @property
+    def functional_consequence(self):
+        return self.gene_2_var_func_consequence
+
+
+class CompactSomaticEvidenceString(CompactEvidenceString):
+
+    """Compact form of CTTVSomaticEvidenceString, used when generating evidence strings"""
+
+    __slots__ = ('known_mutations',)
+
+    schema_file = utilities.get_resource_file(__package__, config.SOM_SCHEMA_FILE)
+    schema = validation.get_validator(schema_file).schema
+
+    with utilities.open_file(utilities.get_resource_file(__package__, config.SOM_EV_STRING_JSON),
+                             "rt") as som_json_file:
+        base_json = json.load(som_json_file)
+
+    template = EvidenceTemplate(base_json, [
+        *CompactEvidenceString.COMMON_SLOTS,
+        ('association', ('evidence', 'is_associated')),
+        ('known_mutations', ('evidence', 'known_mutations')),
+        ('url', ('evidence', 'urls', 0, 'url')),
+        ('db_xref_url', ('evidence', 'provenance_type', 'database', 'dbxref', 'url')),
+        ('evidence_literature', ('evidence', 'provenance_type', 'literature')),
+        ('date', ('evidence', 'date_asserted')),
+        ('clinical_significance', ('evidence', 'clinical_significance'))])
+
+    def __init__(self, clinvar_record, clinvar_record_measure, report, trait, consequence_type):
+        ref_list = get_ref_list(clinvar_record, clinvar_record_measure, trait)
+
+        super().__init__(clinvar_record, ref_list, consequence_type.ensembl_gene_id, report, trait)
+
+        self.unique_association_fields['alleleOrigin'] = 'somatic'
+        so_term = consequence_type.so_term
+        self.known_mutations = [{'functional_consequence': get_functional_consequence(so_term),
+                                 'preferred_name': so_term.so_name}]
+
+    @property
+    def functional_consequence(self):
+        return self.known_mutations[0]['functional_consequence']
+
+
 class CTTVEvidenceString(dict):
 
     """
@@ -78,26 +360,21 @@ class CTTVEvidenceString(dict):
             self.add_unique_association_field('clinvarAccession', clinvar_record.accession)
 
         if ensembl_gene_id:
-            ensembl_gene_id_uri = get_ensembl_gene_id_uri(ensembl_gene_id)
-            try:
-                self.set_target(ensembl_gene_id_uri,
-                                CLIN_SIG_TO_ACTIVITY[clinvar_record.clinical_significance])
-            except KeyError:
-                report.unrecognised_clin_sigs.add(clinvar_record.clinical_significance)
-                self.set_target(ensembl_gene_id_uri,
-                                'http://identifiers.org/cttv.activity/unknown')
+            self.set_target(get_ensembl_gene_id_uri(ensembl_gene_id),
+                            get_target_activity(clinvar_record.clinical_significance, report))
 
         if ref_list and len(ref_list) > 0:
             self.top_level_literature = ref_list
 
-        self.disease_id = trait.ontology_id
-        self.add_unique_association_field('phenotype', trait.ontology_id)
+        if trait is not None:
+            self.disease_id = trait.ontology_id
+            self.add_unique_association_field('phenotype', trait.ontology_id)
 
-        if trait.clinvar_name:
-            self.disease_source_name = trait.clinvar_name
+            if trait.clinvar_name:
+                self.disease_source_name = trait.clinvar_name
 
-        if trait.ontology_label:
-            self.disease_name = trait.ontology_label
+            if trait.ontology_label:
+                self.disease_name = trait.ontology_label
 
     def add_unique_association_field(self, key, value):
         self['unique_association_fields'][key] = value
@@ -147,8 +424,7 @@ class CTTVEvidenceString(dict):
 
     @top_level_literature.setter
     def top_level_literature(self, reference_list):
-        self['literature'] = \
-            {'references': [{'lit_id': reference} for reference in reference_list]}
+        self['literature'] = get_literature(reference_list)
 
 
 class CTTVGeneticsEvidenceString(CTTVEvidenceString):
@@ -158,57 +434,13 @@ class CTTVGeneticsEvidenceString(CTTVEvidenceString):
     Holds information required for Open Target's evidence strings for genetic information.
     """
 
-    schema = json.loads(
-        utilities.open_file(utilities.get_resource_file(__package__, config.GEN_SCHEMA_FILE),
-                            'rt').read())
-
-    with utilities.open_file(utilities.get_resource_file(__package__, config.GEN_EV_STRING_JSON),
-                             "rt") as gen_json_file:
-        base_json = json.load(gen_json_file)
+    schema_file = CompactGeneticsEvidenceString.schema_file
+    schema = CompactGeneticsEvidenceString.schema
+    base_json = CompactGeneticsEvidenceString.base_json
 
     def __init__(self, clinvar_record, clinvar_record_measure, report, trait, consequence_type):
-
-        a_dictionary = copy.deepcopy(self.base_json)
-
-        ref_list = list(set(clinvar_record.trait_refs_list[trait.trait_counter] +
-                            clinvar_record.observed_refs_list +
-                            clinvar_record_measure.refs_list))
-
-        super().__init__(a_dictionary, clinvar_record, ref_list, consequence_type.ensembl_gene_id, report, trait)
-
-        variant_type = get_cttv_variant_type(clinvar_record_measure)
-
-        self.add_unique_association_field('alleleOrigin', 'germline')
-        if clinvar_record_measure.rs_id:
-            self.set_variant('http://identifiers.org/dbsnp/' + clinvar_record_measure.rs_id,
-                             variant_type)
-        elif clinvar_record_measure.nsv_id:
-            self.set_variant('http://identifiers.org/dbsnp/' + clinvar_record_measure.nsv_id,
-                             variant_type)
-        else:
-            self.set_variant('http://www.ncbi.nlm.nih.gov/clinvar/' + clinvar_record.accession,
-                             variant_type)
-        self.date = clinvar_record.date
-        self.db_xref_url = 'http://identifiers.org/clinvar.record/' + clinvar_record.accession
-        self.url = 'http://www.ncbi.nlm.nih.gov/clinvar/' + clinvar_record.accession
-        self.association = clinvar_record.clinical_significance not in \
-                           ('non-pathogenic', 'probable-non-pathogenic', 'likely benign', 'benign')
-        self.gene_2_var_ev_codes = ['http://identifiers.org/eco/cttv_mapping_pipeline']
-        most_severe_so_term = consequence_type.so_term
-        if most_severe_so_term.accession is None:
-            self.gene_2_var_func_consequence = 'http://targetvalidation.org/sequence/' + \
-                                               most_severe_so_term.so_name
-        else:
-            self.gene_2_var_func_consequence = 'http://purl.obolibrary.org/obo/' + \
-                                               most_severe_so_term.accession.replace(':', '_')
-
-        if len(ref_list) > 0:
-            self.set_var_2_disease_literature(ref_list)
-            # Arbitrarily select only one reference among all
-            self.unique_reference = ref_list[0]
-
-        if clinvar_record.clinical_significance:
-            self.clinical_significance = clinvar_record.clinical_significance
+        super().__init__(CompactGeneticsEvidenceString(clinvar_record, clinvar_record_measure,
+                                                       report, trait, consequence_type).to_dict())
 
     @property
     def db_xref_url(self):
@@ -255,7 +487,7 @@ class CTTVGeneticsEvidenceString(CTTVEvidenceString):
 
     def set_var_2_disease_literature(self, ref_list):
         self['evidence']['variant2disease']['provenance_type']['literature'] = \
-            {'references': [{'lit_id': reference} for reference in ref_list]}
+            get_literature(ref_list)
 
     @property
     def association(self):
@@ -270,11 +502,8 @@ class CTTVGeneticsEvidenceString(CTTVEvidenceString):
         self['evidence']['gene2variant']['is_associated'] = is_associated
         self['evidence']['variant2disease']['is_associated'] = is_associated
 
-    def validate(self):
-        jsonschema.validate(self, CTTVGeneticsEvidenceString.schema,
-                            format_checker=jsonschema.FormatChecker())
-        self.disease_id.is_obsolete()
-        return True
+    def validate(self, evidence_string_dict=None):
+        return validation.validate_evidence_string(self, self.schema_file)
 
     def _clear_variant(self):
         self['variant']['id'] = []
@@ -321,38 +550,13 @@ class CTTVSomaticEvidenceString(CTTVEvidenceString):
     Holds information required for Open Target's evidence strings for somatic information.
     """
 
-    schema = json.loads(utilities.open_file(utilities.get_resource_file(__package__,
-                                                         config.SOM_SCHEMA_FILE), 'rt').read())
-
-    with utilities.open_file(utilities.get_resource_file(__package__, config.SOM_EV_STRING_JSON),
-                             "rt") as som_json_file:
-        base_json = json.load(som_json_file)
+    schema_file = CompactSomaticEvidenceString.schema_file
+    schema = CompactSomaticEvidenceString.schema
+    base_json = CompactSomaticEvidenceString.base_json
 
     def __init__(self, clinvar_record, clinvar_record_measure, report, trait, consequence_type):
-
-        a_dictionary = copy.deepcopy(self.base_json)
-
-        ref_list = list(set(clinvar_record.trait_refs_list[trait.trait_counter] +
-                            clinvar_record.observed_refs_list +
-                            clinvar_record_measure.refs_list))
-
-        super().__init__(a_dictionary, clinvar_record, ref_list, consequence_type.ensembl_gene_id, report, trait)
-
-        self.add_unique_association_field('alleleOrigin', 'somatic')
-
-        self.date = clinvar_record.date
-        self.db_xref_url = 'http://identifiers.org/clinvar.record/' + clinvar_record.accession
-        self.url = 'http://www.ncbi.nlm.nih.gov/clinvar/' + clinvar_record.accession
-        self.association = clinvar_record.clinical_significance not in \
-                           ('non-pathogenic', 'probable-non-pathogenic', 'likely benign', 'benign')
-
-        self.set_known_mutations(consequence_type.so_term)
-
-        if len(ref_list) > 0:
-            self.evidence_literature = ref_list
-
-        if clinvar_record.clinical_significance:
-            self.clinical_significance = clinvar_record.clinical_significance
+        super().__init__(CompactSomaticEvidenceString(clinvar_record, clinvar_record_measure,
+                                                      report, trait, consequence_type).to_dict())
 
     @property
     def db_xref_url(self):
@@ -376,8 +580,7 @@ class CTTVSomaticEvidenceString(CTTVEvidenceString):
 
     @evidence_literature.setter
     def evidence_literature(self, ref_list):
-        self['evidence']['provenance_type']['literature'] = \
-            {'references': [{'lit_id': reference} for reference in ref_list]}
+        self['evidence']['provenance_type']['literature'] = get_literature(ref_list)
 
     @property
     def association(self):
@@ -387,11 +590,8 @@ class CTTVSomaticEvidenceString(CTTVEvidenceString):
     def association(self, is_associated):
         self['evidence']['is_associated'] = is_associated
 
-    def validate(self):
-        jsonschema.validate(self, CTTVSomaticEvidenceString.schema,
-                            format_checker=jsonschema.FormatChecker())
-        self.disease_id.is_obsolete()
-        return True
+    def validate(self, evidence_string_dict=None):
+        return validation.validate_evidence_string(self, self.schema_file)
 
     @property
     def date(self):
@@ -410,13 +610,7 @@ class CTTVSomaticEvidenceString(CTTVEvidenceString):
         self['evidence']['known_mutations'].append(new_known_mutation)
 
     def set_known_mutations(self, so_term):
-        if so_term.accession:
-            new_functional_consequence = \
-                "http://purl.obolibrary.org/obo/" + so_term.accession.replace(':', '_')
-        else:
-            new_functional_consequence = \
-                'http://targetvalidation.org/sequence/' + so_term.so_name
-        self.add_known_mutation(new_functional_consequence, so_term.so_name)
+        self.add_known_mutation(get_functional_consequence(so_term), so_term.so_name)
 
     @property
     def clinical_significance(self):
@@ -0,0 +1,132 @@
+"""
+Manifest of the ClinVar records of a run of the pipeline, used by the next run to reuse the
+evidence strings of every record which, along with the mappings it uses, hasn't changed.
+
+For each record the manifest has, keyed by accession, the hash of its json line, the hash of the
+trait and consequence type mappings used for it, the position of its evidence strings in the
+evidence strings file and the records it added to the report. Anything else the evidence strings
+depend on (the allowed clinical significances, the schema, the evidence string templates and the
+obsolete EFO terms) is hashed into a single run key: the manifest of a run with a different key is
+not used.
+"""
+
+import hashlib
+import os
+import sqlite3
+from collections import namedtuple
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import efo_term
+from eva_cttv_pipeline.evidence_string_generation import utilities
+
+
+# Increase when what is stored in the manifest changes, so older manifests are not used
+MANIFEST_VERSION = 1
+
+ManifestEntry = namedtuple("ManifestEntry", ["record_hash", "mappings_hash", "offset", "length",
+                                             "report"])
+
+
+def hash_text(text):
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def get_run_key(allowed_clinical_significance):
+    digest = hashlib.sha256()
+    digest.update(json_codec.dumps([MANIFEST_VERSION,
+                                    sorted(allowed_clinical_significance)]).encode())
+    resource_files = [utilities.get_resource_file(__package__, config.GEN_EV_STRING_JSON),
+                      utilities.get_resource_file(__package__, config.SOM_EV_STRING_JSON)]
+    schema_dir = utilities.get_resource_file(__package__, config.LOCAL_SCHEMA + "/src")
+    for dir_path, dir_names, file_names in os.walk(schema_dir):
+        dir_names.sort()
+        resource_files.extend(os.path.join(dir_path, file_name) for file_name in sorted(file_names))
+    for resource_file in resource_files:
+        digest.update(resource_file.encode())
+        with open(resource_file, "rb") as f:
+            digest.update(f.read())
+    digest.update(json_codec.dumps(sorted(efo_term.EFOTerm.obsolete_terms.items())).encode())
+    return digest.hexdigest()
+
+
+class ManifestWriter:
+
+    """
+    Writes the manifest of a run. It is only moved into place when closed without an error, so an
+    interrupted run leaves no manifest.
+    """
+
+    def __init__(self, manifest_file, run_key):
+        self.manifest_file = manifest_file
+        self.temp_file = "{}.{}.tmp".format(manifest_file, os.getpid())
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+        self.connection = sqlite3.connect(self.temp_file)
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE run (run_key TEXT)")
+        self.connection.execute("INSERT INTO run VALUES (?)", (run_key,))
+        self.connection.execute("CREATE TABLE record (accession TEXT PRIMARY KEY, "
+                                "record_hash TEXT, mappings_hash TEXT, offset INTEGER, "
+                                "length INTEGER, report TEXT)")
+
+    def add(self, accession, entry):
+        self.connection.execute("INSERT OR REPLACE INTO record VALUES (?, ?, ?, ?, ?, ?)",
+                                (accession,) + tuple(entry))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+        os.replace(self.temp_file, self.manifest_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.connection.close()
+            os.remove(self.temp_file)
+
+
+class PreviousRun:
+
+    """The manifest and evidence strings of a previous run, in its output directory"""
+
+    def __init__(self, dir_out):
+        self.connection = sqlite3.connect(os.path.join(dir_out, config.MANIFEST_FILE_NAME))
+        self.evidence_string_fh = open(os.path.join(dir_out, config.EVIDENCE_STRINGS_FILE_NAME),
+                                       "rb")
+
+    @classmethod
+    def open(cls, dir_out, run_key):
+        """The previous run in dir_out, or None if it has no manifest or a different run key"""
+        if not os.path.exists(os.path.join(dir_out, config.MANIFEST_FILE_NAME)):
+            print("No manifest in " + dir_out + ", all ClinVar records will be processed")
+            return None
+        previous_run = cls(dir_out)
+        if previous_run.get_run_key() != run_key:
+            print("Schema, evidence string templates, EFO terms or clinical significances differ "
+                  "from the run in " + dir_out + ", all ClinVar records will be processed")
+            previous_run.close()
+            return None
+        return previous_run
+
+    def get_run_key(self):
+        return self.connection.execute("SELECT run_key FROM run").fetchone()[0]
+
+    def get(self, accession):
+        row = self.connection.execute(
+            "SELECT record_hash, mappings_hash, offset, length, report FROM record "
+            "WHERE accession = ?", (accession,)).fetchone()
+        return ManifestEntry(*row) if row is not None else None
+
+    def read_evidence_strings(self, entry):
+        self.evidence_string_fh.seek(entry.offset)
+        return self.evidence_string_fh.read(entry.length).decode()
+
+    def close(self):
+        self.connection.close()
+        self.evidence_string_fh.close()
@@ -0,0 +1,401 @@
+import hashlib
+import json
+import os
+from urllib.parse import urldefrag
+
+import jsonschema
+import jsonschema._utils
+
+from eva_cttv_pipeline.evidence_string_generation import utilities
+
+
+# Increase when the generated code changes, so that previously cached code is not used
+COMPILER_VERSION = 1
+DEPENDENCY_PREFIX = "# depends on "
+
+# Python checks for the draft 4 types, matching jsonschema's (bools are not numbers)
+TYPE_CHECKS = {
+    "array": "isinstance({0}, list)",
+    "boolean": "isinstance({0}, bool)",
+    "integer": "(isinstance({0}, int) and not isinstance({0}, bool))",
+    "null": "{0} is None",
+    "number": "(isinstance({0}, numbers.Number) and not isinstance({0}, bool))",
+    "object": "isinstance({0}, dict)",
+    "string": "isinstance({0}, str)",
+}
+
+OBJECT_KEYWORDS = ("properties", "patternProperties", "additionalProperties", "required",
+                   "minProperties", "maxProperties", "dependencies")
+ARRAY_KEYWORDS = ("items", "additionalItems", "minItems", "maxItems", "uniqueItems")
+STRING_KEYWORDS = ("pattern", "minLength", "maxLength")
+NUMBER_KEYWORDS = ("minimum", "maximum", "multipleOf")
+
+
+class UnsupportedSchemaException(Exception):
+    pass
+
+
+class SchemaCompiler:
+
+    """
+    Compiles a draft 4 json schema, and every schema it references, into Python source code for a
+    function, is_valid(instance), which returns whether an instance is valid against the schema.
+    The checks follow those of the jsonschema package, but only say whether an instance is valid;
+    jsonschema is still used to describe why an instance isn't.
+    Each (sub)schema becomes one function. Referenced schemas are compiled once and shared, which
+    also deals with recursive references.
+    """
+
+    def __init__(self, validator):
+        self.validator = validator
+        self.resolver = validator.resolver
+        self.lines = []
+        self.constants = []
+        self.ref_functions = {}
+        self.n_functions = 0
+        # Urls of the other documents referenced by the schema
+        self.documents = set()
+
+    def compile(self):
+        if not isinstance(self.validator, jsonschema.Draft4Validator):
+            raise UnsupportedSchemaException("Only draft 4 schemas are supported")
+        root_function = self.compile_schema(self.validator.schema)
+        header = ["import json", "import numbers", "import re", ""]
+        for name, code in self.constants:
+            header.append("{} = {}".format(name, code))
+        footer = ["", "is_valid = {}".format(root_function)]
+        return "\n".join(header + [""] + self.lines + footer) + "\n"
+
+    def add_constant(self, code):
+        name = "_c{}".format(len(self.constants))
+        self.constants.append((name, code))
+        return name
+
+    def add_json_constant(self, value):
+        return self.add_constant("json.loads({!r})".format(json.dumps(value)))
+
+    def add_regex_constant(self, pattern):
+        return self.add_constant("re.compile({!r})".format(pattern))
+
+    def compile_ref(self, ref):
+        url, resolved = self.resolver.resolve(ref)
+        if url in self.ref_functions:
+            return self.ref_functions[url]
+        document_url = urldefrag(url)[0]
+        if document_url:
+            self.documents.add(document_url)
+        function_name = self.new_function_name()
+        self.ref_functions[url] = function_name
+        self.resolver.push_scope(url)
+        try:
+            self.compile_schema(resolved, function_name)
+        finally:
+            self.resolver.pop_scope()
+        return function_name
+
+    def new_function_name(self):
+        self.n_functions += 1
+        return "_v{}".format(self.n_functions)
+
+    def compile_schema(self, schema, function_name=None):
+        if not isinstance(schema, dict):
+            raise UnsupportedSchemaException("Schema is not an object: {!r}".format(schema))
+        if function_name is None:
+            function_name = self.new_function_name()
+
+        for keyword in schema:
+            if keyword in self.validator.VALIDATORS and keyword != "$ref" and \
+                    not hasattr(self, "compile_" + keyword):
+                raise UnsupportedSchemaException("Unsupported keyword: " + keyword)
+
+        scope = schema.get("id")
+        if scope:
+            self.resolver.push_scope(scope)
+        try:
+            # As in jsonschema, when a schema has a $ref its other keywords are ignored
+            if "$ref" in schema:
+                body = ["return {}(i)".format(self.compile_ref(schema["$ref"]))]
+            else:
+                body = self.compile_body(schema)
+        finally:
+            if scope:
+                self.resolver.pop_scope()
+
+        self.lines.append("def {}(i):".format(function_name))
+        self.lines.extend("    " + line for line in body)
+        self.lines.append("")
+        return function_name
+
+    def compile_body(self, schema):
+        body = []
+        for keyword in ("type", "enum", "format", "allOf", "anyOf", "oneOf", "not"):
+            if keyword in schema:
+                body.extend(getattr(self, "compile_" + keyword)(schema[keyword], schema))
+
+        for type_name, keywords in (("object", OBJECT_KEYWORDS), ("array", ARRAY_KEYWORDS),
+                                    ("string", STRING_KEYWORDS), ("number", NUMBER_KEYWORDS)):
+            type_body = []
+            for keyword in keywords:
+                if keyword in schema:
+                    type_body.extend(getattr(self, "compile_" + keyword)(schema[keyword], schema))
+            if type_body:
+                body.append("if {}:".format(TYPE_CHECKS[type_name].format("i")))
+                body.extend("    " + line for line in type_body)
+
+        body.append("return True")
+        return body
+
+    def compile_type(self, types, schema):
+        if not isinstance(types, list):
+            types = [types]
+        for type_name in types:
+            if type_name not in TYPE_CHECKS:
+                raise UnsupportedSchemaException("Unsupported type: {!r}".format(type_name))
+        checks = " or ".join(TYPE_CHECKS[type_name].format("i") for type_name in types)
+        return ["if not ({}):".format(checks or "False"), "    return False"]
+
+    def compile_enum(self, enum, schema):
+        return ["if i not in {}:".format(self.add_json_constant(enum)), "    return False"]
+
+    def compile_format(self, format_name, schema):
+        if self.validator.format_checker is None:
+            return []
+        return ["if not _format_checker.conforms(i, {!r}):".format(format_name),
+                "    return False"]
+
+    def compile_allOf(self, subschemas, schema):
+        body = []
+        for subschema in subschemas:
+            body.extend(["if not {}(i):".format(self.compile_schema(subschema)),
+                         "    return False"])
+        return body
+
+    def compile_anyOf(self, subschemas, schema):
+        functions = [self.compile_schema(subschema) for subschema in subschemas]
+        return ["if not ({}):".format(" or ".join(f + "(i)" for f in functions) or "False"),
+                "    return False"]
+
+    def compile_oneOf(self, subschemas, schema):
+        functions = [self.compile_schema(subschema) for subschema in subschemas]
+        return ["if [{}].count(True) != 1:".format(", ".join(f + "(i)" for f in functions)),
+                "    return False"]
+
+    def compile_not(self, subschema, schema):
+        return ["if {}(i):".format(self.compile_schema(subschema)), "    return False"]
+
+    def compile_properties(self, properties, schema):
+        body = []
+        for name, subschema in properties.items():
+            body.extend(["if {0!r} in i and not {1}(i[{0!r}]):".format(
+                             name, self.compile_schema(subschema)),
+                         "    return False"])
+        return body
+
+    def compile_patternProperties(self, pattern_properties, schema):
+        body = []
+        for pattern, subschema in pattern_properties.items():
+            body.extend(["for k, v in i.items():",
+                         "    if {}.search(k) and not {}(v):".format(
+                             self.add_regex_constant(pattern), self.compile_schema(subschema)),
+                         "        return False"])
+        return body
+
+    def compile_additionalProperties(self, additional_properties, schema):
+        properties = self.add_json_constant(sorted(schema.get("properties", {})))
+        properties_set = self.add_constant("frozenset({})".format(properties))
+        patterns = "|".join(schema.get("patternProperties", {}))
+        if patterns:
+            extra_check = "k not in {} and not {}.search(k)".format(
+                properties_set, self.add_regex_constant(patterns))
+        else:
+            extra_check = "k not in {}".format(properties_set)
+
+        if isinstance(additional_properties, dict):
+            return ["for k, v in i.items():",
+                    "    if {} and not {}(v):".format(
+                        extra_check, self.compile_schema(additional_properties)),
+                    "        return False"]
+        elif not additional_properties:
+            return ["for k in i:",
+                    "    if {}:".format(extra_check),
+                    "        return False"]
+        return []
+
+    def compile_required(self, required, schema):
+        return ["for k in {}:".format(self.add_json_constant(required)),
+                "    if k not in i:",
+                "        return False"]
+
+    def compile_minProperties(self, min_properties, schema):
+        return ["if len(i) < {!r}:".format(min_properties), "    return False"]
+
+    def compile_maxProperties(self, max_properties, schema):
+        return ["if len(i) > {!r}:".format(max_properties), "    return False"]
+
+    def compile_dependencies(self, dependencies, schema):
+        body = []
+        for name, dependency in dependencies.items():
+            if isinstance(dependency, dict):
+                body.extend(["if {!r} in i and not {}(i):".format(
+                                 name, self.compile_schema(dependency)),
+                             "    return False"])
+            else:
+                if not isinstance(dependency, list):
+                    dependency = [dependency]
+                body.extend(["if {!r} in i:".format(name),
+                             "    for k in {}:".format(self.add_json_constant(dependency)),
+                             "        if k not in i:",
+                             "            return False"])
+        return body
+
+    def compile_items(self, items, schema):
+        if isinstance(items, dict):
+            return ["for v in i:",
+                    "    if not {}(v):".format(self.compile_schema(items)),
+                    "        return False"]
+        body = []
+        for index, subschema in enumerate(items):
+            body.extend(["if len(i) > {0} and not {1}(i[{0}]):".format(
+                             index, self.compile_schema(subschema)),
+                         "    return False"])
+        return body
+
+    def compile_additionalItems(self, additional_items, schema):
+        items = schema.get("items", {})
+        if isinstance(items, dict):
+            return []
+        if isinstance(additional_items, dict):
+            return ["for v in i[{}:]:".format(len(items)),
+                    "    if not {}(v):".format(self.compile_schema(additional_items)),
+                    "        return False"]
+        elif not additional_items:
+            return ["if len(i) > {}:".format(len(items)), "    return False"]
+        return []
+
+    def compile_minItems(self, min_items, schema):
+        return ["if len(i) < {!r}:".format(min_items), "    return False"]
+
+    def compile_maxItems(self, max_items, schema):
+        return ["if len(i) > {!r}:".format(max_items), "    return False"]
+
+    def compile_uniqueItems(self, unique_items, schema):
+        if not unique_items:
+            return []
+        return ["if not _uniq(i):", "    return False"]
+
+    def compile_pattern(self, pattern, schema):
+        return ["if not {}.search(i):".format(self.add_regex_constant(pattern)),
+                "    return False"]
+
+    def compile_minLength(self, min_length, schema):
+        return ["if len(i) < {!r}:".format(min_length), "    return False"]
+
+    def compile_maxLength(self, max_length, schema):
+        return ["if len(i) > {!r}:".format(max_length), "    return False"]
+
+    def compile_minimum(self, minimum, schema):
+        operator = "<=" if schema.get("exclusiveMinimum", False) else "<"
+        return ["if i {} {!r}:".format(operator, minimum), "    return False"]
+
+    def compile_maximum(self, maximum, schema):
+        operator = ">=" if schema.get("exclusiveMaximum", False) else ">"
+        return ["if i {} {!r}:".format(operator, maximum), "    return False"]
+
+    def compile_multipleOf(self, multiple_of, schema):
+        if isinstance(multiple_of, float):
+            return ["if int(i / {0!r}) != i / {0!r}:".format(multiple_of), "    return False"]
+        return ["if i % {!r}:".format(multiple_of), "    return False"]
+
+
+def document_hash(resolver, url):
+    document = resolver.resolve_from_url(url)
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode()).hexdigest()
+
+
+def schema_file_hash(schema_file):
+    sha = hashlib.sha256(str(COMPILER_VERSION).encode())
+    with open(schema_file, "rb") as f:
+        sha.update(f.read())
+    return sha.hexdigest()
+
+
+def dependencies_unchanged(code, resolver):
+    """
+    Check the documents referenced by the schema, listed at the top of the generated code with
+    their hashes, haven't changed since the code was generated.
+    """
+    for line in code.splitlines():
+        if not line.startswith(DEPENDENCY_PREFIX):
+            break
+        url, sha = line[len(DEPENDENCY_PREFIX):].rsplit(" ", 1)
+        if document_hash(resolver, url) != sha:
+            return False
+    return True
+
+
+class CompiledValidator:
+
+    """
+    Validator using code compiled from the schema to check instances. Only when the compiled code
+    finds an instance invalid is the slower jsonschema validator run, to raise a ValidationError
+    describing the problem.
+    """
+
+    def __init__(self, validator, is_valid):
+        self.validator = validator
+        self.schema = validator.schema
+        self.is_valid = is_valid
+
+    def validate(self, instance):
+        if not self.is_valid(instance):
+            self.validator.validate(instance)
+
+
+def load_compiled_code(code, validator, filename):
+    namespace = {}
+    exec(compile(code, filename, "exec"), namespace)
+    # Shared with the jsonschema validator so formats are checked exactly the same way
+    namespace["_format_checker"] = validator.format_checker
+    namespace["_uniq"] = jsonschema._utils.uniq
+    return namespace["is_valid"]
+
+
+def get_compiled_validator(schema_file, validator, cache_dir=None):
+    """
+    Return a CompiledValidator for the schema in schema_file, with validator being the jsonschema
+    validator for it. The generated code is cached in cache_dir, keyed by the hash of the schema
+    (and checked against the hashes of the documents it references), so it is only generated once.
+    Returns None if the schema uses something the compiler doesn't support.
+    """
+    name = os.path.splitext(os.path.basename(schema_file))[0]
+    cache_file = None
+    code = None
+    if cache_dir is not None:
+        cache_file = os.path.join(cache_dir,
+                                  "{}_{}.py".format(name, schema_file_hash(schema_file)[:16]))
+        if os.path.exists(cache_file):
+            with utilities.open_file(cache_file, "rt") as f:
+                code = f.read()
+            if not dependencies_unchanged(code, validator.resolver):
+                code = None
+
+    if code is None:
+        compiler = SchemaCompiler(validator)
+        try:
+            code = compiler.compile()
+        except UnsupportedSchemaException as e:
+            print("Schema {} can not be compiled, using jsonschema: {}".format(schema_file, e))
+            return None
+        code = "".join("{}{} {}\n".format(DEPENDENCY_PREFIX, url,
+                                           document_hash(validator.resolver, url))
+                       for url in sorted(compiler.documents)) + code
+        if cache_file is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Written to a temporary file first so other processes never read a partial file
+            temp_file = "{}.{}.tmp".format(cache_file, os.getpid())
+            with utilities.open_file(temp_file, "wt") as f:
+                f.write(code)
+            os.replace(temp_file, cache_file)
+
+    return CompiledValidator(validator,
+                             load_compiled_code(code, validator, cache_file or schema_file))
@@ -0,0 +1,274 @@
+"""
+Output of evidence strings split into gzipped shards, so that they can be written, loaded and
+validated again in parallel. Shards hold either up to a number of evidence strings each
+("count"), up to a number of bytes of uncompressed evidence strings each ("size"), or, with a
+fixed number of shards, the evidence strings whose unique_association_fields hash to each one
+("hash"), which keeps any duplicates of an association in the same shard.
+
+Each shard is compressed by a thread of its own, as zlib and hashlib release the GIL, so several
+shards are compressed at once while evidence strings are still being generated. As all the shards
+are open at once when sharding by hash, there can be at most config.SHARD_MAX_HASH_SHARDS of them.
+The association key used to hash an evidence string is given by the Report along with it, through
+write_evidence_string, so evidence strings aren't parsed again here. A manifest lists
+the shards with the number of evidence strings in each, their size and their SHA-256 checksum. It
+is only written once every shard is complete, so a run which stopped leaves no manifest.
+"""
+
+import gzip
+import hashlib
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import gmtime, strftime
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import evidence_strings
+
+
+SHARD_BY = ("count", "size", "hash")
+
+
+def get_shard_file_name(shard_number):
+    return config.SHARD_FILE_NAME.format(shard_number)
+
+
+class HashingFile:
+
+    """Writes to a binary file, updating digest with what is written"""
+
+    def __init__(self, fileobj, digest):
+        self.fileobj = fileobj
+        self.digest = digest
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.fileobj.write(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+
+class Shard:
+
+    """
+    One gzipped shard. Lines are buffered, and compressed and written in chunks of
+    config.SHARD_CHUNK_SIZE bytes by a thread of the shard, at most two chunks being queued.
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.n_evidence_strings = 0
+        self.size = 0
+        self.buffer = []
+        self.buffer_size = 0
+        self.digest = hashlib.sha256()
+        self.raw_fh = open(file_path, 'wb')
+        # mtime is fixed, so the same evidence strings always give the same checksum
+        self.gzip_fh = gzip.GzipFile(filename='', mode='wb',
+                                     compresslevel=config.SHARD_COMPRESSION_LEVEL,
+                                     fileobj=HashingFile(self.raw_fh, self.digest), mtime=0)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.pending = deque()
+        self.closing = False
+
+    def add(self, line):
+        """Add a line, as bytes ending with a newline"""
+        self.buffer.append(line)
+        self.buffer_size += len(line)
+        self.size += len(line)
+        self.n_evidence_strings += 1
+        if self.buffer_size >= config.SHARD_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self._submit(self.gzip_fh.write, b''.join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+
+    def _submit(self, function, *args):
+        self.pending.append(self.executor.submit(function, *args))
+        if len(self.pending) > 2:
+            self.pending.popleft().result()
+
+    def _close_files(self):
+        try:
+            self.gzip_fh.close()
+        finally:
+            self.raw_fh.close()
+
+    def start_closing(self):
+        """Queue the closing of the shard, to be waited for by finish_closing"""
+        if not self.closing:
+            self.closing = True
+            self.flush()
+            self._submit(self._close_files)
+
+    def finish_closing(self):
+        """Wait for the shard to be written and closed, raising any error in writing it"""
+        try:
+            while self.pending:
+                self.pending.popleft().result()
+        finally:
+            self.executor.shutdown()
+
+    def get_manifest_entry(self):
+        return {"file": os.path.basename(self.file_path),
+                "evidence_strings": self.n_evidence_strings,
+                "bytes": self.size,
+                "compressed_bytes": os.path.getsize(self.file_path),
+                "sha256": self.digest.hexdigest()}
+
+
+class ShardedEvidenceStringWriter:
+
+    """
+    Writes evidence strings to shards in dir_out, as a file handle to which the serialised evidence
+    strings are written a line each, or, without having to parse them, through
+    write_evidence_string along with their association keys. shard_limit is, depending on
+    shard_by, the maximum number of evidence strings or uncompressed bytes of a shard, or the
+    number of shards. Shards of an earlier run in dir_out are removed.
+    """
+
+    def __init__(self, dir_out, shard_by, shard_limit):
+        check_shard_settings(shard_by, shard_limit)
+        self.dir_out = dir_out
+        self.shard_by = shard_by
+        self.shard_limit = shard_limit
+        self.manifest_file = os.path.join(dir_out, config.SHARD_MANIFEST_FILE_NAME)
+        self.partial_line = ''
+        self.shards = []
+
+        for file_path in [self.manifest_file] + get_shard_files(dir_out):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        if shard_by == "hash":
+            for _ in range(shard_limit):
+                self._open_shard()
+
+    def _open_shard(self):
+        shard = Shard(os.path.join(self.dir_out, get_shard_file_name(len(self.shards))))
+        if self.shards and self.shard_by != "hash":
+            # Shards are filled one after another, so the last one can already be closed, while
+            # the next is written, and the one before it must be closed by now
+            self.shards[-1].start_closing()
+            if len(self.shards) > 1:
+                self.shards[-2].finish_closing()
+        self.shards.append(shard)
+        return shard
+
+    def _get_shard(self, line_bytes, association_key):
+        if self.shard_by == "hash":
+            return self.shards[zlib.crc32(association_key.encode()) % self.shard_limit]
+        shard = self.shards[-1] if self.shards else None
+        if shard is None or \
+                self.shard_by == "count" and shard.n_evidence_strings >= self.shard_limit or \
+                self.shard_by == "size" and shard.size and \
+                shard.size + len(line_bytes) > self.shard_limit:
+            shard = self._open_shard()
+        return shard
+
+    def write(self, text):
+        # Serialised evidence strings never contain a newline, which json escapes
+        lines = (self.partial_line + text).split('\n')
+        self.partial_line = lines.pop()
+        for line in lines:
+            association_key = evidence_strings.get_association_key(
+                json_codec.loads(line)["unique_association_fields"]) \
+                if self.shard_by == "hash" else None
+            self.write_evidence_string(line, association_key)
+        return len(text)
+
+    def write_evidence_string(self, evidence_string_line, association_key,
+                              functional_consequence=None):
+        """
+        Write a serialised evidence string, without a newline, given its association key (see
+        evidence_strings.get_output_keys), which is only used when sharding by hash
+        """
+        line_bytes = (evidence_string_line + '\n').encode()
+        self._get_shard(line_bytes, association_key).add(line_bytes)
+
+    def _close_shards(self):
+        for shard in self.shards:
+            shard.start_closing()
+        error = None
+        for shard in self.shards:
+            try:
+                shard.finish_closing()
+            except Exception as err:
+                error = error or err
+        if error is not None:
+            raise error
+
+    def close(self):
+        if self.partial_line:
+            self.write('\n')
+        self._close_shards()
+        shard_entries = [shard.get_manifest_entry() for shard in self.shards]
+        manifest = {"created": strftime("%Y-%m-%dT%H:%M:%SZ", gmtime()),
+                    "shard_by": self.shard_by,
+                    "shard_limit": self.shard_limit,
+                    "evidence_strings": sum(entry["evidence_strings"] for entry in shard_entries),
+                    "shards": shard_entries}
+        temp_file = self.manifest_file + '.tmp'
+        with open(temp_file, 'wt') as f:
+            f.write(json_codec.dumps(manifest) + '\n')
+        os.replace(temp_file, self.manifest_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_shards()
+
+
+def check_shard_settings(shard_by, shard_limit):
+    """Raise ValueError if evidence strings can't be sharded by shard_by with shard_limit"""
+    if shard_by not in SHARD_BY:
+        raise ValueError("Evidence strings can only be sharded by one of: " +
+                         ", ".join(SHARD_BY))
+    if shard_limit is None or shard_limit < 1:
+        raise ValueError("The shard limit must be a positive number")
+    if shard_by == "hash" and shard_limit > config.SHARD_MAX_HASH_SHARDS:
+        raise ValueError("Evidence strings can be sharded by hash into at most {} shards".format(
+            config.SHARD_MAX_HASH_SHARDS))
+
+
+def get_shard_files(dir_out):
+    """Paths of the shards in dir_out, in order"""
+    prefix = config.SHARD_FILE_NAME.split('{', 1)[0]
+    suffix = config.SHARD_FILE_NAME.split('}', 1)[1]
+    return sorted(os.path.join(dir_out, file_name) for file_name in os.listdir(dir_out)
+                  if file_name.startswith(prefix) and file_name.endswith(suffix))
+
+
+def load_manifest(dir_out):
+    with open(os.path.join(dir_out, config.SHARD_MANIFEST_FILE_NAME), 'rt') as f:
+        return json_codec.loads(f.read())
+
+
+def check_shard(dir_out, shard_entry):
+    """
+    Check a shard in dir_out against its entry in the manifest, returning a description of the
+    first difference found, or None if it matches. Shards can be checked in parallel.
+    """
+    file_path = os.path.join(dir_out, shard_entry["file"])
+    if not os.path.exists(file_path):
+        return file_path + " is missing"
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(config.SHARD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    if digest.hexdigest() != shard_entry["sha256"]:
+        return file_path + " has a different checksum to that in the manifest"
+    with gzip.open(file_path, 'rb') as f:
+        n_evidence_strings = sum(1 for _ in f)
+    if n_evidence_strings != shard_entry["evidence_strings"]:
+        return "{} has {} evidence strings rather than {}".format(
+            file_path, n_evidence_strings, shard_entry["evidence_strings"])
+    return None
@@ -0,0 +1,107 @@
+"""
+Wall time spent in each stage of generating evidence strings, and how many times each stage was
+entered. Stages are timed with
+
+    with timings["validation"]:
+        ev_string.validate()
+
+which reads perf_counter twice. Several stages are entered for every evidence string, so CPU time,
+whose clock is a system call and much slower to read, is only kept for the run as a whole, and
+the lines of ClinVar records are read a batch at a time. Partial reports produced in worker
+processes have timings of their own which are merged into those of the run, so with several
+workers the time of a stage is the sum of the time spent in it by every process.
+"""
+
+from collections import OrderedDict
+from time import perf_counter, process_time
+
+
+STAGES = OrderedDict([
+    ("mappings", "Loading trait and consequence type mappings"),
+    ("read", "Reading ClinVar json lines"),
+    ("decode", "Decoding ClinVar json records"),
+    ("clinvar_record", "Building ClinvarRecord objects"),
+    ("consequence_types", "Looking up consequence types"),
+    ("traits", "Mapping traits to EFO"),
+    ("evidence_strings", "Building evidence strings"),
+    ("validation", "Validating evidence strings"),
+    ("output", "Writing output"),
+])
+
+
+class Stage:
+
+    """Time spent in one stage. Can be entered again once exited, but not while it is entered."""
+
+    __slots__ = ("wall", "calls", "wall_start")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.calls = 0
+        self.wall_start = None
+
+    def __enter__(self):
+        self.wall_start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall += perf_counter() - self.wall_start
+        self.calls += 1
+
+    def merge(self, other):
+        self.wall += other.wall
+        self.calls += other.calls
+
+    def to_dict(self):
+        return {"wall_seconds": self.wall, "calls": self.calls}
+
+
+class StageTimings:
+
+    """Stage of each of STAGES, by name, along with the wall and CPU time since creation"""
+
+    def __init__(self):
+        self.stages = OrderedDict((name, Stage()) for name in STAGES)
+        self.wall_start = perf_counter()
+        self.cpu_start = process_time()
+
+    def __getitem__(self, name):
+        return self.stages[name]
+
+    def iterate(self, name, iterable):
+        """Yields the items of iterable, adding the time taken to get each one to stage name"""
+        stage = self.stages[name]
+        iterator = iter(iterable)
+        while True:
+            with stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def merge(self, other):
+        for name, stage in other.stages.items():
+            self.stages[name].merge(stage)
+
+    def get_wall_time(self):
+        return perf_counter() - self.wall_start
+
+    def get_cpu_time(self):
+        """CPU time of this process only, so it doesn't include that of any worker processes"""
+        return process_time() - self.cpu_start
+
+    def to_dict(self):
+        return {"wall_seconds": self.get_wall_time(), "cpu_seconds": self.get_cpu_time(),
+                "stages": OrderedDict((name, stage.to_dict())
+                                      for name, stage in self.stages.items())}
+
+    def __str__(self):
+        timing_strings = [
+            '{:.2f} s wall time, {:.2f} s CPU time in the main process'.format(
+                self.get_wall_time(), self.get_cpu_time()),
+            'Time per stage, summed over processes (wall s, times entered):']
+        timing_strings.extend(
+            ' {}: {:.2f}, {}'.format(STAGES[name], stage.wall, stage.calls)
+            for name, stage in self.stages.items())
+        return '\n'.join(timing_strings)
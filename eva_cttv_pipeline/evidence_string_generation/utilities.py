@@ -1,6 +1,7 @@
 import argparse
 import errno
 import gzip
+import io
 import subprocess
 import sys
 import importlib
@@ -8,17 +9,69 @@ import importlib._bootstrap
 import importlib.util
 import os
 import shutil
+import signal
 
 from eva_cttv_pipeline.evidence_string_generation import config
 
 
 def open_file(file_path, mode):
     if file_path.endswith(".gz"):
+        if config.PARALLEL_DECOMPRESSION and mode in ("r", "rt", "rb"):
+            decompressor = get_decompressor()
+            if decompressor is not None:
+                return DecompressorPipe(decompressor, file_path, mode)
         return gzip.open(file_path, mode)
     else:
         return open(file_path, mode)
 
 
+def get_decompressor():
+    """Return the command of the first decompressor in config.DECOMPRESSORS installed, if any"""
+    for decompressor in config.DECOMPRESSORS:
+        if shutil.which(decompressor[0]) is not None:
+            return decompressor
+    return None
+
+
+class DecompressorPipe:
+
+    """
+    Reader of a gzipped file decompressed by an external process, so that decompression runs in
+    parallel with (and, with a multi-threaded decompressor, faster than) whatever reads the lines.
+    The pipe from the process is a bounded buffer: the decompressor waits while it is full.
+    """
+
+    def __init__(self, decompressor, file_path, mode):
+        self.file_path = file_path
+        self.process = subprocess.Popen(decompressor + [file_path], stdout=subprocess.PIPE,
+                                        bufsize=config.DECOMPRESSION_BUFFER_SIZE)
+        if "b" in mode:
+            self.file = self.process.stdout
+        else:
+            self.file = io.TextIOWrapper(self.process.stdout)
+
+    def __iter__(self):
+        return iter(self.file)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.close()
+        # If the file wasn't read to the end, the decompressor is stopped by SIGPIPE
+        if self.process.wait() not in (0, -signal.SIGPIPE):
+            raise OSError("Decompressing {} with {} failed".format(self.file_path,
+                                                                  self.process.args[0]))
+
+
 def get_resource_file(package, resource):
     spec = importlib.util.find_spec(package)
     if spec is None:
@@ -165,8 +218,88 @@ class ArgParser:
         parser.add_argument("-j", dest="json_file", help="File containing Clinvar records json "
                                                          "strings in the format of documents in "
                                                          "Cellbase. One record per line.")
+        parser.add_argument("--workers", dest="workers", type=int, default=1,
+                            help="""Optional. Number of processes to use to generate evidence
+                            strings. Output is the same regardless of the number of processes.""")
+        parser.add_argument("--quarantine", dest="quarantine", action="store_true",
+                            default=False,
+                            help="""Optional. Write evidence strings which fail validation, with
+                            the validation error, to a file in the output directory rather than
+                            stopping on the first one.""")
+        parser.add_argument("--validationWorkers", dest="validation_workers", type=int,
+                            default=0,
+                            help="""Optional. Number of processes to use to validate evidence
+                            strings as a separate stage, concurrently with their generation. Not
+                            used with --workers, where validation already takes place in the
+                            worker processes, and can not be used with --incremental or
+                            --checkpoint.""")
+        parser.add_argument("--preFilterClinSig", dest="prefilter_clin_sig", action="store_true",
+                            default=False,
+                            help="""Optional. Skip ClinVar records without an allowed clinical
+                            significance before parsing them, which is much faster. These records
+                            are then only counted as such in the report: their nsvs, allele
+                            origins and unmapped traits are not counted, nor written to nsvlist.txt
+                            and unmappedTraits.tsv, which then only cover the records with an
+                            allowed clinical significance.""")
+        parser.add_argument("--incremental", dest="incremental", action="store_true",
+                            default=False,
+                            help="""Optional. Write a manifest of the ClinVar records processed to
+                            the output directory, so a later run can reuse their evidence strings
+                            with --previousRun. Records are processed in a single process, so
+                            --workers is not used, and --validationWorkers can not be.""")
+        parser.add_argument("--previousRun", dest="previous_run_dir", default=None,
+                            help="""Optional. Output directory of an earlier run with
+                            --incremental. The evidence strings of ClinVar records which, along
+                            with their mappings, haven't changed since are taken from it rather
+                            than generated again. Implies --incremental.""")
+        parser.add_argument("--checkpoint", dest="checkpoints", action="store_true",
+                            default=False,
+                            help="""Optional. Write checkpoints of the run to the output directory,
+                            so that it can be resumed with --resume if it stops.""")
+        parser.add_argument("--resume", dest="resume", action="store_true", default=False,
+                            help="""Optional. Resume the run with the same input and settings in
+                            the output directory from its last checkpoint. The output is the same
+                            as that of a run which didn't stop. Implies --checkpoint.""")
+        parser.add_argument("--efoIndex", dest="efo_index", default=None,
+                            help="""Optional. Index of an EFO release, built with
+                            bin/build_efo_index.py, to check EFO terms against instead of the
+                            snapshot queried from the EFO SPARQL endpoint.""")
+        parser.add_argument("--mostSevereConsequence", dest="most_severe_consequence",
+                            action="store_true", default=False,
+                            help="""Optional. Generate evidence strings only for the most severe
+                            consequence of a variant on each gene, rather than for each of its
+                            consequences.""")
+        parser.add_argument("--shardBy", dest="shard_by", default=None,
+                            choices=["count", "size", "hash"],
+                            help="""Optional. Write evidence strings to gzipped shards, listed
+                            with their number of evidence strings and checksums in a manifest,
+                            rather than to a single file. Shards hold up to --shardLimit evidence
+                            strings (count) or bytes of uncompressed evidence strings (size), or
+                            there are --shardLimit shards, by hash of the unique association
+                            fields (hash), at most {}. Not used with --incremental or
+                            --checkpoint.""".format(config.SHARD_MAX_HASH_SHARDS))
+        parser.add_argument("--shardLimit", dest="shard_limit", type=int, default=None,
+                            help="""Optional. Maximum number of evidence strings or bytes of a
+                            shard, or number of shards, with --shardBy.""")
+        parser.add_argument("--deduplicate", dest="deduplicate", default=None,
+                            choices=["first", "last", "most_severe"],
+                            help="""Optional. Write a single evidence string for each set of
+                            unique association fields, keeping the first, the last or that with
+                            the most severe functional consequence. Not used with --incremental or
+                            --checkpoint.""")
+        parser.add_argument("--consequenceTypeIndexDir", dest="consequence_type_index_dir",
+                            default=None,
+                            help="""Optional. Directory in which the index of the snp2gene file is
+                            built and kept for later runs. By default a directory in the system's
+                            temporary directory. Once a new index is built, those of earlier
+                            versions of a snp2gene file of the same name are removed from it.""")
 
         args = parser.parse_args(args=argv[1:])
+        if args.shard_by is not None and args.shard_limit is None:
+            parser.error("--shardBy requires --shardLimit")
+        if args.shard_by == "hash" and args.shard_limit > config.SHARD_MAX_HASH_SHARDS:
+            parser.error("--shardBy hash allows at most {} shards".format(
+                config.SHARD_MAX_HASH_SHARDS))
 
         self.clinical_significance = args.clinical_significance
         self.ignore_terms_file = args.ignore_terms_file
@@ -175,6 +308,20 @@ class ArgParser:
         self.efo_mapping_file = args.efo_mapping_file
         self.snp_2_gene_file = args.snp_2_gene_file
         self.json_file = args.json_file
+        self.workers = args.workers
+        self.quarantine = args.quarantine
+        self.validation_workers = args.validation_workers
+        self.prefilter_clin_sig = args.prefilter_clin_sig
+        self.most_severe_consequence = args.most_severe_consequence
+        self.efo_index = args.efo_index
+        self.incremental = args.incremental
+        self.previous_run_dir = args.previous_run_dir
+        self.checkpoints = args.checkpoints
+        self.resume = args.resume
+        self.shard_by = args.shard_by
+        self.shard_limit = args.shard_limit
+        self.deduplicate = args.deduplicate
+        self.consequence_type_index_dir = args.consequence_type_index_dir
 
 
 def check_dir_exists_create(directory):
@@ -0,0 +1,146 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from functools import lru_cache
+
+import jsonschema
+
+from eva_cttv_pipeline import json_codec
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import efo_term
+from eva_cttv_pipeline.evidence_string_generation import schema_compiler
+from eva_cttv_pipeline.evidence_string_generation import utilities
+
+
+@lru_cache(maxsize=None)
+def get_validator(schema_file):
+    """
+    Return a validator for the json schema in schema_file, built once per process. The validator
+    keeps its ref resolver, which caches every $ref it resolves (including the file:// refs into
+    the local copy of the schema), so later evidence strings don't resolve them again.
+
+    :param schema_file: Path to a json schema file.
+    :return: jsonschema validator instance of the class appropriate for the schema's draft.
+    """
+    with utilities.open_file(schema_file, 'rt') as f:
+        schema = json.load(f)
+    validator_class = jsonschema.validators.validator_for(schema)
+    validator_class.check_schema(schema)
+    return validator_class(schema, resolver=jsonschema.RefResolver.from_schema(schema),
+                           format_checker=jsonschema.FormatChecker())
+
+
+def get_compiled_schema_dir(schema_file):
+    """
+    Directory the code compiled from schema_file is cached in, inside the local copy of the
+    schema. None if the schema file isn't part of the local copy of the schema.
+    """
+    local_schema_dir = utilities.get_resource_file(__package__, config.LOCAL_SCHEMA)
+    if local_schema_dir is None or not os.path.exists(os.path.join(local_schema_dir, "READY")) \
+            or not os.path.abspath(schema_file).startswith(os.path.abspath(local_schema_dir)):
+        return None
+    return utilities.get_resource_file(__package__, config.COMPILED_SCHEMA_DIR)
+
+
+@lru_cache(maxsize=None)
+def get_fast_validator(schema_file):
+    """
+    Return the validator used for evidence strings: one using code compiled from the schema if
+    config.COMPILE_SCHEMA is set and the schema can be compiled, otherwise the jsonschema one.
+    Either way invalid evidence strings raise the jsonschema ValidationError.
+    """
+    validator = get_validator(schema_file)
+    if config.COMPILE_SCHEMA:
+        compiled_validator = schema_compiler.get_compiled_validator(
+            schema_file, validator, get_compiled_schema_dir(schema_file))
+        if compiled_validator is not None:
+            return compiled_validator
+    return validator
+
+
+def validate_evidence_string(evidence_string, schema_file):
+    """
+    Validate an evidence string (as a dict) against the schema in schema_file and check that its
+    disease term isn't obsolete. Raises jsonschema.exceptions.ValidationError or
+    efo_term.EFOTerm.IsObsoleteException on the first problem found.
+    """
+    get_fast_validator(schema_file).validate(evidence_string)
+    efo_term.EFOTerm(evidence_string['disease']['id']).is_obsolete()
+    return True
+
+
+def _validate_batch(batch):
+    """
+    Runs in a ValidationStage worker process. Validates a batch of (serialised evidence string,
+    schema file) pairs, returning an error message, or None if valid, for each of them.
+    """
+    errors = []
+    for evidence_string_line, schema_file in batch:
+        try:
+            validate_evidence_string(json_codec.loads(evidence_string_line), schema_file)
+            errors.append(None)
+        except (jsonschema.exceptions.ValidationError,
+                efo_term.EFOTerm.IsObsoleteException) as err:
+            errors.append(str(err))
+    return errors
+
+
+class ValidationStage:
+
+    """
+    Validates serialised evidence strings in a pool of processes, concurrently with the
+    generation of further evidence strings in the main process. Evidence strings are submitted in
+    batches and their results are handed back in the order they were submitted.
+    """
+
+    def __init__(self, workers, batch_size=config.VALIDATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.max_pending = 2 * workers
+        self.batch = []
+        self.pending = deque()
+        # fork, so the workers don't need to re-import the schema and EFO term lists
+        self.pool = multiprocessing.get_context('fork').Pool(workers)
+
+    def submit(self, evidence_string, evidence_string_line, context=None):
+        """
+        Queue an evidence string for validation, along with any context to hand back with it.
+        Returns a list of (evidence string, serialised evidence string, error message or None,
+        context) tuples for any batches that have finished.
+        """
+        self.batch.append((evidence_string, evidence_string_line, context))
+        if len(self.batch) < self.batch_size:
+            return []
+        self._submit_batch()
+        results = []
+        # Bound the number of batches in flight so memory use stays flat
+        while len(self.pending) >= self.max_pending or \
+                (self.pending and self.pending[0][1].ready()):
+            results.extend(self._collect_batch())
+        return results
+
+    def close(self):
+        """Wait for every queued evidence string to be validated and return the results."""
+        if self.batch:
+            self._submit_batch()
+        results = []
+        while self.pending:
+            results.extend(self._collect_batch())
+        self.pool.close()
+        self.pool.join()
+        return results
+
+    def terminate(self):
+        """Stop the worker processes straight away, dropping any evidence strings still queued"""
+        self.pool.terminate()
+        self.pool.join()
+
+    def _submit_batch(self):
+        jobs = [(line, evidence_string.schema_file) for evidence_string, line, _ in self.batch]
+        self.pending.append((self.batch, self.pool.apply_async(_validate_batch, (jobs,))))
+        self.batch = []
+
+    def _collect_batch(self):
+        batch, result = self.pending.popleft()
+        return [(evidence_string, line, error, context)
+                for (evidence_string, line, context), error in zip(batch, result.get())]
@@ -0,0 +1,122 @@
+"""
+JSON parsing and serialisation using the fastest available backend.
+
+Parsing uses the first installed backend (orjson, ujson, stdlib json) which decodes the sample
+documents below exactly as the stdlib json module does; if it fails on a document, the document is
+parsed again with the stdlib json module, which raises the usual errors. Serialisation must give
+output identical to json.dumps, byte for byte, so a backend is only used for it if it passes the
+same check.
+"""
+
+import importlib
+import json
+import os
+
+
+# Environment variable naming the backend to use, e.g. to compare them
+BACKEND_ENV_VAR = "EVA_JSON_BACKEND"
+
+# Documents the output of a backend is compared against the stdlib json module's for
+SAMPLE_DOCUMENTS = [
+    '{"b": 1, "a": [1.0, 1e-07, 0.1, -0.0, 12345678901234567890, true, false, null]}',
+    '{"s": "caf\\u00e9 \\"quoted\\" back\\\\slash / tab\\t \\ud83d\\ude00 \\u2028"}',
+    '{"nested": {"empty": {}, "list": [[], {}, ""]}, "z": 0, "y": -1.5e+300}',
+    '["é", 3.141592653589793, 2.5, 100]',
+]
+
+
+class Backend:
+
+    """A JSON backend: its name and its loads and dumps functions (None if not supported)"""
+
+    def __init__(self, name, loads, dumps):
+        self.name = name
+        self.loads = loads
+        self.dumps = dumps
+
+    def __repr__(self):
+        return "Backend({!r})".format(self.name)
+
+
+def _orjson_backend(module):
+    # orjson only serialises compactly, so its output is never the same as json.dumps'
+    return Backend("orjson", module.loads, lambda obj: module.dumps(obj).decode())
+
+
+def _ujson_backend(module):
+    return Backend("ujson", module.loads, module.dumps)
+
+
+def _simdjson_backend(module):
+    return Backend("simdjson", module.loads, None)
+
+
+BACKEND_FACTORIES = [("orjson", _orjson_backend), ("ujson", _ujson_backend),
+                     ("simdjson", _simdjson_backend)]
+
+STDLIB_BACKEND = Backend("json", json.loads, json.dumps)
+
+
+def get_available_backends():
+    """Return every backend which is installed, the stdlib one last."""
+    backends = []
+    for module_name, factory in BACKEND_FACTORIES:
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError:
+            continue
+        backends.append(factory(module))
+    backends.append(STDLIB_BACKEND)
+    return backends
+
+
+def loads_identical(backend):
+    """Check that backend parses the sample documents exactly as the stdlib json module does."""
+    try:
+        # Compared through json.dumps, which also tells apart key order, 1 and 1.0, etc.
+        return all(json.dumps(backend.loads(document)) == json.dumps(json.loads(document))
+                   for document in SAMPLE_DOCUMENTS)
+    except Exception:
+        return False
+
+
+def dumps_identical(backend):
+    """Check that backend serialises the sample documents exactly as json.dumps does."""
+    if backend.dumps is None:
+        return False
+    try:
+        return all(backend.dumps(json.loads(document)) == json.dumps(json.loads(document))
+                   for document in SAMPLE_DOCUMENTS)
+    except Exception:
+        return False
+
+
+def select_backends(name=None):
+    """
+    Choose the backends used by loads and dumps: the named backend for both, if it is available
+    and gives identical results, otherwise the first of the available ones which does.
+    """
+    global loads_backend, dumps_backend
+    backends = get_available_backends()
+    if name is not None:
+        backends = [backend for backend in backends if backend.name == name] + [STDLIB_BACKEND]
+    loads_backend = next(backend for backend in backends if loads_identical(backend))
+    dumps_backend = next(backend for backend in backends if dumps_identical(backend))
+    return loads_backend, dumps_backend
+
+
+loads_backend = dumps_backend = None
+select_backends(os.environ.get(BACKEND_ENV_VAR))
+
+
+def loads(s):
+    try:
+        return loads_backend.loads(s)
+    except Exception:
+        # Let the stdlib module handle (or raise the usual exception for) anything unusual, such
+        # as NaN or integers too large for the backend
+        return json.loads(s)
+
+
+def dumps(obj):
+    return dumps_backend.dumps(obj)
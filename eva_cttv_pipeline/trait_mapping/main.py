@@ -1,12 +1,15 @@
-from collections import Counter
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import progressbar
 
+from eva_cttv_pipeline.trait_mapping import response_cache
 from eva_cttv_pipeline.trait_mapping.output import output_trait
 from eva_cttv_pipeline.trait_mapping.oxo import get_oxo_results
 from eva_cttv_pipeline.trait_mapping.oxo import uris_to_oxo_format
 from eva_cttv_pipeline.trait_mapping.trait import Trait
 from eva_cttv_pipeline.trait_mapping.trait_names_parsing import parse_trait_names
+from eva_cttv_pipeline.trait_mapping.utils import set_service_concurrency
 from eva_cttv_pipeline.trait_mapping.zooma import get_zooma_results
 
 
@@ -59,11 +62,33 @@ def process_trait(trait: Trait, filters: dict, zooma_host: str, oxo_target_list:
     return trait
 
 
-def main(input_filepath, output_mappings_filepath, output_curation_filepath, filters, zooma_host,
-         oxo_target_list, oxo_distance):
-    trait_names_list = parse_trait_names(input_filepath)
-    trait_names_counter = Counter(trait_names_list)
+def process_traits(traits, filters: dict, zooma_host: str, oxo_target_list: list,
+                   oxo_distance: int, workers: int = 1):
+    """
+    Process traits with process_trait, yielding each one once processed, in the order given.
+
+    With more than one worker, traits are processed in a pool of that many threads, each waiting on
+    its requests to Zooma, OLS and OxO while the others run. Up to twice as many traits as workers
+    are in flight, so that a slow trait doesn't hold up the ones after it for long.
+    """
+    if workers <= 1:
+        for trait in traits:
+            yield process_trait(trait, filters, zooma_host, oxo_target_list, oxo_distance)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = deque()
+        for trait in traits:
+            futures.append(executor.submit(process_trait, trait, filters, zooma_host,
+                                           oxo_target_list, oxo_distance))
+            if len(futures) >= 2 * workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
 
+
+def map_traits(trait_names_counter, output_mappings_filepath, output_curation_filepath, filters,
+               zooma_host, oxo_target_list, oxo_distance, workers):
     with open(output_mappings_filepath, "w", newline='') as mapping_file, \
             open(output_curation_filepath, "wt") as curation_file:
         mapping_writer = csv.writer(mapping_file, delimiter="\t")
@@ -73,8 +98,30 @@ def main(input_filepath, output_mappings_filepath, output_curation_filepath, fil
         bar = progressbar.ProgressBar(max_value=len(trait_names_counter),
                                       widgets=[progressbar.AdaptiveETA(samples=1000)])
 
-        for trait_name, freq in bar(trait_names_counter.items()):
-            trait = Trait(trait_name, freq)
-            trait = process_trait(trait, filters, zooma_host, oxo_target_list,
-                                  oxo_distance)
+        traits = (Trait(trait_name, freq) for trait_name, freq in trait_names_counter.items())
+        for trait in bar(process_traits(traits, filters, zooma_host, oxo_target_list,
+                                        oxo_distance, workers)):
             output_trait(trait, mapping_writer, curation_writer)
+
+
+def main(input_filepath, output_mappings_filepath, output_curation_filepath, filters, zooma_host,
+         oxo_target_list, oxo_distance, workers=1, service_concurrency=None, cache_dir=None,
+         cache_max_size=response_cache.DEFAULT_MAX_SIZE):
+    trait_names_list = parse_trait_names(input_filepath)
+    trait_names_counter = Counter(trait_names_list)
+    if service_concurrency is not None:
+        set_service_concurrency(service_concurrency)
+
+    if cache_dir is None:
+        map_traits(trait_names_counter, output_mappings_filepath, output_curation_filepath, filters,
+                   zooma_host, oxo_target_list, oxo_distance, workers)
+        return
+    cache = response_cache.ResponseCache(cache_dir, cache_max_size)
+    response_cache.use_response_cache(cache)
+    try:
+        map_traits(trait_names_counter, output_mappings_filepath, output_curation_filepath, filters,
+                   zooma_host, oxo_target_list, oxo_distance, workers)
+    finally:
+        response_cache.use_response_cache(None)
+        cache.close()
+    print(cache.format_stats())
@@ -1,9 +1,30 @@
+from collections import namedtuple
 from functools import lru_cache
 import logging
-import requests
 import urllib
 
-from eva_cttv_pipeline.trait_mapping.utils import request_retry_helper
+from eva_cttv_pipeline.trait_mapping.response_cache import JsonResponse
+from eva_cttv_pipeline.trait_mapping.utils import request_json, request_retry_helper
+
+
+TermStatus = namedtuple("TermStatus", ["label", "in_efo", "is_current"])
+
+# If set, by use_efo_index, EFO terms are looked up in this eva_cttv_pipeline.efo_index.EFOIndex
+# rather than in OLS
+efo_index = None
+
+
+def use_efo_index(index):
+    """
+    Look up EFO terms in an index of an EFO release rather than in OLS.
+
+    :param index: eva_cttv_pipeline.efo_index.EFOIndex to use, or None to query OLS again.
+    """
+    global efo_index
+    efo_index = index
+    for cached_function in (get_ontology_label_from_ols, is_current_and_in_efo, is_in_efo,
+                            get_term_status):
+        cached_function.cache_clear()
 
 
 def get_label_from_ols(url: str) -> str:
@@ -15,7 +36,7 @@ def get_label_from_ols(url: str) -> str:
     :return: The ontology label of the term specified in the url.
     """
     try:
-        json_response = requests.get(url).json()
+        json_response = request_json("ols", url).json
         for term in json_response["_embedded"]["terms"]:
             if term["is_defining_ontology"]:
                 return term["label"]
@@ -33,6 +54,8 @@ def get_ontology_label_from_ols(ontology_uri: str) -> str:
     :param ontology_uri: A uri for a term in an ontology.
     :return: Term label for the ontology uri provided in the parameters.
     """
+    if efo_index is not None and ontology_uri in efo_index:
+        return efo_index.get_label(ontology_uri)
     url = build_ols_query(ontology_uri)
     label = request_retry_helper(get_label_from_ols, 4, url)
     return label
@@ -48,16 +71,16 @@ def double_encode_uri(uri: str) -> str:
     return urllib.parse.quote(urllib.parse.quote(uri, safe=""), safe="")
 
 
-def ols_efo_query(uri: str) -> requests.Response:
+def ols_efo_query(uri: str) -> JsonResponse:
     """
     Query EFO using OLS for a given ontology uri, returning the response from the request.
 
     :param uri: Ontology uri to use in querying EFO using OLS
-    :return: Response from OLS
+    :return: JsonResponse with the status code and json of the response from OLS
     """
     double_encoded_uri = double_encode_uri(uri)
-    return requests.get(
-        "http://www.ebi.ac.uk/ols/api/ontologies/efo/terms/{}".format(double_encoded_uri))
+    return request_json(
+        "ols", "http://www.ebi.ac.uk/ols/api/ontologies/efo/terms/{}".format(double_encoded_uri))
 
 
 @lru_cache(maxsize=16384)
@@ -68,11 +91,12 @@ def is_current_and_in_efo(uri: str) -> bool:
     :param uri: Ontology uri to use in querying EFO using OLS
     :return: Boolean value, true if ontology uri is valid and non-obsolete term in EFO
     """
+    if efo_index is not None:
+        return efo_index.is_current_and_in_efo(uri)
     response = ols_efo_query(uri)
     if response.status_code != 200:
         return False
-    response_json = response.json()
-    return not response_json["is_obsolete"]
+    return not response.json["is_obsolete"]
 
 
 @lru_cache(maxsize=16384)
@@ -83,5 +107,31 @@ def is_in_efo(uri: str) -> bool:
     :param uri: Ontology uri to use in querying EFO using OLS
     :return: Boolean value, true if ontology uri is valid and non-obsolete term in EFO
     """
+    if efo_index is not None:
+        return efo_index.is_in_efo(uri)
     response = ols_efo_query(uri)
     return response.status_code == 200
+
+
+@lru_cache(maxsize=16384)
+def get_term_status(uri: str) -> TermStatus:
+    """
+    Look up the label of an ontology term and whether it is in EFO and not obsolete there. The term
+    is queried in EFO, which gives its label too if EFO is its defining ontology, and its label is
+    only queried separately otherwise. This replaces calling get_ontology_label_from_ols,
+    is_current_and_in_efo and is_in_efo, which make up to three requests for the same term.
+
+    :param uri: Ontology uri to look up
+    :return: TermStatus with the term label, or None if it couldn't be found, whether the term is
+             in EFO, and whether it is in EFO and not obsolete.
+    """
+    if efo_index is not None:
+        return TermStatus(get_ontology_label_from_ols(uri), efo_index.is_in_efo(uri),
+                          efo_index.is_current_and_in_efo(uri))
+    response = ols_efo_query(uri)
+    if response.status_code != 200:
+        return TermStatus(get_ontology_label_from_ols(uri), False, False)
+    is_current = not response.json["is_obsolete"]
+    if response.json.get("is_defining_ontology") and response.json.get("label") is not None:
+        return TermStatus(response.json["label"], True, is_current)
+    return TermStatus(get_ontology_label_from_ols(uri), True, is_current)
@@ -1,10 +1,8 @@
-from functools import total_ordering, lru_cache
-import json
+from functools import partial, total_ordering, lru_cache
 import re
-import requests
 
-from eva_cttv_pipeline.trait_mapping.ols import get_ontology_label_from_ols, is_in_efo
-from eva_cttv_pipeline.trait_mapping.ols import is_current_and_in_efo
+from eva_cttv_pipeline.trait_mapping.ols import get_term_status
+from eva_cttv_pipeline.trait_mapping.utils import request_json, request_retry_helper
 
 
 class OntologyUri:
@@ -158,11 +156,7 @@ def oxo_query_helper(url: str, payload: dict) -> dict:
     :param payload: Payload to use to make POST request
     :return: json response from OxO
     """
-    try:
-        json_response = requests.post(url, data=payload).json()
-        return json_response
-    except json.decoder.JSONDecodeError as e:
-        return None
+    return request_json("oxo", url, payload).json
 
 
 def oxo_request_retry_helper(retry_count: int, url: str, id_list: list, target_list: list,
@@ -179,14 +173,7 @@ def oxo_request_retry_helper(retry_count: int, url: str, id_list: list, target_l
     :return: Returned value from OxO request.
     """
     payload = build_oxo_payload(id_list, target_list, distance)
-    for retry_num in range(retry_count):
-        return_value = oxo_query_helper(url, payload)
-        if return_value is not None:
-            return return_value
-        print("attempt {}: failed running function oxo_query_helper with url {}".format(retry_num,
-                                                                                        url))
-    print("error on last attempt, skipping")
-    return None
+    return request_retry_helper(partial(oxo_query_helper, payload=payload), retry_count, url)
 
 
 def get_oxo_results_from_response(oxo_response: dict) -> list:
@@ -213,17 +200,12 @@ def get_oxo_results_from_response(oxo_response: dict) -> list:
 
             uri = str(oxo_mapping.uri)
 
-            ontology_label = get_ontology_label_from_ols(uri)
-            if ontology_label is not None:
-                oxo_mapping.ontology_label = ontology_label
-
-            uri_is_current_and_in_efo = is_current_and_in_efo(uri)
-            if not uri_is_current_and_in_efo:
-                uri_is_in_efo = is_in_efo(uri)
-                oxo_mapping.in_efo = uri_is_in_efo
-            else:
-                oxo_mapping.in_efo = uri_is_current_and_in_efo
-                oxo_mapping.is_current = uri_is_current_and_in_efo
+            term_status = get_term_status(uri)
+            if term_status.label is not None:
+                oxo_mapping.ontology_label = term_status.label
+
+            oxo_mapping.in_efo = term_status.in_efo
+            oxo_mapping.is_current = term_status.is_current
 
             oxo_result.mapping_list.append(oxo_mapping)
 
@@ -0,0 +1,188 @@
+"""
+Cache of the responses of Zooma, OLS and OxO, kept in a SQLite database so that a later run of
+trait mapping doesn't make the same requests again. Responses are keyed by the request, with the
+parameters of its url and its payload in order, and are kept for a time depending on the service.
+Negative responses, a status other than 200 or an empty result, are kept for a shorter time, as
+they are more likely to change. Once the cached responses take up more than the size given, those
+used longest ago are removed.
+
+Only responses which could be decoded and are either successful or a 404 are cached, so that
+requests which failed are made again.
+"""
+
+from collections import Counter, namedtuple
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+
+
+CACHE_FILE_NAME = "responses.sqlite"
+
+DAY = 24 * 60 * 60
+
+# Seconds for which responses of each service are used from the cache
+SERVICE_TTLS = {"zooma": 7 * DAY, "ols": 30 * DAY, "oxo": 30 * DAY}
+DEFAULT_TTL = 7 * DAY
+NEGATIVE_TTL = DAY
+
+# Bytes of responses kept in the cache
+DEFAULT_MAX_SIZE = 1024 * 1024 * 1024
+# Once over the maximum size, responses are removed until they are down to this part of it, so
+# that not every new response needs another eviction
+EVICTION_TARGET = 0.9
+
+# Writes made before committing them to the database
+COMMIT_INTERVAL = 1000
+
+JsonResponse = namedtuple("JsonResponse", ["status_code", "json"])
+
+
+def get_request_key(method: str, url: str, payload: dict = None) -> str:
+    """
+    Key of a request in the cache, the same for requests differing only in the order of the
+    parameters of the url or payload.
+    """
+    parsed_url = urllib.parse.urlsplit(url)
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(parsed_url.query,
+                                                                 keep_blank_values=True)))
+    normalised_url = urllib.parse.urlunsplit((parsed_url.scheme.lower(),
+                                              parsed_url.netloc.lower(), parsed_url.path, query,
+                                              ""))
+    return json.dumps([method.upper(), normalised_url, payload], sort_keys=True)
+
+
+def is_cacheable(response: JsonResponse) -> bool:
+    return response.json is not None and response.status_code in (200, 404)
+
+
+def is_negative(response: JsonResponse) -> bool:
+    return response.status_code != 200 or not response.json
+
+
+class ResponseCache:
+
+    """
+    Responses cached in a SQLite database in cache_dir. Safe to use from several threads.
+    Statistics of the use of the cache are kept by service in stats.
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_SIZE, service_ttls=None,
+                 negative_ttl: int = NEGATIVE_TTL):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_file = os.path.join(cache_dir, CACHE_FILE_NAME)
+        self.max_size = max_size
+        self.service_ttls = service_ttls if service_ttls is not None else SERVICE_TTLS
+        self.negative_ttl = negative_ttl
+        self.stats = {}
+        self.lock = threading.Lock()
+        self.n_writes = 0
+
+        self.connection = sqlite3.connect(self.cache_file, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS response (key TEXT PRIMARY KEY, "
+                                "service TEXT, status_code INTEGER, body TEXT, size INTEGER, "
+                                "negative INTEGER, created REAL, used REAL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS response_used ON response (used)")
+        self.size = self.connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM response").fetchone()[0]
+
+    def _count(self, service, event):
+        self.stats.setdefault(service, Counter())[event] += 1
+
+    def _get_ttl(self, service, negative):
+        if negative:
+            return self.negative_ttl
+        return self.service_ttls.get(service, DEFAULT_TTL)
+
+    def get(self, service: str, key: str) -> JsonResponse:
+        """The cached response to the request with the key given, or None if there is none"""
+        now = time.time()
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT status_code, body, negative, created FROM response WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                self._count(service, "misses")
+                return None
+            status_code, body, negative, created = row
+            if now - created > self._get_ttl(service, negative):
+                self._count(service, "expired")
+                return None
+            self._count(service, "negative_hits" if negative else "hits")
+            self.connection.execute("UPDATE response SET used = ? WHERE key = ?", (now, key))
+            self._written()
+        return JsonResponse(status_code, json.loads(body))
+
+    def put(self, service: str, key: str, response: JsonResponse):
+        """Cache the response to the request with the key given, if it can be cached"""
+        if not is_cacheable(response):
+            return
+        body = json.dumps(response.json)
+        size = len(key) + len(body)
+        now = time.time()
+        with self.lock:
+            old_row = self.connection.execute("SELECT size FROM response WHERE key = ?",
+                                              (key,)).fetchone()
+            self.connection.execute(
+                "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, service, response.status_code, body, size, is_negative(response), now, now))
+            self.size += size - (old_row[0] if old_row is not None else 0)
+            if self.size > self.max_size:
+                self._evict()
+            self._written()
+
+    def _evict(self):
+        """Remove the responses used longest ago, until under the target size"""
+        target_size = self.max_size * EVICTION_TARGET
+        removed_keys = []
+        for key, service, size in self.connection.execute(
+                "SELECT key, service, size FROM response ORDER BY used"):
+            if self.size <= target_size:
+                break
+            removed_keys.append((key,))
+            self.size -= size
+            self._count(service, "evictions")
+        self.connection.executemany("DELETE FROM response WHERE key = ?", removed_keys)
+
+    def _written(self):
+        self.n_writes += 1
+        if self.n_writes >= COMMIT_INTERVAL:
+            self.connection.commit()
+            self.n_writes = 0
+
+    def format_stats(self) -> str:
+        lines = ["Response cache {}:".format(self.cache_file)]
+        for service in sorted(self.stats):
+            stats = self.stats[service]
+            n_requests = stats["hits"] + stats["negative_hits"] + stats["misses"] + \
+                stats["expired"]
+            hit_rate = (stats["hits"] + stats["negative_hits"]) / n_requests if n_requests else 0
+            lines.append("  {}: {} hits, {} negative hits, {} misses, {} expired, {} evicted "
+                         "({:.1%} hit rate)".format(service, stats["hits"], stats["negative_hits"],
+                                                    stats["misses"], stats["expired"],
+                                                    stats["evictions"], hit_rate))
+        return "\n".join(lines)
+
+    def close(self):
+        with self.lock:
+            self.connection.commit()
+            self.connection.close()
+
+
+# If set, by use_response_cache, responses of Zooma, OLS and OxO are looked up in this
+# ResponseCache before making requests
+response_cache = None
+
+
+def use_response_cache(cache):
+    """
+    Cache the responses of Zooma, OLS and OxO in a ResponseCache.
+
+    :param cache: ResponseCache to use, or None to make every request again.
+    """
+    global response_cache
+    response_cache = cache
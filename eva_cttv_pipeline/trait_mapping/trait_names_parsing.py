@@ -1,5 +1,6 @@
 import gzip
-import json
+
+from eva_cttv_pipeline import json_codec
 
 
 def clinvar_jsons(filepath: str) -> dict:
@@ -13,7 +14,7 @@ def clinvar_jsons(filepath: str) -> dict:
     with gzip.open(filepath, "rt") as f:
         for line in f:
             line = line.rstrip()
-            yield json.loads(line)
+            yield json_codec.loads(line)
 
 
 def get_trait_names(clinvar_json: dict) -> list:
@@ -1,3 +1,107 @@
+import threading
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from eva_cttv_pipeline.trait_mapping import response_cache
+
+
+# Connections to each host kept open to be reused by later requests, at least as many as requests
+# made to a host at once
+HTTP_POOL_SIZE = 10
+
+# Adapter holding the pools of connections shared by every request to Zooma, OLS and OxO, and the
+# session of each thread using it
+http_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+thread_sessions = threading.local()
+
+
+# Semaphore limiting the number of requests in flight to each web service, when traits are
+# processed concurrently. Set with set_service_concurrency.
+service_semaphores = {}
+
+
+def set_service_concurrency(service_concurrency: dict):
+    """
+    Limit the number of requests made at once to each web service.
+
+    :param service_concurrency: dict of the maximum number of requests in flight by service name
+                                ("zooma", "ols" or "oxo"). Services not in it are not limited.
+    """
+    service_semaphores.clear()
+    for service, limit in service_concurrency.items():
+        service_semaphores[service] = threading.BoundedSemaphore(limit)
+    set_http_pool_size(max([HTTP_POOL_SIZE] + list(service_concurrency.values())))
+
+
+def set_http_pool_size(pool_size: int):
+    """
+    Keep up to pool_size connections open to each host. Connections already open are closed, to
+    be opened again as needed.
+    """
+    global http_adapter
+    http_adapter.close()
+    http_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=pool_size)
+
+
+def get_session() -> requests.Session:
+    """
+    Session to make requests to Zooma, OLS and OxO with, keeping connections alive for later
+    requests and accepting compressed responses. Sessions aren't safe to share between threads, so
+    each thread gets its own, all of them using the same pools of connections.
+    """
+    session = getattr(thread_sessions, "session", None)
+    # Sessions from before the pool size was last set are replaced
+    if session is None or session.adapters["https://"] is not http_adapter:
+        session = requests.Session()
+        session.headers["Accept-Encoding"] = "gzip, deflate"
+        session.mount("http://", http_adapter)
+        session.mount("https://", http_adapter)
+        thread_sessions.session = session
+    return session
+
+
+@contextmanager
+def service_request(service: str):
+    """Context in which to make a request to a web service, waiting for the service's limit"""
+    semaphore = service_semaphores.get(service)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+def request_json(service: str, url: str, payload: dict = None) -> response_cache.JsonResponse:
+    """
+    Make a request to a web service, a post request if there is a payload or else a get request,
+    using the response cache if one is in use.
+
+    :param service: Name of the service, "zooma", "ols" or "oxo"
+    :param url: url to make the request to
+    :param payload: Payload of a post request
+    :return: JsonResponse with the status code of the response and its decoded json, or None as
+             the json if it couldn't be decoded.
+    """
+    method = "POST" if payload is not None else "GET"
+    cache = response_cache.response_cache
+    if cache is not None:
+        key = response_cache.get_request_key(method, url, payload)
+        response = cache.get(service, key)
+        if response is not None:
+            return response
+    with service_request(service):
+        http_response = get_session().request(method, url, data=payload)
+    try:
+        response = response_cache.JsonResponse(http_response.status_code, http_response.json())
+    except ValueError:
+        response = response_cache.JsonResponse(http_response.status_code, None)
+    if cache is not None:
+        cache.put(service, key, response)
+    return response
+
+
 def request_retry_helper(function, retry_count: int, url: str):
     """
     Given a function make a number of attempts to call function for it to successfully return a
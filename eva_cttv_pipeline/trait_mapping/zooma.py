@@ -1,12 +1,9 @@
 from enum import Enum
 from functools import total_ordering, lru_cache
-import json
 import logging
-import requests
 
-from eva_cttv_pipeline.trait_mapping.ols import get_ontology_label_from_ols, \
-    is_current_and_in_efo, is_in_efo
-from eva_cttv_pipeline.trait_mapping.utils import request_retry_helper
+from eva_cttv_pipeline.trait_mapping.ols import get_term_status
+from eva_cttv_pipeline.trait_mapping.utils import request_json, request_retry_helper
 
 
 @total_ordering
@@ -89,11 +86,7 @@ def zooma_query_helper(url: str) -> dict:
     :param url: String of Zooma url used to make a request
     :return: Zooma response in a dict
     """
-    try:
-        json_response_1 = requests.get(url).json()
-        return json_response_1
-    except json.decoder.JSONDecodeError as e:
-        return None
+    return request_json("zooma", url).json
 
 
 def get_zooma_results(trait_name: str, filters: dict, zooma_host: str) -> list:
@@ -121,20 +114,15 @@ def get_zooma_results(trait_name: str, filters: dict, zooma_host: str) -> list:
 
     for zooma_result in zooma_result_list:
         for zooma_mapping in zooma_result.mapping_list:
-            label = get_ontology_label_from_ols(zooma_mapping.uri)
+            term_status = get_term_status(zooma_mapping.uri)
             # If no label is returned (shouldn't really happen) keep the existing one
-            if label is not None:
-                zooma_mapping.ontology_label = label
+            if term_status.label is not None:
+                zooma_mapping.ontology_label = term_status.label
             else:
                 logging.warning("Couldn't retrieve ontology label from OLS for trait '{}'".format(trait_name))
 
-            uri_is_current_and_in_efo = is_current_and_in_efo(zooma_mapping.uri)
-            if not uri_is_current_and_in_efo:
-                uri_is_in_efo = is_in_efo(zooma_mapping.uri)
-                zooma_mapping.in_efo = uri_is_in_efo
-            else:
-                zooma_mapping.in_efo = uri_is_current_and_in_efo
-                zooma_mapping.is_current = uri_is_current_and_in_efo
+            zooma_mapping.in_efo = term_status.in_efo
+            zooma_mapping.is_current = term_status.is_current
 
     return zooma_result_list
 
@@ -0,0 +1,79 @@
+import json
+import os
+import tempfile
+import unittest
+
+from eva_cttv_pipeline.evidence_string_generation import cellbase_records
+
+
+def _cellbase_line(clinical_significance, title="a"):
+    return json.dumps({"clinvarSet": {"title": title, "referenceClinVarAssertion": {
+        "clinicalSignificance": {"description": clinical_significance}}}}) + "\n"
+
+
+class ClinicalSignificanceFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.clin_sig_filter = cellbase_records.ClinicalSignificanceFilter(
+            ["pathogenic", "likely pathogenic"])
+
+    def test_line_may_pass(self):
+        self.assertTrue(self.clin_sig_filter.line_may_pass(_cellbase_line("Pathogenic")))
+        self.assertTrue(self.clin_sig_filter.line_may_pass(_cellbase_line("Likely pathogenic")))
+        self.assertFalse(self.clin_sig_filter.line_may_pass(_cellbase_line("Benign")))
+        self.assertEqual(self.clin_sig_filter.n_skipped, 1)
+
+    def test_line_with_value_elsewhere_decoded(self):
+        line = _cellbase_line("Pathogenic, other", title="Pathogenic")
+        self.assertTrue(self.clin_sig_filter.line_may_pass(line))
+        self.assertFalse(self.clin_sig_filter.record_passes(json.loads(line)))
+        self.assertEqual(self.clin_sig_filter.n_skipped, 1)
+
+    def test_line_with_unicode_escape_decoded(self):
+        line = _cellbase_line("Pathogenic").replace("P", "\\u0050")
+        self.assertTrue(self.clin_sig_filter.line_may_pass(line))
+        self.assertTrue(self.clin_sig_filter.record_passes(json.loads(line)))
+
+    def test_value_escaped_in_json_not_searched(self):
+        clin_sig_filter = cellbase_records.ClinicalSignificanceFilter(['"quoted"'])
+        self.assertTrue(clin_sig_filter.line_may_pass(_cellbase_line("benign")))
+        self.assertFalse(clin_sig_filter.record_passes(json.loads(_cellbase_line("benign"))))
+
+    def test_allowed_values_not_lowercased(self):
+        # As in clinvar_to_evidence_strings.skip_record, a value with capitals never matches
+        clin_sig_filter = cellbase_records.ClinicalSignificanceFilter(["Pathogenic"])
+        self.assertFalse(clin_sig_filter.line_may_pass(_cellbase_line("Pathogenic")))
+        self.assertFalse(clin_sig_filter.record_passes(json.loads(_cellbase_line("Pathogenic"))))
+
+
+class CellbaseRecordsTest(unittest.TestCase):
+    def setUp(self):
+        self.json_file = tempfile.NamedTemporaryFile("wt", suffix=".json", delete=False)
+        self.json_file.write(_cellbase_line("Pathogenic") + _cellbase_line("Benign") +
+                             _cellbase_line("Benign", title="pathogenic") +
+                             _cellbase_line("likely pathogenic"))
+        self.json_file.close()
+
+    def tearDown(self):
+        os.remove(self.json_file.name)
+
+    def test_unfiltered(self):
+        cell_recs = cellbase_records.CellbaseRecords(self.json_file.name)
+        self.assertEqual(len(list(cell_recs)), 4)
+        self.assertEqual(cell_recs.n_skipped, 0)
+
+    def test_filtered(self):
+        cell_recs = cellbase_records.CellbaseRecords(
+            self.json_file.name, cellbase_records.ClinicalSignificanceFilter(["pathogenic"]))
+        records = list(cell_recs)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["clinvarSet"]["referenceClinVarAssertion"]
+                         ["clinicalSignificance"]["description"], "Pathogenic")
+        self.assertEqual(cell_recs.n_skipped, 3)
+
+    def test_raw_record_batches_filtered_undecoded(self):
+        cell_recs = cellbase_records.CellbaseRecords(
+            self.json_file.name, cellbase_records.ClinicalSignificanceFilter(["pathogenic"]))
+        batches = list(cell_recs.raw_record_batches(1))
+        # The line with a title of "pathogenic" can only be skipped once decoded
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(cell_recs.n_skipped, 2)
@@ -43,6 +43,13 @@ class TestClinvarRecord(unittest.TestCase):
     def test_allele_origins(self):
         self.assertEqual(self.test_clinvar_record.allele_origins, ['germline'])
 
+    def test_refs_lists(self):
+        self.assertEqual(self.test_clinvar_record.trait_refs_list,
+                         [['http://europepmc.org/abstract/MED/21697857']])
+        self.assertEqual(self.test_clinvar_record.observed_refs_list,
+                         ['http://europepmc.org/abstract/MED/11524702',
+                          'http://europepmc.org/abstract/MED/12145752'])
+
 
 class TestClinvarRecordMeasure(unittest.TestCase):
     @classmethod
@@ -78,6 +85,18 @@ class TestClinvarRecordMeasure(unittest.TestCase):
     def test_measure_set_pubmed_refs(self):
         self.assertEqual(self.test_crm.pubmed_refs, [])
 
+    def test_sequence_location(self):
+        self.assertEqual((self.test_crm.chr, self.test_crm.start, self.test_crm.stop,
+                          self.test_crm.ref, self.test_crm.alt),
+                         ("3", 150928107, 150928107, "A", "C"))
+
+    def test_sequence_location_first_grch38(self):
+        measure = clinvar.ClinvarRecordMeasure({"sequenceLocation": [
+            {"assembly": "GRCh37", "chr": "1", "start": 1},
+            {"assembly": "GRCh38", "chr": "2"},
+            {"assembly": "GRCh38", "chr": "3", "start": 3}]}, None)
+        self.assertEqual((measure.chr, measure.start, measure.stop), ("2", 3, None))
+
 
 def get_test_record():
     test_clinvar_record_filepath = os.path.join(os.path.dirname(__file__), 'resources',
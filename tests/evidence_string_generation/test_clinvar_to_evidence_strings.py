@@ -1,10 +1,20 @@
+import copy
+import io
+import json
+import multiprocessing
+import tempfile
 import unittest
 
+import jsonschema
 import os
+import shutil
 
+from eva_cttv_pipeline.evidence_string_generation import checkpoint
 from eva_cttv_pipeline.evidence_string_generation import clinvar_to_evidence_strings
+from eva_cttv_pipeline.evidence_string_generation import config as pipeline_config
 from eva_cttv_pipeline.evidence_string_generation import consequence_type as CT
 from eva_cttv_pipeline.evidence_string_generation import trait
+from eva_cttv_pipeline.evidence_string_generation import validation
 from tests.evidence_string_generation import test_clinvar
 from tests.evidence_string_generation import config
 
@@ -108,11 +118,11 @@ class SkipRecordTest(unittest.TestCase):
         self.assertTrue(clinvar_to_evidence_strings.skip_record(*self.args))
 
     def test_rs_is_none(self):
-        self.clinvar_record.rs = None
+        self.clinvar_record.measures[0].rs_id = None
         self.assertTrue(clinvar_to_evidence_strings.skip_record(*self.args))
 
     def test_con_type_is_none(self):
-        self.clinvar_record.consequence_type = None
+        self.args[2] = None
         self.assertTrue(clinvar_to_evidence_strings.skip_record(*self.args))
 
 
@@ -258,3 +268,421 @@ class TestGetConsequenceTypes(unittest.TestCase):
         self.assertEqual(clinvar_to_evidence_strings.get_consequence_types(self.test_crm, {}),
                          [None])
 
+
+
+class _ValidEvidenceString(dict):
+    def validate(self, evidence_string_dict=None):
+        return True
+
+
+class ReportStreamingTest(unittest.TestCase):
+    def setUp(self):
+        self.evidence_string = _ValidEvidenceString({"unique_association_fields": {"gene": "a"}})
+
+    def test_streamed(self):
+        evidence_string_fh = io.StringIO()
+        report = clinvar_to_evidence_strings.Report(evidence_string_fh=evidence_string_fh)
+        report.add_evidence_string(self.evidence_string, None, None, None)
+        report.add_evidence_string(self.evidence_string, None, None, None)
+
+        self.assertEqual(report.evidence_string_list, [])
+        self.assertEqual(report.counters["n_evidence_strings"], 2)
+        self.assertEqual(evidence_string_fh.getvalue(),
+                         2 * (json.dumps(self.evidence_string) + '\n'))
+
+    def test_buffered(self):
+        report = clinvar_to_evidence_strings.Report()
+        report.add_evidence_string(self.evidence_string, None, None, None)
+
+        self.assertEqual(report.evidence_string_list, [self.evidence_string])
+        self.assertEqual(report.counters["n_evidence_strings"], 1)
+
+
+class ReportMergeTest(unittest.TestCase):
+    def test_merge(self):
+        report = clinvar_to_evidence_strings.Report(trait_mappings={"trait a": [("uri a", None)],
+                                                                    "trait b": [("uri b", None)]})
+        report.counters["record_counter"] = 2
+        report.unmapped_traits["trait c"] += 1
+        report.nsv_list.append("nsv1")
+
+        partial_report = clinvar_to_evidence_strings.Report()
+        partial_report.counters["record_counter"] = 3
+        partial_report.unmapped_traits["trait c"] += 2
+        partial_report.nsv_list.append("nsv2")
+        partial_report.add_used_trait_name("trait a")
+
+        report.merge('{"a": 1}\n', partial_report)
+
+        self.assertEqual(report.counters["record_counter"], 5)
+        self.assertEqual(report.unmapped_traits["trait c"], 3)
+        self.assertEqual(report.nsv_list, ["nsv1", "nsv2"])
+        self.assertEqual(report.used_trait_names, {"trait a"})
+        self.assertEqual(report.evidence_string_list, [{"a": 1}])
+
+    def test_streamed_zooma_records(self):
+        trait_mappings = {"trait a": [("uri a", None)], "trait b": [("uri b", None)]}
+        zooma_fh = io.StringIO()
+        report = clinvar_to_evidence_strings.Report(trait_mappings=trait_mappings,
+                                                    zooma_fh=zooma_fh)
+        partial_report = clinvar_to_evidence_strings.Report()
+        partial_report.add_evidence_record(["RCV1", "rs1", "trait a", "uri a"])
+        partial_report.add_used_trait_name("trait a")
+
+        report.merge('', partial_report)
+        self.assertEqual(report.evidence_list, [])
+        report.write_unused_trait_mappings(zooma_fh)
+
+        zooma_records = [line.split("\t")[:5] for line in zooma_fh.getvalue().splitlines()]
+        self.assertEqual(zooma_records, [["RCV1", "rs1", "disease", "trait a", "uri a"],
+                                         ["", "", "disease", "trait b", "uri b"]])
+        # The mappings themselves are left as they are
+        self.assertEqual(list(trait_mappings), ["trait a", "trait b"])
+
+
+class ParallelClinvarToEvidenceStringsTest(unittest.TestCase):
+    def setUp(self):
+        test_record_filepath = os.path.join(os.path.dirname(__file__), 'resources',
+                                            'test_clinvar_record.json')
+        with open(test_record_filepath, "rt") as f:
+            line = json.dumps({"clinvarSet": json.load(f)}) + "\n"
+        self.json_file = tempfile.NamedTemporaryFile("wt", suffix=".json", delete=False)
+        benign_line = line.replace('"Pathogenic"', '"Benign"')
+        self.json_file.write(line * 3 + benign_line + line * 2)
+        self.json_file.close()
+        self.batch_sizes = (pipeline_config.WORKER_BATCH_SIZE, pipeline_config.READ_BATCH_SIZE)
+        pipeline_config.WORKER_BATCH_SIZE = pipeline_config.READ_BATCH_SIZE = 2
+
+    def tearDown(self):
+        pipeline_config.WORKER_BATCH_SIZE, pipeline_config.READ_BATCH_SIZE = self.batch_sizes
+        os.remove(self.json_file.name)
+
+    def _run(self, workers, prefilter_clin_sig=False):
+        evidence_string_fh = io.StringIO()
+        report = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+            ["pathogenic"], MAPPINGS, self.json_file.name, evidence_string_fh=evidence_string_fh,
+            workers=workers, prefilter_clin_sig=prefilter_clin_sig)
+        return evidence_string_fh.getvalue(), report
+
+    def test_same_as_single_process(self):
+        serial_output, serial_report = self._run(1)
+        parallel_output, parallel_report = self._run(2)
+        self.assertEqual(parallel_output, serial_output)
+        self.assertEqual(parallel_report.counters, serial_report.counters)
+        self.assertEqual(parallel_report.evidence_list, serial_report.evidence_list)
+        self.assertEqual(str(parallel_report), str(serial_report))
+
+    def test_prefilter_clin_sig(self):
+        output, report = self._run(1)
+        for workers in (1, 2):
+            prefiltered_output, prefiltered_report = self._run(workers, prefilter_clin_sig=True)
+            self.assertEqual(prefiltered_output, output)
+            self.assertEqual(prefiltered_report.counters["n_prefiltered_clin_sig"], 1)
+            self.assertEqual(prefiltered_report.counters["n_evidence_strings"],
+                             report.counters["n_evidence_strings"])
+            self.assertEqual(prefiltered_report.counters["record_counter"],
+                             report.counters["record_counter"] - 1)
+
+    def test_prefilter_clin_sig_report(self):
+        _, report = self._run(1)
+        _, prefiltered_report = self._run(1, prefilter_clin_sig=True)
+        self.assertNotIn("--preFilterClinSig", str(report))
+        report_lines = str(prefiltered_report).splitlines()
+        self.assertIn("1 ClinVar records were skipped before processing because of a different "
+                      "clinical significance, and are not included in any other count",
+                      report_lines)
+        self.assertIn("{} total nsvs found (not counting ClinVar records skipped by "
+                      "--preFilterClinSig)".format(prefiltered_report.counters["n_nsvs"]),
+                      report_lines)
+        self.assertIn("ClinVar nsvs skipped because of a different clinical significance are not "
+                      "counted with --preFilterClinSig", report_lines)
+
+    def test_validation_stage(self):
+        output, report = self._run(1)
+        evidence_string_fh = io.StringIO()
+        staged_report = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+            ["pathogenic"], MAPPINGS, self.json_file.name, evidence_string_fh=evidence_string_fh,
+            validation_workers=2)
+        self.assertEqual(evidence_string_fh.getvalue(), output)
+        self.assertEqual(staged_report.counters, report.counters)
+        self.assertEqual(staged_report.evidence_list, report.evidence_list)
+
+    def test_quarantined_not_in_report(self):
+        def invalid(evidence_string, schema_file):
+            raise jsonschema.exceptions.ValidationError("Invalid")
+
+        validate_evidence_string = validation.validate_evidence_string
+        validation.validate_evidence_string = invalid
+        try:
+            for validation_workers in (0, 2):
+                zooma_fh = io.StringIO()
+                report = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+                    ["pathogenic"], MAPPINGS, self.json_file.name,
+                    evidence_string_fh=io.StringIO(), quarantine_fh=io.StringIO(),
+                    validation_workers=validation_workers, zooma_fh=zooma_fh)
+                self.assertGreater(report.counters["n_quarantined_evidence_strings"], 0)
+                for counter in ("n_evidence_strings", "n_processed_clinvar_records",
+                                "n_multiple_evidence_strings", "n_valid_rs_and_nsv"):
+                    self.assertEqual(report.counters[counter], 0)
+                self.assertEqual(report.traits, set())
+                self.assertEqual(report.used_trait_names, set())
+                self.assertEqual(report.ensembl_gene_id_uris, set())
+                self.assertEqual(zooma_fh.getvalue(), "")
+        finally:
+            validation.validate_evidence_string = validate_evidence_string
+
+    def test_validation_stage_stopped_on_error(self):
+        process_clinvar_record = clinvar_to_evidence_strings.process_clinvar_record
+
+        def stop_at_record_3(cellbase_record, *args):
+            stop_at_record_3.n_records += 1
+            if stop_at_record_3.n_records == 3:
+                raise RuntimeError("Stopped")
+            process_clinvar_record(cellbase_record, *args)
+        stop_at_record_3.n_records = 0
+
+        # Kept, so that its workers aren't stopped by it being garbage collected
+        validation_stages = []
+        validation_stage_class = validation.ValidationStage
+
+        class KeptValidationStage(validation_stage_class):
+            def __init__(self, *args):
+                super().__init__(*args)
+                validation_stages.append(self)
+
+        clinvar_to_evidence_strings.process_clinvar_record = stop_at_record_3
+        validation.ValidationStage = KeptValidationStage
+        try:
+            with self.assertRaises(RuntimeError):
+                clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+                    ["pathogenic"], MAPPINGS, self.json_file.name,
+                    evidence_string_fh=io.StringIO(), validation_workers=2)
+        finally:
+            clinvar_to_evidence_strings.process_clinvar_record = process_clinvar_record
+            validation.ValidationStage = validation_stage_class
+        # The workers of the validation stage are not left running
+        self.assertEqual(len(validation_stages), 1)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+    def test_stage_timings(self):
+        for workers in (1, 2):
+            output, report = self._run(workers)
+            # Timings of the worker processes are merged into those of the run. Lines are read
+            # in batches of 2, the last, empty one ending the input
+            self.assertEqual(report.timings["read"].calls, 4)
+            self.assertEqual(report.timings["decode"].calls, 6)
+            self.assertEqual(report.timings["clinvar_record"].calls, 6)
+            self.assertEqual(report.timings["validation"].calls,
+                             report.counters["n_evidence_strings"])
+            self.assertGreater(report.timings["decode"].wall, 0)
+
+            dir_out = tempfile.mkdtemp()
+            report.write_metrics(dir_out)
+            metrics_file = os.path.join(dir_out, pipeline_config.METRICS_FILE_NAME)
+            with open(metrics_file, "rt") as f:
+                metrics = json.load(f)
+            os.remove(metrics_file)
+            os.rmdir(dir_out)
+            self.assertEqual(metrics["counters"], report.counters)
+            self.assertEqual(metrics["stages"]["clinvar_record"]["calls"], 6)
+            self.assertGreater(metrics["wall_seconds"], 0)
+
+
+class LaunchPipelineTest(unittest.TestCase):
+    def test_invalid_options(self):
+        resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+        dir_out = tempfile.mkdtemp()
+
+        get_mappings = clinvar_to_evidence_strings.get_mappings
+
+        def fail_to_get_mappings(*args):
+            raise AssertionError("Mappings loaded before checking the options")
+
+        clinvar_to_evidence_strings.get_mappings = fail_to_get_mappings
+        try:
+            for options in ({"validation_workers": 2, "checkpoints": True},
+                            {"validation_workers": 2, "resume": True},
+                            {"validation_workers": 2, "incremental": True},
+                            {"shard_by": "count", "shard_limit": 10, "incremental": True},
+                            {"shard_by": "hash", "shard_limit": 10, "checkpoints": True},
+                            {"shard_by": "count", "shard_limit": 0},
+                            {"deduplicate": "first", "resume": True},
+                            {"deduplicate": "best"},
+                            {"incremental": True, "checkpoints": True},
+                            {"previous_run_dir": dir_out}):
+                with self.assertRaises(ValueError):
+                    clinvar_to_evidence_strings.launch_pipeline(
+                        dir_out, None,
+                        os.path.join(resources_dir, 'feb16_jul16_combined_trait_to_url.tsv'),
+                        os.path.join(resources_dir, config.snp_2_gene_file),
+                        os.path.join(resources_dir, 'test_clinvar_record.json'), **options)
+        finally:
+            clinvar_to_evidence_strings.get_mappings = get_mappings
+            shutil.rmtree(dir_out)
+
+
+class IncrementalClinvarToEvidenceStringsTest(unittest.TestCase):
+    def setUp(self):
+        test_record_filepath = os.path.join(os.path.dirname(__file__), 'resources',
+                                            'test_clinvar_record.json')
+        with open(test_record_filepath, "rt") as f:
+            self.record = json.load(f)
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for dir_path, dir_names, file_names in os.walk(self.temp_dir, topdown=False):
+            for file_name in file_names:
+                os.remove(os.path.join(dir_path, file_name))
+            os.rmdir(dir_path)
+
+    def _write_input(self, accessions, changed_accession=None):
+        json_file = os.path.join(self.temp_dir, "input.json")
+        with open(json_file, "wt") as f:
+            for accession in accessions:
+                record = copy.deepcopy(self.record)
+                record["referenceClinVarAssertion"]["clinVarAccession"]["acc"] = accession
+                if accession == changed_accession:
+                    record["referenceClinVarAssertion"]["clinicalSignificance"]["description"] = \
+                        "Benign"
+                f.write(json.dumps({"clinvarSet": record}) + "\n")
+        return json_file
+
+    def _run(self, name, json_file, manifest=True, previous_run=None):
+        dir_out = os.path.join(self.temp_dir, name)
+        os.mkdir(dir_out)
+        with open(os.path.join(dir_out, pipeline_config.EVIDENCE_STRINGS_FILE_NAME), "wt") as fh:
+            report = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+                ["pathogenic"], MAPPINGS, json_file, evidence_string_fh=fh,
+                manifest_file=os.path.join(dir_out, pipeline_config.MANIFEST_FILE_NAME)
+                if manifest else None,
+                previous_run_dir=os.path.join(self.temp_dir, previous_run)
+                if previous_run else None)
+        with open(os.path.join(dir_out, pipeline_config.EVIDENCE_STRINGS_FILE_NAME), "rt") as fh:
+            return fh.read(), report
+
+    def test_same_as_full_run(self):
+        json_file = self._write_input(["RCV1", "RCV2", "RCV3"])
+        output, report = self._run("full", json_file, manifest=False)
+        first_output, first_report = self._run("first", json_file)
+        self.assertEqual(first_output, output)
+        self.assertEqual(first_report.counters, report.counters)
+
+        json_file = self._write_input(["RCV1", "RCV2", "RCV3", "RCV4"], changed_accession="RCV2")
+        output, report = self._run("full_changed", json_file, manifest=False)
+        second_output, second_report = self._run("second", json_file, previous_run="first")
+        self.assertEqual(second_output, output)
+        self.assertEqual(second_report.counters, report.counters)
+        self.assertEqual(second_report.evidence_list, report.evidence_list)
+        self.assertEqual(str(second_report), str(report))
+
+        # Evidence strings of records which haven't changed are taken from the previous run
+        with open(os.path.join(self.temp_dir, "first",
+                               pipeline_config.EVIDENCE_STRINGS_FILE_NAME), "wt") as fh:
+            fh.write(first_output.replace("RCV1", "RCVX"))
+        third_output, _ = self._run("third", json_file, previous_run="first")
+        self.assertEqual(third_output, output.replace("RCV1", "RCVX"))
+
+    def test_report_dict(self):
+        report = clinvar_to_evidence_strings.Report()
+        process_output = clinvar_to_evidence_strings.process_clinvar_records_separately(
+            [{"clinvarSet": self.record}], ["pathogenic"], MAPPINGS, False)
+        partial_report = process_output[1]
+        report.merge('', clinvar_to_evidence_strings.Report.from_dict(
+            json.loads(json.dumps(partial_report.to_dict()))))
+        self.assertEqual(report.counters, partial_report.counters)
+        self.assertEqual(report.evidence_list, partial_report.evidence_list)
+        self.assertEqual(report.traits, partial_report.traits)
+
+
+class CheckpointTest(unittest.TestCase):
+    def setUp(self):
+        test_record_filepath = os.path.join(os.path.dirname(__file__), 'resources',
+                                            'test_clinvar_record.json')
+        with open(test_record_filepath, "rt") as f:
+            record = json.load(f)
+        self.temp_dir = tempfile.mkdtemp()
+        self.json_file = os.path.join(self.temp_dir, "input.json")
+        with open(self.json_file, "wt") as f:
+            for accession in range(10):
+                record["referenceClinVarAssertion"]["clinVarAccession"]["acc"] = str(accession)
+                f.write(json.dumps({"clinvarSet": record}) + "\n")
+        # Copies, as the settings of a run include the mapping files, which a test changes
+        resources_dir = os.path.join(os.path.dirname(__file__), 'resources')
+        self.efo_mapping_file = os.path.join(self.temp_dir, "trait_to_url.tsv")
+        shutil.copy(os.path.join(resources_dir, 'feb16_jul16_combined_trait_to_url.tsv'),
+                    self.efo_mapping_file)
+        self.snp_2_gene_file = os.path.join(self.temp_dir, "snp_2_gene.tsv")
+        shutil.copy(os.path.join(resources_dir, config.snp_2_gene_file), self.snp_2_gene_file)
+        self.config = (pipeline_config.WORKER_BATCH_SIZE, pipeline_config.CHECKPOINT_INTERVAL)
+        pipeline_config.WORKER_BATCH_SIZE = 2
+        pipeline_config.CHECKPOINT_INTERVAL = 3
+        self.process_clinvar_record = clinvar_to_evidence_strings.process_clinvar_record
+
+    def tearDown(self):
+        pipeline_config.WORKER_BATCH_SIZE, pipeline_config.CHECKPOINT_INTERVAL = self.config
+        clinvar_to_evidence_strings.process_clinvar_record = self.process_clinvar_record
+        for dir_path, dir_names, file_names in os.walk(self.temp_dir, topdown=False):
+            for file_name in file_names:
+                os.remove(os.path.join(dir_path, file_name))
+            os.rmdir(dir_path)
+
+    def _get_settings(self, most_severe_consequence=False):
+        return checkpoint.get_settings(self.json_file, self.efo_mapping_file, self.snp_2_gene_file,
+                                       ["pathogenic"], False, False, most_severe_consequence)
+
+    def _run(self, checkpointer=None, resume_from=None, mode="wt"):
+        evidence_strings_file = os.path.join(self.temp_dir, "evidence_strings.json")
+        with open(evidence_strings_file, mode) as evidence_string_fh:
+            report = clinvar_to_evidence_strings.clinvar_to_evidence_strings(
+                ["pathogenic"], MAPPINGS, self.json_file, evidence_string_fh=evidence_string_fh,
+                checkpointer=checkpointer, resume_from=resume_from)
+        with open(evidence_strings_file, "rt") as evidence_string_fh:
+            return evidence_string_fh.read(), report
+
+    def test_resume(self):
+        output, report = self._run()
+
+        def stop_at_record_7(cellbase_record, *args):
+            if cellbase_record["clinvarSet"]["referenceClinVarAssertion"][
+                    "clinVarAccession"]["acc"] == "7":
+                raise RuntimeError("Stopped")
+            self.process_clinvar_record(cellbase_record, *args)
+
+        checkpoint_file = os.path.join(self.temp_dir, "checkpoint.json")
+        settings = self._get_settings()
+        clinvar_to_evidence_strings.process_clinvar_record = stop_at_record_7
+        self.assertRaises(RuntimeError, self._run, checkpoint.Checkpointer(checkpoint_file,
+                                                                           settings))
+        clinvar_to_evidence_strings.process_clinvar_record = self.process_clinvar_record
+
+        checkpointer = checkpoint.Checkpointer(checkpoint_file, settings)
+        resume_from = checkpointer.load()
+        # Checkpoints are written after the batches ending on lines 4 and 8 (which wasn't reached)
+        self.assertEqual(resume_from.n_lines, 4)
+        os.truncate(os.path.join(self.temp_dir, "evidence_strings.json"),
+                    resume_from.evidence_strings_size)
+        resumed_output, resumed_report = self._run(checkpointer, resume_from, mode="at")
+        self.assertEqual(resumed_output, output)
+        self.assertEqual(resumed_report.counters, report.counters)
+        self.assertEqual(resumed_report.evidence_list, report.evidence_list)
+
+    def test_different_settings(self):
+        checkpoint_file = os.path.join(self.temp_dir, "checkpoint.json")
+        settings = self._get_settings()
+        self._run(checkpoint.Checkpointer(checkpoint_file, settings))
+        settings["allowed_clinical_significance"] = ["benign"]
+        self.assertRaises(ValueError, checkpoint.Checkpointer(checkpoint_file, settings).load)
+
+    def test_different_consequence_types(self):
+        checkpoint_file = os.path.join(self.temp_dir, "checkpoint.json")
+        self._run(checkpoint.Checkpointer(checkpoint_file, self._get_settings()))
+        self.assertRaises(ValueError, checkpoint.Checkpointer(
+            checkpoint_file, self._get_settings(most_severe_consequence=True)).load)
+
+    def test_different_mapping_file(self):
+        checkpoint_file = os.path.join(self.temp_dir, "checkpoint.json")
+        self._run(checkpoint.Checkpointer(checkpoint_file, self._get_settings()))
+        with open(self.efo_mapping_file, "at") as f:
+            f.write("extra trait\thttp://www.ebi.ac.uk/efo/EFO_0000001\textra trait\n")
+        self.assertRaises(ValueError, checkpoint.Checkpointer(checkpoint_file,
+                                                              self._get_settings()).load)
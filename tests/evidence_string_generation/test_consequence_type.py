@@ -1,3 +1,6 @@
+import pickle
+import shutil
+import tempfile
 import unittest
 
 import os
@@ -31,6 +34,75 @@ class ProcessConsequenceTypeFileTsvTest(unittest.TestCase):
         self.assertEqual(consequence_type_dict["rs121908485"][0], test_consequence_type)
 
 
+class ConsequenceTypeStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.index_dir = tempfile.mkdtemp()
+        self.snp_2_gene_file_path = os.path.join(os.path.dirname(__file__), 'resources',
+                                                 config.snp_2_gene_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.index_dir)
+
+    def test_same_as_dict(self):
+        consequence_type_dict, _ = CT.process_consequence_type_file_tsv(self.snp_2_gene_file_path)
+        store = CT.open_consequence_type_store(self.snp_2_gene_file_path, self.index_dir)
+        self.assertEqual(len(store), len(consequence_type_dict))
+        self.assertEqual(list(store), list(consequence_type_dict))
+        for variant_id, consequence_types in consequence_type_dict.items():
+            self.assertIn(variant_id, store)
+            self.assertEqual(store[variant_id], consequence_types)
+        self.assertNotIn("rs0", store)
+        self.assertRaises(KeyError, store.__getitem__, "rs0")
+
+    def test_get(self):
+        consequence_type_dict, _ = CT.process_consequence_type_file_tsv(self.snp_2_gene_file_path)
+        store = CT.open_consequence_type_store(self.snp_2_gene_file_path, self.index_dir)
+        self.assertEqual(store.get("rs121908485"), consequence_type_dict["rs121908485"])
+        self.assertIsNone(store.get("rs0"))
+        self.assertEqual(store.get("rs0", []), [])
+
+    def test_index_rebuilt_when_file_changes(self):
+        snp_2_gene_file_path = os.path.join(self.index_dir, "snp2gene.tsv")
+        with open(snp_2_gene_file_path, "wt") as f:
+            f.write("rs1\t1\tENSG1\tA\tstop_gained\t0\n")
+        store = CT.open_consequence_type_store(snp_2_gene_file_path, self.index_dir)
+        self.assertEqual(list(store), ["rs1"])
+
+        with open(snp_2_gene_file_path, "at") as f:
+            f.write("rs2\t1\tENSG2\tB\tmissense_variant\t0\n")
+        os.utime(snp_2_gene_file_path, ns=(0, 0))
+        store = CT.open_consequence_type_store(snp_2_gene_file_path, self.index_dir)
+        self.assertEqual(store["rs2"], [CT.ConsequenceType("ENSG2", CT.SoTerm("missense_variant"))])
+
+    def test_old_index_removed(self):
+        snp_2_gene_file_path = os.path.join(self.index_dir, "snp2gene.tsv")
+        other_snp_2_gene_file_path = os.path.join(self.index_dir, "other_snp2gene.tsv")
+        # Same name, different directory
+        os.mkdir(os.path.join(self.index_dir, "2025"))
+        same_name_file_path = os.path.join(self.index_dir, "2025", "snp2gene.tsv")
+        for file_path in (snp_2_gene_file_path, other_snp_2_gene_file_path, same_name_file_path):
+            with open(file_path, "wt") as f:
+                f.write("rs1\t1\tENSG1\tA\tstop_gained\t0\n")
+        old_store = CT.open_consequence_type_store(snp_2_gene_file_path, self.index_dir)
+        other_store = CT.open_consequence_type_store(other_snp_2_gene_file_path, self.index_dir)
+        same_name_store = CT.open_consequence_type_store(same_name_file_path, self.index_dir)
+        self.assertTrue(os.path.exists(old_store.index_path))
+
+        os.utime(snp_2_gene_file_path, ns=(0, 0))
+        store = CT.open_consequence_type_store(snp_2_gene_file_path, self.index_dir)
+        self.assertNotEqual(store.index_path, old_store.index_path)
+        self.assertTrue(os.path.exists(store.index_path))
+        self.assertFalse(os.path.exists(old_store.index_path))
+        self.assertTrue(os.path.exists(other_store.index_path))
+        self.assertTrue(os.path.exists(same_name_store.index_path))
+
+    def test_temp_file_removed_when_build_fails(self):
+        index_path = os.path.join(self.index_dir, "consequence_types.sqlite")
+        self.assertRaises(FileNotFoundError, CT.build_consequence_type_index,
+                          os.path.join(self.index_dir, "missing.tsv"), index_path)
+        self.assertEqual(os.listdir(self.index_dir), [])
+
+
 class SoTermTest(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -44,3 +116,27 @@ class SoTermTest(unittest.TestCase):
     def test_rank(self):
         self.assertEqual(self.test_so_term_a.rank, 3)
         self.assertEqual(self.test_so_term_b.rank, 34)
+
+    def test_interned(self):
+        self.assertIs(CT.SoTerm("stop_gained"), self.test_so_term_a)
+        self.assertIs(pickle.loads(pickle.dumps(self.test_so_term_a)), self.test_so_term_a)
+
+
+class MostSevereConsequenceTypesTest(unittest.TestCase):
+    def test_most_severe_consequence_types(self):
+        consequence_types = [CT.ConsequenceType("ENSG1", CT.SoTerm("intron_variant")),
+                             CT.ConsequenceType("ENSG2", CT.SoTerm("not_real_term")),
+                             CT.ConsequenceType("ENSG1", CT.SoTerm("stop_gained")),
+                             CT.ConsequenceType("ENSG2", CT.SoTerm("another_unreal_term")),
+                             CT.ConsequenceType("ENSG1", CT.SoTerm("missense_variant"))]
+        self.assertEqual(CT.most_severe_consequence_types(consequence_types),
+                         [consequence_types[2], consequence_types[1]])
+
+    def test_view(self):
+        consequence_type_dict = {"rs1": [CT.ConsequenceType("ENSG1", CT.SoTerm("intron_variant")),
+                                         CT.ConsequenceType("ENSG1", CT.SoTerm("stop_lost"))]}
+        most_severe = CT.MostSevereConsequenceTypes(consequence_type_dict)
+        self.assertIn("rs1", most_severe)
+        self.assertNotIn("rs2", most_severe)
+        self.assertEqual(len(most_severe), 1)
+        self.assertEqual(most_severe["rs1"], [consequence_type_dict["rs1"][1]])
@@ -0,0 +1,89 @@
+import io
+import json
+import unittest
+
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import deduplication
+from eva_cttv_pipeline.evidence_string_generation import evidence_strings
+from eva_cttv_pipeline.evidence_string_generation.consequence_type import SoTerm
+
+
+def make_evidence_string_line(number, accession, so_name):
+    functional_consequence = evidence_strings.get_functional_consequence(SoTerm(so_name))
+    return json.dumps({"unique_association_fields": {"clinvarAccession": accession,
+                                                     "gene": "ENSG1"},
+                       "evidence": {"gene2variant": {
+                           "functional_consequence": functional_consequence}},
+                       "number": number})
+
+
+class KeyedOutput:
+    """Writer of evidence strings keeping those written through write_evidence_string"""
+
+    def __init__(self):
+        self.evidence_strings = []
+
+    def write_evidence_string(self, evidence_string_line, association_key,
+                              functional_consequence=None):
+        self.evidence_strings.append((evidence_string_line, association_key))
+
+
+class DeduplicatingWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.lines = [make_evidence_string_line(0, "RCV1", "intron_variant"),
+                      make_evidence_string_line(1, "RCV2", "missense_variant"),
+                      make_evidence_string_line(2, "RCV1", "stop_gained"),
+                      make_evidence_string_line(3, "RCV3", "intron_variant"),
+                      make_evidence_string_line(4, "RCV1", "missense_variant"),
+                      make_evidence_string_line(5, "RCV2", "missense_variant")]
+
+    def _write(self, policy):
+        evidence_string_fh = io.StringIO()
+        with deduplication.DeduplicatingWriter(evidence_string_fh, policy) as writer:
+            # Whole lines, one at a time and several at once, as written by Report
+            writer.write(self.lines[0] + "\n")
+            writer.write("".join(line + "\n" for line in self.lines[1:]))
+        self.assertEqual(writer.n_duplicates, 3)
+        return [json.loads(line)["number"] for line in evidence_string_fh.getvalue().splitlines()]
+
+    def test_first(self):
+        self.assertEqual(self._write("first"), [0, 1, 3])
+
+    def test_last(self):
+        self.assertEqual(self._write("last"), [3, 4, 5])
+
+    def test_most_severe(self):
+        self.assertEqual(self._write("most_severe"), [1, 2, 3])
+
+    def test_spilled_hashes(self):
+        memory_keys = config.DEDUPLICATION_MEMORY_KEYS
+        config.DEDUPLICATION_MEMORY_KEYS = 2
+        try:
+            self.assertEqual(self._write("first"), [0, 1, 3])
+        finally:
+            config.DEDUPLICATION_MEMORY_KEYS = memory_keys
+
+    def test_write_evidence_string(self):
+        # Given the keys of evidence strings, which aren't parsed, the same ones are kept
+        for policy, expected_numbers in (("first", [0, 1, 3]), ("last", [3, 4, 5]),
+                                         ("most_severe", [1, 2, 3])):
+            output_fh = KeyedOutput()
+            with deduplication.DeduplicatingWriter(output_fh, policy) as writer:
+                for line in self.lines:
+                    evidence_string = json.loads(line)
+                    association_key, functional_consequence = \
+                        evidence_strings.get_output_keys(evidence_string)
+                    writer.write_evidence_string("not json {}".format(evidence_string["number"]),
+                                                 association_key, functional_consequence)
+            self.assertEqual(writer.n_duplicates, 3)
+            self.assertEqual([line for line, _ in output_fh.evidence_strings],
+                             ["not json {}".format(number) for number in expected_numbers])
+            # The association keys are passed on to the writer of the output
+            self.assertEqual([association_key for _, association_key in output_fh.evidence_strings],
+                             [evidence_strings.get_association_key(
+                                 json.loads(self.lines[number])["unique_association_fields"])
+                              for number in expected_numbers])
+
+    def test_invalid_policy(self):
+        with self.assertRaises(ValueError):
+            deduplication.DeduplicatingWriter(io.StringIO(), "best")
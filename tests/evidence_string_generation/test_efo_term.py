@@ -1,5 +1,9 @@
+import os
+import tempfile
+import time
 import unittest
 
+from eva_cttv_pipeline.evidence_string_generation import config
 from eva_cttv_pipeline.evidence_string_generation import efo_term
 
 
@@ -35,3 +39,48 @@ class EFOTermTest(unittest.TestCase):
         self.assertRaises(efo_term.EFOTerm.TermUnavailableException,
                           self.test_efoterm_cttv_b.is_cttv_available)
         self.assertTrue(self.test_efoterm_cttv_a.is_cttv_available())
+
+
+class TermsSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.snapshot_path = os.path.join(tempfile.mkdtemp(), "efo_terms_snapshot.json")
+        self.config = (config.EFO_TERMS_SNAPSHOT, config.EFO_TERMS_SNAPSHOT_TTL, config.SPARQLEP)
+        config.EFO_TERMS_SNAPSHOT = self.snapshot_path
+        config.SPARQLEP = ""
+
+    def tearDown(self):
+        config.EFO_TERMS_SNAPSHOT, config.EFO_TERMS_SNAPSHOT_TTL, config.SPARQLEP = self.config
+        if os.path.exists(self.snapshot_path):
+            os.remove(self.snapshot_path)
+        os.rmdir(os.path.dirname(self.snapshot_path))
+
+    def test_no_snapshot(self):
+        snapshot = efo_term.load_terms_snapshot()
+        self.assertEqual(snapshot["obsolete_terms"], {})
+        self.assertEqual(snapshot["cttv_available_terms"], {})
+
+    def test_snapshot(self):
+        efo_term.write_terms_snapshot(self.snapshot_path, {"ob_id_1": "ob_term_1"},
+                                      {"cttv_id_1": "cttv_av_term_1"})
+        snapshot = efo_term.load_terms_snapshot()
+        self.assertEqual(snapshot["obsolete_terms"], {"ob_id_1": "ob_term_1"})
+        self.assertEqual(snapshot["cttv_available_terms"], {"cttv_id_1": "cttv_av_term_1"})
+        self.assertLess(time.time() - snapshot["created"], config.EFO_TERMS_SNAPSHOT_TTL)
+
+    def test_out_of_date_snapshot_used_without_endpoint(self):
+        efo_term.write_terms_snapshot(self.snapshot_path, {"ob_id_1": "ob_term_1"}, {})
+        config.EFO_TERMS_SNAPSHOT_TTL = 0
+        self.assertEqual(efo_term.load_terms_snapshot()["obsolete_terms"],
+                         {"ob_id_1": "ob_term_1"})
+
+    def test_lazy_terms(self):
+        class Terms:
+            obsolete_terms = efo_term._LazyTerms("obsolete_terms")
+            cttv_available_terms = efo_term._LazyTerms("cttv_available_terms")
+
+        efo_term.write_terms_snapshot(self.snapshot_path, {"ob_id_1": "ob_term_1"},
+                                      {"cttv_id_1": "cttv_av_term_1"})
+        self.assertEqual(Terms.obsolete_terms, {"ob_id_1": "ob_term_1"})
+        # Both sets of terms are loaded together, and only once
+        os.remove(self.snapshot_path)
+        self.assertEqual(Terms.__dict__["cttv_available_terms"], {"cttv_id_1": "cttv_av_term_1"})
@@ -1,3 +1,7 @@
+import collections
+import copy
+import json
+import os
 import unittest
 from datetime import datetime
 
@@ -489,3 +493,111 @@ class CTTVSomaticEvidenceStringTest(unittest.TestCase):
         test_args = get_args_CTTVSomaticEvidenceString_init()
         test_evidence_string = evidence_strings.CTTVSomaticEvidenceString(*test_args)
         self.assertTrue(test_evidence_string.validate())
+
+
+class EvidenceTemplateTest(unittest.TestCase):
+    base_json = {"type": "test", "target": {"id": [], "activity": None},
+                 "evidence": {"urls": [{"nice_name": "a", "url": None}], "score": 1e-7}}
+
+    def setUp(self):
+        self.template = evidence_strings.EvidenceTemplate(self.base_json, [
+            ('target_id', ('target', 'id')),
+            ('url', ('evidence', 'urls', 0, 'url')),
+            ('name', ('target', 'name')),
+            ('literature', ('literature',)),
+            ('url', ('evidence', 'url'))])
+
+    def test_to_json(self):
+        for name, literature in ((None, None), ("name", None), (None, {"references": []}),
+                                 ("name \u00e9\"", {"references": [{"lit_id": "a"}]})):
+            fields = SimpleNamespace(target_id="gene", url="http://url", name=name,
+                                     literature=literature)
+            expected = copy.deepcopy(self.base_json)
+            expected["target"]["id"] = "gene"
+            expected["evidence"]["urls"][0]["url"] = "http://url"
+            if name is not None:
+                expected["target"]["name"] = name
+            if literature is not None:
+                expected["literature"] = literature
+            expected["evidence"]["url"] = "http://url"
+            self.assertEqual(self.template.to_json(fields), json.dumps(expected))
+
+    def test_optional_field_first_in_object(self):
+        self.assertRaises(ValueError, evidence_strings.EvidenceTemplate, {"a": {}},
+                          [('b', ('a', 'b'))])
+
+
+def load_evidence_string_json(evidence_string_json, date):
+    """
+    Evidence string of a JSON line, with the order of its keys. The references of its literature
+    come from a set, so they are sorted, and its unique experiment reference, the first of them,
+    is replaced by the first once sorted. Its dates asserted, in local time, are replaced by date.
+    """
+    evidence_string = json.loads(evidence_string_json,
+                                 object_pairs_hook=collections.OrderedDict)
+    evidence = evidence_string["evidence"]
+    for part in (evidence_string, evidence.get("provenance_type", {}),
+                 evidence.get("variant2disease", {}).get("provenance_type", {})):
+        if "literature" in part:
+            part["literature"]["references"].sort(key=lambda reference: reference["lit_id"])
+    variant2disease = evidence.get("variant2disease", {})
+    if "literature" in evidence_string and variant2disease.get("unique_experiment_reference") in \
+            [reference["lit_id"] for reference in evidence_string["literature"]["references"]]:
+        variant2disease["unique_experiment_reference"] = \
+            evidence_string["literature"]["references"][0]["lit_id"]
+    for part in (evidence, evidence.get("gene2variant", {}), evidence.get("variant2disease", {})):
+        if "date_asserted" in part:
+            part["date_asserted"] = date
+    return evidence_string
+
+
+class CompactEvidenceStringTest(unittest.TestCase):
+    # Made by CTTVGeneticsEvidenceString and CTTVSomaticEvidenceString before they were built
+    # from compact evidence strings, from the arguments of get_args_*_init
+    expected_genetics_file = os.path.join(
+        config.test_dir, "resources", "expected_genetics_evidence_string.json")
+    expected_somatic_file = os.path.join(
+        config.test_dir, "resources", "expected_somatic_evidence_string.json")
+
+    def assert_to_json(self, compact_evidence_string, expected_file, date):
+        with open(expected_file, "rt") as f:
+            expected_evidence_string = load_evidence_string_json(f.read(), date)
+        evidence_string_json = compact_evidence_string.to_json()
+        self.assertEqual(load_evidence_string_json(evidence_string_json, date),
+                         expected_evidence_string)
+        self.assertEqual(json.loads(evidence_string_json), compact_evidence_string.to_dict())
+        self.assertEqual(evidence_strings.evidence_string_to_json(compact_evidence_string),
+                         evidence_string_json)
+        self.assertTrue(compact_evidence_string.validate())
+
+    def test_genetics_to_json(self):
+        test_args = get_args_CTTVGeneticsEvidenceString_init()
+        self.assert_to_json(evidence_strings.CompactGeneticsEvidenceString(*test_args),
+                            self.expected_genetics_file, test_args[0].date)
+
+    def test_somatic_to_json(self):
+        test_args = get_args_CTTVSomaticEvidenceString_init()
+        self.assert_to_json(evidence_strings.CompactSomaticEvidenceString(*test_args),
+                            self.expected_somatic_file, test_args[0].date)
+
+    def test_somatic_optional_fields(self):
+        clinvar_record, clinvar_record_measure, report, trait, consequence_type = \
+            get_args_CTTVSomaticEvidenceString_init()
+        trait.clinvar_name = "clinvar name"
+        trait.ontology_label = "ontology label"
+        clinvar_record_measure = SimpleNamespace(refs_list=[])
+        clinvar_record = SimpleNamespace(trait_refs_list=[[]], observed_refs_list=[],
+                                         accession=clinvar_record.accession,
+                                         clinical_significance=None, date=clinvar_record.date)
+        compact_evidence_string = evidence_strings.CompactSomaticEvidenceString(
+            clinvar_record, clinvar_record_measure, report, trait, consequence_type)
+        evidence_string = compact_evidence_string.to_dict()
+
+        self.assertEqual(list(evidence_string["disease"]),
+                         ["id", "source_name", "name"])
+        self.assertEqual(evidence_string["disease"]["name"], "ontology label")
+        self.assertNotIn("literature", evidence_string)
+        self.assertNotIn("literature", evidence_string["evidence"]["provenance_type"])
+        self.assertNotIn("clinical_significance", evidence_string["evidence"])
+        self.assertEqual(list(evidence_string["unique_association_fields"]),
+                         ["gene", "clinvarAccession", "phenotype", "alleleOrigin"])
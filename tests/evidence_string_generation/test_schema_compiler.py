@@ -0,0 +1,152 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import jsonschema
+
+from eva_cttv_pipeline.evidence_string_generation import schema_compiler
+
+
+DEFINITIONS_SCHEMA = {
+    "definitions": {
+        "reference": {
+            "type": "object",
+            "properties": {
+                "lit_id": {"type": "string", "pattern": "^http://europepmc.org/abstract/MED/"},
+                "references": {"type": "array", "items": {"$ref": "#/definitions/reference"}}
+            },
+            "required": ["lit_id"],
+            "additionalProperties": False
+        }
+    }
+}
+
+TEST_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-04/schema#",
+    "type": "object",
+    "required": ["type", "disease", "evidence"],
+    "properties": {
+        "type": {"enum": ["genetic_association", "somatic_mutation"]},
+        "disease": {
+            "type": "object",
+            "properties": {"id": {"type": "array", "items": {"type": "string", "format": "uri"},
+                                  "minItems": 1, "maxItems": 2, "uniqueItems": True}},
+            "patternProperties": {"^x_": {"type": ["string", "null"]}},
+            "additionalProperties": {"type": "integer", "minimum": 0, "exclusiveMinimum": True}
+        },
+        "evidence": {
+            "oneOf": [
+                {"type": "object", "required": ["score"],
+                 "properties": {"score": {"type": "number", "maximum": 1, "multipleOf": 0.5}}},
+                {"type": "object", "required": ["pvalue"],
+                 "properties": {"pvalue": {"type": "number", "maximum": 1}}}
+            ]
+        },
+        "literature": {"$ref": "DEFINITIONS#/definitions/reference"},
+        "email": {"type": "string", "format": "email", "minLength": 3, "maxLength": 20},
+        "count": {"allOf": [{"type": "integer"}, {"not": {"enum": [13]}}], "multipleOf": 2},
+        "tags": {"type": "array", "items": [{"type": "string"}, {"type": "boolean"}],
+                 "additionalItems": False},
+        "extra": {"anyOf": [{"type": "string"}, {"minProperties": 1, "maxProperties": 2}],
+                  "dependencies": {"a": ["b"], "c": {"required": ["d"]}}}
+    }
+}
+
+VALID = {"type": "genetic_association", "disease": {"id": ["http://a"], "x_1": None, "n": 3},
+         "evidence": {"score": 0.5},
+         "literature": {"lit_id": "http://europepmc.org/abstract/MED/1",
+                        "references": [{"lit_id": "http://europepmc.org/abstract/MED/2"}]},
+         "email": "a@b.org", "count": 4, "tags": ["a", True], "extra": {"b": 1}}
+
+INVALID_CHANGES = [
+    ("type", "other"), ("disease", []), ("disease", {"id": []}),
+    ("disease", {"id": ["http://a", "http://a"]}), ("disease", {"id": ["a", "b", "c"]}),
+    ("disease", {"x_1": 1}), ("disease", {"n": 0}), ("disease", {"n": True}),
+    ("disease", {"n": 1.0}), ("evidence", {"score": 0.3}),
+    ("evidence", {"score": 0.5, "pvalue": 0}),
+    ("evidence", {}), ("literature", {"lit_id": "a"}), ("literature", {"lit_id": 1}),
+    ("literature", {"lit_id": "http://europepmc.org/abstract/MED/1", "other": 1}),
+    ("literature", {"lit_id": "http://europepmc.org/abstract/MED/1",
+                    "references": [{"lit_id": "http://europepmc.org/abstract/MED/2",
+                                    "references": [{}]}]}),
+    ("email", "no at sign"), ("email", "a@"), ("email", "a" * 20 + "@b.org"), ("count", 13),
+    ("count", 3), ("count", "4"), ("tags", ["a", "b"]), ("tags", ["a", True, 1]),
+    ("extra", {}), ("extra", {"a": 1}), ("extra", {"c": 1}), ("email", 3),
+]
+
+VALID_CHANGES = [
+    ("disease", {"id": ["http://a", "http://b"], "x_": "s"}), ("evidence", {"pvalue": 0.1}),
+    ("evidence", {"score": 1, "other": "x"}),
+    ("literature", {"lit_id": "http://europepmc.org/abstract/MED/1"}), ("count", 0), ("tags", []),
+    ("tags", ["a"]), ("extra", "string"), ("extra", 5), ("extra", {"c": 1, "d": 2}),
+]
+
+
+class SchemaCompilerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        definitions_file = os.path.join(self.temp_dir, "definitions.json")
+        with open(definitions_file, "wt") as f:
+            json.dump(DEFINITIONS_SCHEMA, f)
+        self.schema_file = os.path.join(self.temp_dir, "schema.json")
+        schema_text = json.dumps(TEST_SCHEMA).replace("DEFINITIONS", "file://" + definitions_file)
+        with open(self.schema_file, "wt") as f:
+            f.write(schema_text)
+        self.schema = json.loads(schema_text)
+        self.cache_dir = os.path.join(self.temp_dir, "compiled")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def get_jsonschema_validator(self):
+        return jsonschema.Draft4Validator(self.schema,
+                                          resolver=jsonschema.RefResolver.from_schema(self.schema),
+                                          format_checker=jsonschema.FormatChecker())
+
+    def get_compiled_validator(self):
+        return schema_compiler.get_compiled_validator(self.schema_file,
+                                                      self.get_jsonschema_validator(),
+                                                      self.cache_dir)
+
+    def test_agrees_with_jsonschema(self):
+        validator = self.get_jsonschema_validator()
+        compiled_validator = self.get_compiled_validator()
+        self.assertTrue(validator.is_valid(VALID))
+        self.assertTrue(compiled_validator.is_valid(VALID))
+        for changes, expected in ((INVALID_CHANGES, False), (VALID_CHANGES, True)):
+            for key, value in changes:
+                instance = dict(VALID, **{key: value})
+                self.assertEqual(validator.is_valid(instance), expected, (key, value))
+                self.assertEqual(compiled_validator.is_valid(instance), expected, (key, value))
+        self.assertFalse(compiled_validator.is_valid([]))
+
+    def test_validate_raises_jsonschema_error(self):
+        compiled_validator = self.get_compiled_validator()
+        compiled_validator.validate(VALID)
+        with self.assertRaises(jsonschema.exceptions.ValidationError) as context:
+            compiled_validator.validate(dict(VALID, count=13))
+        self.assertEqual(list(context.exception.path), ["count"])
+
+    def test_code_cached(self):
+        self.get_compiled_validator()
+        cache_files = os.listdir(self.cache_dir)
+        self.assertEqual(len(cache_files), 1)
+        cache_file = os.path.join(self.cache_dir, cache_files[0])
+        with open(cache_file, "at") as f:
+            f.write("cached = True\n")
+        self.assertTrue(self.get_compiled_validator().is_valid.__globals__.get("cached"))
+
+        # Changing a referenced schema invalidates the cached code
+        definitions_file = os.path.join(self.temp_dir, "definitions.json")
+        with open(definitions_file, "wt") as f:
+            json.dump({"definitions": {"reference": {"type": "string"}}}, f)
+        compiled_validator = self.get_compiled_validator()
+        self.assertIsNone(compiled_validator.is_valid.__globals__.get("cached"))
+        self.assertFalse(compiled_validator.is_valid(VALID))
+
+    def test_unsupported_schema(self):
+        self.schema = {"type": "any"}
+        self.assertIsNone(schema_compiler.get_compiled_validator(
+            self.schema_file, self.get_jsonschema_validator()))
@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from eva_cttv_pipeline.evidence_string_generation import config
+from eva_cttv_pipeline.evidence_string_generation import evidence_strings
+from eva_cttv_pipeline.evidence_string_generation import shards
+
+
+def make_evidence_string_line(number):
+    return json.dumps({"unique_association_fields": {"clinvarAccession": "RCV{}".format(number % 7),
+                                                     "gene": "ENSG{}".format(number % 3)},
+                       "number": number})
+
+
+class ShardedEvidenceStringWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.dir_out = tempfile.mkdtemp()
+        self.lines = [make_evidence_string_line(number) for number in range(50)]
+        self.chunk_size = config.SHARD_CHUNK_SIZE
+        # Several chunks per shard
+        config.SHARD_CHUNK_SIZE = 300
+
+    def tearDown(self):
+        config.SHARD_CHUNK_SIZE = self.chunk_size
+        shutil.rmtree(self.dir_out)
+
+    def _write(self, shard_by, shard_limit):
+        with shards.ShardedEvidenceStringWriter(self.dir_out, shard_by, shard_limit) as writer:
+            # Whole lines, one at a time and several at once, as written by Report
+            for line in self.lines[:10]:
+                writer.write(line + "\n")
+            writer.write("".join(line + "\n" for line in self.lines[10:]))
+        manifest = shards.load_manifest(self.dir_out)
+        shard_lines = []
+        for shard_entry in manifest["shards"]:
+            self.assertIsNone(shards.check_shard(self.dir_out, shard_entry))
+            with gzip.open(os.path.join(self.dir_out, shard_entry["file"]), "rt") as f:
+                shard_lines.append(f.read().splitlines())
+        self.assertEqual(manifest["evidence_strings"], len(self.lines))
+        return manifest, shard_lines
+
+    def test_by_count(self):
+        manifest, shard_lines = self._write("count", 15)
+        self.assertEqual([len(lines) for lines in shard_lines], [15, 15, 15, 5])
+        self.assertEqual(sum(shard_lines, []), self.lines)
+
+    def test_by_size(self):
+        manifest, shard_lines = self._write("size", 1000)
+        self.assertGreater(len(shard_lines), 1)
+        for shard_entry in manifest["shards"]:
+            self.assertLessEqual(shard_entry["bytes"], 1000)
+        self.assertEqual(sum(shard_lines, []), self.lines)
+
+    def test_by_hash(self):
+        manifest, shard_lines = self._write("hash", 4)
+        self.assertEqual(len(shard_lines), 4)
+        self.assertEqual(sorted(sum(shard_lines, [])), sorted(self.lines))
+        # Evidence strings of the same association are in the same shard
+        shard_numbers = {}
+        for shard_number, lines in enumerate(shard_lines):
+            for line in lines:
+                association_key = evidence_strings.get_association_key(
+                    json.loads(line)["unique_association_fields"])
+                self.assertEqual(shard_numbers.setdefault(association_key, shard_number),
+                                 shard_number)
+        self.assertEqual(len(shard_numbers), 21)
+
+    def test_same_checksums(self):
+        manifest, _ = self._write("count", 15)
+        other_manifest, _ = self._write("count", 15)
+        self.assertEqual(manifest["shards"], other_manifest["shards"])
+
+    def test_earlier_shards_removed(self):
+        self._write("count", 5)
+        self._write("count", 25)
+        self.assertEqual(len(shards.get_shard_files(self.dir_out)), 2)
+
+    def test_changed_shard(self):
+        manifest, _ = self._write("count", 25)
+        with gzip.open(os.path.join(self.dir_out, manifest["shards"][1]["file"]), "wt") as f:
+            f.write(self.lines[0] + "\n")
+        self.assertIsNone(shards.check_shard(self.dir_out, manifest["shards"][0]))
+        self.assertIsNotNone(shards.check_shard(self.dir_out, manifest["shards"][1]))
+
+    def test_no_manifest_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with shards.ShardedEvidenceStringWriter(self.dir_out, "count", 5) as writer:
+                writer.write("".join(line + "\n" for line in self.lines))
+                raise RuntimeError()
+        self.assertFalse(os.path.exists(os.path.join(self.dir_out,
+                                                     config.SHARD_MANIFEST_FILE_NAME)))
+
+    def test_invalid_settings(self):
+        with self.assertRaises(ValueError):
+            shards.ShardedEvidenceStringWriter(self.dir_out, "lines", 5)
+        with self.assertRaises(ValueError):
+            shards.ShardedEvidenceStringWriter(self.dir_out, "count", 0)
+        with self.assertRaises(ValueError):
+            shards.ShardedEvidenceStringWriter(self.dir_out, "hash",
+                                               config.SHARD_MAX_HASH_SHARDS + 1)
+
+    def test_write_evidence_string(self):
+        # Given their association keys, evidence strings aren't parsed
+        manifest, shard_lines = self._write("hash", 4)
+        with shards.ShardedEvidenceStringWriter(self.dir_out, "hash", 4) as writer:
+            for line in self.lines:
+                association_key = evidence_strings.get_association_key(
+                    json.loads(line)["unique_association_fields"])
+                writer.write_evidence_string("not json " + association_key, association_key)
+        for shard_entry, lines in zip(shards.load_manifest(self.dir_out)["shards"], shard_lines):
+            with gzip.open(os.path.join(self.dir_out, shard_entry["file"]), "rt") as f:
+                self.assertEqual(f.read().splitlines(), [
+                    "not json " + evidence_strings.get_association_key(
+                        json.loads(line)["unique_association_fields"]) for line in lines])
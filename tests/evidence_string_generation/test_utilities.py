@@ -1,4 +1,6 @@
+import gzip
 import os
+import tempfile
 import unittest
 import shutil
 
@@ -14,6 +16,51 @@ class GetResourceFileTest(unittest.TestCase):
                          None)
 
 
+class OpenFileTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.gz_file = os.path.join(self.temp_dir, "test.txt.gz")
+        self.lines = ["line {}\n".format(i) for i in range(100000)]
+        with gzip.open(self.gz_file, "wt") as f:
+            f.writelines(self.lines)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    @unittest.skipIf(utilities.get_decompressor() is None, "No decompressor installed")
+    def test_decompressor_pipe(self):
+        with utilities.open_file(self.gz_file, "rt") as f:
+            self.assertIsInstance(f, utilities.DecompressorPipe)
+            self.assertEqual(list(f), self.lines)
+        with utilities.open_file(self.gz_file, "rb") as f:
+            self.assertEqual(f.read(), "".join(self.lines).encode())
+
+    @unittest.skipIf(utilities.get_decompressor() is None, "No decompressor installed")
+    def test_decompressor_pipe_closed_early(self):
+        with utilities.open_file(self.gz_file, "rt") as f:
+            self.assertEqual(f.readline(), self.lines[0])
+
+    @unittest.skipIf(utilities.get_decompressor() is None, "No decompressor installed")
+    def test_decompressor_pipe_truncated_file(self):
+        with open(self.gz_file, "rb") as f:
+            compressed = f.read()
+        with open(self.gz_file, "wb") as f:
+            f.write(compressed[:len(compressed) // 2])
+        with self.assertRaises(OSError):
+            with utilities.open_file(self.gz_file, "rt") as f:
+                list(f)
+
+    def test_gzip_module(self):
+        parallel_decompression = utilities.config.PARALLEL_DECOMPRESSION
+        utilities.config.PARALLEL_DECOMPRESSION = False
+        try:
+            with utilities.open_file(self.gz_file, "rt") as f:
+                self.assertNotIsInstance(f, utilities.DecompressorPipe)
+                self.assertEqual(list(f), self.lines)
+        finally:
+            utilities.config.PARALLEL_DECOMPRESSION = parallel_decompression
+
+
 class CopyAndOverwriteTest(unittest.TestCase):
     def setUp(self):
         self.test_dir_a = os.path.join(os.path.dirname(__file__), "resources", "test_tmp_a")
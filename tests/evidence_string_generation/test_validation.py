@@ -0,0 +1,74 @@
+import json
+import os
+import tempfile
+import unittest
+
+import jsonschema
+
+from eva_cttv_pipeline.evidence_string_generation import efo_term
+from eva_cttv_pipeline.evidence_string_generation import validation
+
+
+TEST_SCHEMA = {
+    "type": "object",
+    "required": ["disease"],
+    "properties": {
+        "disease": {"$ref": "#/definitions/disease"}
+    },
+    "definitions": {
+        "disease": {
+            "type": "object",
+            "properties": {"id": {"type": "string", "pattern": "^http"}}
+        }
+    }
+}
+
+
+class _TestEvidenceString(dict):
+    schema_file = None
+
+
+class ValidationTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        with tempfile.NamedTemporaryFile("wt", suffix=".json", delete=False) as schema_file:
+            json.dump(TEST_SCHEMA, schema_file)
+        cls.schema_file = schema_file.name
+        _TestEvidenceString.schema_file = schema_file.name
+        cls.obsolete_terms = efo_term.EFOTerm.obsolete_terms
+        efo_term.EFOTerm.obsolete_terms = {"http://obsolete": "replaced"}
+
+    @classmethod
+    def tearDownClass(cls):
+        efo_term.EFOTerm.obsolete_terms = cls.obsolete_terms
+        os.remove(cls.schema_file)
+
+    def test_get_validator_cached(self):
+        self.assertIs(validation.get_validator(self.schema_file),
+                      validation.get_validator(self.schema_file))
+
+    def test_valid(self):
+        self.assertTrue(validation.validate_evidence_string({"disease": {"id": "http://a"}},
+                                                            self.schema_file))
+
+    def test_invalid(self):
+        self.assertRaises(jsonschema.exceptions.ValidationError,
+                          validation.validate_evidence_string, {"disease": {"id": "a"}},
+                          self.schema_file)
+        self.assertRaises(efo_term.EFOTerm.IsObsoleteException,
+                          validation.validate_evidence_string,
+                          {"disease": {"id": "http://obsolete"}}, self.schema_file)
+
+    def test_validation_stage(self):
+        evidence_strings = [_TestEvidenceString({"disease": {"id": disease_id}})
+                            for disease_id in ("http://a", "b", "http://c", "http://obsolete",
+                                               "http://e")]
+        stage = validation.ValidationStage(2, batch_size=2)
+        results = []
+        for evidence_string in evidence_strings:
+            results.extend(stage.submit(evidence_string, json.dumps(evidence_string)))
+        results.extend(stage.close())
+
+        self.assertEqual([result[0] for result in results], evidence_strings)
+        self.assertEqual([result[2] is None for result in results],
+                         [True, False, True, False, True])
@@ -0,0 +1,129 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from eva_cttv_pipeline.bench import benchmarks
+from eva_cttv_pipeline.bench import services
+from eva_cttv_pipeline.bench import synthetic_data
+from eva_cttv_pipeline.evidence_string_generation import cellbase_records
+from eva_cttv_pipeline.evidence_string_generation import clinvar
+from eva_cttv_pipeline.evidence_string_generation import clinvar_to_evidence_strings
+from eva_cttv_pipeline.evidence_string_generation import consequence_type as CT
+from eva_cttv_pipeline.evidence_string_generation import utilities
+from eva_cttv_pipeline.trait_mapping import main as trait_mapping
+from eva_cttv_pipeline.trait_mapping.trait import Trait
+
+
+class StubServicesTest(unittest.TestCase):
+    filters = {"ontologies": "efo,ordo,hp", "required": "cttv,eva-clinvar",
+               "preferred": "eva-clinvar,cttv"}
+
+    def setUp(self):
+        services.clear_caches()
+
+    def tearDown(self):
+        services.clear_caches()
+
+    def _process_trait(self, trait_name):
+        with services.stub_services():
+            return trait_mapping.process_trait(Trait(trait_name, 1), self.filters,
+                                               services.ZOOMA_HOST, ["efo"], 1)
+
+    def test_process_trait(self):
+        kinds = {}
+        for number in range(100):
+            trait_name = "trait {}".format(number)
+            kinds[services.get_term_number(trait_name) % 10] = self._process_trait(trait_name)
+        # Finished with a Zooma mapping
+        self.assertTrue(kinds[0].is_finished)
+        self.assertEqual(kinds[0].oxo_result_list, [])
+        # Finished with an OxO mapping
+        self.assertTrue(kinds[5].is_finished)
+        self.assertEqual(len(kinds[5].oxo_result_list), 1)
+        # Left for curation
+        self.assertFalse(kinds[9].is_finished)
+
+
+class BenchmarksTest(unittest.TestCase):
+    def setUp(self):
+        self.inputs = benchmarks.BenchmarkInputs(n_records=20, n_traits=10)
+
+    def tearDown(self):
+        self.inputs.close()
+
+    def test_run_benchmark(self):
+        for name in ("cellbase_records_parsing", "evidence_string_construction",
+                     "process_trait"):
+            result = benchmarks.run_benchmark(name, self.inputs, repeat=1)
+            self.assertGreater(result.items, 0)
+            self.assertGreater(result.items_per_second, 0)
+            self.assertGreater(result.peak_memory_bytes, 0)
+
+    def test_compare_to_baseline(self):
+        results = {"a": {"items_per_second": 200}, "b": {"items_per_second": 50},
+                   "c": {"items_per_second": 10}}
+        baseline_results = {"a": {"items_per_second": 100}, "b": {"items_per_second": 100}}
+        self.assertEqual(benchmarks.compare_to_baseline(results, baseline_results),
+                         {"a": 2, "b": 0.5})
+
+
+class SyntheticReleaseTest(unittest.TestCase):
+    def setUp(self):
+        self.dir_out = tempfile.mkdtemp()
+        self.release = synthetic_data.SyntheticRelease(scale=0.001, seed=3)
+        self.file_paths = self.release.write_files(self.dir_out)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_out)
+
+    def _read_files(self):
+        contents = {}
+        for name, file_path in self.file_paths.items():
+            with utilities.open_file(file_path, "rt") as f:
+                contents[name] = f.read()
+        return contents
+
+    def test_clinvar_records(self):
+        records = [clinvar.ClinvarRecord(cellbase_record["clinvarSet"]) for cellbase_record
+                   in cellbase_records.CellbaseRecords(self.file_paths["json_file"])]
+        self.assertEqual(len(records), self.release.n_records)
+        self.assertEqual(len({record.accession for record in records}), len(records))
+        measures = [measure for record in records for measure in record.measures]
+        self.assertTrue(any(measure.rs_id and measure.nsv_id for measure in measures))
+        self.assertTrue(any(measure.nsv_id and not measure.rs_id for measure in measures))
+        self.assertTrue(any(not measure.rs_id and not measure.nsv_id for measure in measures))
+        self.assertTrue(any(len(record.measures) > 1 for record in records))
+        self.assertTrue(any(len(record.traits) > 1 for record in records))
+        self.assertTrue(any(len(record.allele_origins) > 1 for record in records))
+        self.assertTrue(any(record.observed_refs_list for record in records))
+
+    def test_consistent_files(self):
+        consequence_type_dict = CT.process_consequence_type_file(
+            self.file_paths["snp_2_gene_file"])
+        trait_2_efo, unavailable_efo = clinvar_to_evidence_strings.load_efo_mapping(
+            self.file_paths["efo_mapping_file"])
+        measures_with_consequence_types = 0
+        mapped_traits = 0
+        for cellbase_record in cellbase_records.CellbaseRecords(self.file_paths["json_file"]):
+            record = clinvar.ClinvarRecord(cellbase_record["clinvarSet"])
+            for measure in record.measures:
+                if clinvar_to_evidence_strings.get_consequence_types(measure,
+                                                                     consequence_type_dict):
+                    measures_with_consequence_types += 1
+            for trait in record.traits:
+                if any(name.lower() in trait_2_efo for name in trait):
+                    mapped_traits += 1
+        self.assertGreater(measures_with_consequence_types, 0)
+        self.assertGreater(mapped_traits, 0)
+        self.assertGreater(len(unavailable_efo), 0)
+
+    def test_deterministic(self):
+        contents = self._read_files()
+        self.release.write_files(self.dir_out)
+        self.assertEqual(self._read_files(), contents)
+        other_dir_out = os.path.join(self.dir_out, "other")
+        other_file_paths = synthetic_data.SyntheticRelease(scale=0.001, seed=4).write_files(
+            other_dir_out)
+        with utilities.open_file(other_file_paths["json_file"], "rt") as f:
+            self.assertNotEqual(f.read(), contents["json_file"])
@@ -0,0 +1,153 @@
+import os
+import tempfile
+import unittest
+
+from eva_cttv_pipeline import efo_index
+from eva_cttv_pipeline.evidence_string_generation import efo_term
+from eva_cttv_pipeline.trait_mapping import ols
+
+
+OWL_RELEASE = """<?xml version="1.0"?>
+<rdf:RDF xmlns="http://www.ebi.ac.uk/efo/efo.owl#"
+     xmlns:efo="http://www.ebi.ac.uk/efo/"
+     xmlns:owl="http://www.w3.org/2002/07/owl#"
+     xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+     xmlns:rdfs="http://www.w3.org/2000/01/rdf-schema#">
+    <owl:Ontology rdf:about="http://www.ebi.ac.uk/efo"/>
+    <owl:Class rdf:about="http://www.targetvalidation.org/cttv_root">
+        <rdfs:label>cttv_root</rdfs:label>
+    </owl:Class>
+    <owl:Class rdf:about="http://www.ebi.ac.uk/efo/EFO_0000408">
+        <rdfs:label>disease</rdfs:label>
+        <rdfs:subClassOf rdf:resource="http://www.targetvalidation.org/cttv_root"/>
+    </owl:Class>
+    <owl:Class rdf:about="http://www.orpha.net/ORDO/Orphanet_425">
+        <rdfs:label>Apolipoprotein A-I deficiency</rdfs:label>
+        <rdfs:subClassOf rdf:resource="http://www.ebi.ac.uk/efo/EFO_0000408"/>
+        <rdfs:subClassOf>
+            <owl:Restriction>
+                <owl:onProperty rdf:resource="http://www.ebi.ac.uk/efo/EFO_0000784"/>
+                <owl:someValuesFrom>
+                    <owl:Class rdf:about="http://www.ebi.ac.uk/efo/EFO_0000001"/>
+                </owl:someValuesFrom>
+            </owl:Restriction>
+        </rdfs:subClassOf>
+    </owl:Class>
+    <owl:Class rdf:about="http://www.ebi.ac.uk/efo/EFO_0000001">
+        <rdfs:label>experimental factor</rdfs:label>
+    </owl:Class>
+    <owl:Class rdf:about="http://www.ebi.ac.uk/efo/EFO_0000002">
+        <rdfs:label>obsolete_term</rdfs:label>
+        <rdfs:subClassOf rdf:resource="http://www.geneontology.org/formats/oboInOwl#ObsoleteClass"/>
+        <efo:reason_for_obsolescence>Replaced by EFO_0000408</efo:reason_for_obsolescence>
+    </owl:Class>
+</rdf:RDF>
+"""
+
+OBO_RELEASE = """format-version: 1.2
+ontology: efo
+
+[Term]
+id: cttv_root
+name: cttv_root
+
+[Term]
+id: EFO:0000408
+name: disease
+is_a: cttv_root ! cttv_root
+
+[Term]
+id: Orphanet:425
+name: Apolipoprotein A-I deficiency
+is_a: EFO:0000408 ! disease
+
+[Term]
+id: EFO:0000001
+name: experimental factor
+
+[Term]
+id: EFO:0000002
+name: obsolete_term
+property_value: efo:reason_for_obsolescence "Replaced by EFO_0000408" xsd:string
+is_obsolete: true
+
+[Typedef]
+id: part_of
+name: part of
+"""
+
+EXPECTED_TERMS = {
+    "http://www.targetvalidation.org/cttv_root": ("cttv_root", False, None, True),
+    "http://www.ebi.ac.uk/efo/EFO_0000408": ("disease", False, None, True),
+    "http://www.orpha.net/ORDO/Orphanet_425": ("Apolipoprotein A-I deficiency", False, None,
+                                               True),
+    "http://www.ebi.ac.uk/efo/EFO_0000001": ("experimental factor", False, None, False),
+    "http://www.ebi.ac.uk/efo/EFO_0000002": ("obsolete_term", True, "Replaced by EFO_0000408",
+                                             False),
+}
+
+
+class EFOIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        for file_name in os.listdir(self.temp_dir):
+            os.remove(os.path.join(self.temp_dir, file_name))
+        os.rmdir(self.temp_dir)
+
+    def _build(self, file_name, release):
+        release_filepath = os.path.join(self.temp_dir, file_name)
+        with open(release_filepath, "wt") as release_file:
+            release_file.write(release)
+        return efo_index.EFOIndex.from_release(release_filepath)
+
+    def test_owl(self):
+        index = self._build("efo.owl", OWL_RELEASE)
+        self.assertEqual({iri: tuple(term) for iri, term in index.terms.items()},
+                         EXPECTED_TERMS)
+
+    def test_obo(self):
+        index = self._build("efo.obo", OBO_RELEASE)
+        self.assertEqual({iri: tuple(term) for iri, term in index.terms.items()},
+                         EXPECTED_TERMS)
+
+    def test_save_and_load(self):
+        index = self._build("efo.owl", OWL_RELEASE)
+        index_filepath = os.path.join(self.temp_dir, "efo_index.json")
+        index.save(index_filepath)
+        self.assertEqual(efo_index.EFOIndex.load(index_filepath).terms, index.terms)
+
+    def test_lookups(self):
+        index = self._build("efo.owl", OWL_RELEASE)
+        self.assertTrue(index.is_current_and_in_efo("http://www.orpha.net/ORDO/Orphanet_425"))
+        self.assertFalse(index.is_current_and_in_efo("http://www.ebi.ac.uk/efo/EFO_0000002"))
+        self.assertTrue(index.is_in_efo("http://www.ebi.ac.uk/efo/EFO_0000002"))
+        self.assertFalse(index.is_in_efo("http://www.orpha.net/ORDO/Orphanet_1"))
+        self.assertEqual(index.get_obsolete_terms(),
+                         {"http://www.ebi.ac.uk/efo/EFO_0000002": "Replaced by EFO_0000408"})
+        self.assertEqual(len(index.get_cttv_available_terms()), 3)
+
+    def test_used_by_efo_term(self):
+        terms = (efo_term.EFOTerm.__dict__["obsolete_terms"],
+                 efo_term.EFOTerm.__dict__["cttv_available_terms"])
+        try:
+            efo_term.use_efo_index(self._build("efo.owl", OWL_RELEASE))
+            self.assertRaises(efo_term.EFOTerm.IsObsoleteException,
+                              efo_term.EFOTerm("http://www.ebi.ac.uk/efo/EFO_0000002").is_obsolete)
+            self.assertTrue(
+                efo_term.EFOTerm("http://www.ebi.ac.uk/efo/EFO_0000408").is_cttv_available())
+        finally:
+            efo_term.EFOTerm.obsolete_terms, efo_term.EFOTerm.cttv_available_terms = terms
+
+    def test_used_by_ols(self):
+        try:
+            ols.use_efo_index(self._build("efo.owl", OWL_RELEASE))
+            self.assertEqual(
+                ols.get_ontology_label_from_ols("http://www.ebi.ac.uk/efo/EFO_0000408"), "disease")
+            self.assertFalse(ols.is_current_and_in_efo("http://www.ebi.ac.uk/efo/EFO_0000002"))
+            self.assertTrue(ols.is_in_efo("http://www.ebi.ac.uk/efo/EFO_0000002"))
+            self.assertEqual(ols.get_term_status("http://www.ebi.ac.uk/efo/EFO_0000408"),
+                             ("disease", True, True))
+        finally:
+            ols.use_efo_index(None)
@@ -0,0 +1,35 @@
+import json
+import unittest
+
+from eva_cttv_pipeline import json_codec
+
+
+class JsonCodecTest(unittest.TestCase):
+    def tearDown(self):
+        json_codec.select_backends()
+
+    def test_stdlib_backend_always_selected_last(self):
+        self.assertIs(json_codec.get_available_backends()[-1], json_codec.STDLIB_BACKEND)
+
+    def test_selected_backends_identical(self):
+        self.assertTrue(json_codec.loads_identical(json_codec.loads_backend))
+        self.assertTrue(json_codec.dumps_identical(json_codec.dumps_backend))
+        for document in json_codec.SAMPLE_DOCUMENTS:
+            self.assertEqual(json_codec.dumps(json_codec.loads(document)),
+                             json.dumps(json.loads(document)))
+
+    def test_backend_with_different_output_not_used(self):
+        compact = json_codec.Backend(
+            "compact", json.loads, lambda obj: json.dumps(obj, separators=(",", ":")))
+        self.assertTrue(json_codec.loads_identical(compact))
+        self.assertFalse(json_codec.dumps_identical(compact))
+
+    def test_select_named_backend(self):
+        loads_backend, dumps_backend = json_codec.select_backends("json")
+        self.assertIs(loads_backend, json_codec.STDLIB_BACKEND)
+        self.assertIs(dumps_backend, json_codec.STDLIB_BACKEND)
+
+    def test_loads_falls_back_to_stdlib(self):
+        self.assertEqual(json_codec.loads('[1e400, 123456789012345678901234567890]'),
+                         json.loads('[1e400, 123456789012345678901234567890]'))
+        self.assertRaises(ValueError, json_codec.loads, '{"a": ')
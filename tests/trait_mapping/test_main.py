@@ -0,0 +1,93 @@
+import csv
+import io
+import threading
+import time
+import unittest
+
+from eva_cttv_pipeline.bench import services
+from eva_cttv_pipeline.trait_mapping import main
+from eva_cttv_pipeline.trait_mapping import utils
+from eva_cttv_pipeline.trait_mapping.output import output_trait
+from eva_cttv_pipeline.trait_mapping.trait import Trait
+
+
+class ProcessTraitsTest(unittest.TestCase):
+    def setUp(self):
+        self.trait_names = ["trait {}".format(number) for number in range(40)]
+        self.filters = {"ontologies": "efo,ordo,hp",
+                        "required": "cttv,eva-clinvar,clinvar-xrefs,gwas",
+                        "preferred": "eva-clinvar,cttv,gwas,clinvar-xrefs"}
+
+    def tearDown(self):
+        utils.set_service_concurrency({})
+
+    def _output(self, workers):
+        services.clear_caches()
+        mapping_file, curation_file = io.StringIO(), io.StringIO()
+        mapping_writer = csv.writer(mapping_file, delimiter="\t")
+        curation_writer = csv.writer(curation_file, delimiter="\t")
+        traits = (Trait(trait_name, 1) for trait_name in self.trait_names)
+        with services.stub_services():
+            for trait in main.process_traits(traits, self.filters, services.ZOOMA_HOST,
+                                             ["Orphanet", "efo", "hp"], 3, workers):
+                output_trait(trait, mapping_writer, curation_writer)
+        return mapping_file.getvalue(), curation_file.getvalue()
+
+    def test_same_output_in_order(self):
+        mappings, curation = self._output(1)
+        self.assertTrue(mappings)
+        self.assertTrue(curation)
+        utils.set_service_concurrency({"zooma": 2, "ols": 3, "oxo": 1})
+        self.assertEqual(self._output(4), (mappings, curation))
+
+
+class ServiceRequestTest(unittest.TestCase):
+    def tearDown(self):
+        utils.set_service_concurrency({})
+
+    def test_limit(self):
+        utils.set_service_concurrency({"zooma": 2})
+        lock = threading.Lock()
+        in_flight = []
+        max_in_flight = []
+
+        def request():
+            with utils.service_request("zooma"):
+                with lock:
+                    in_flight.append(1)
+                    max_in_flight.append(len(in_flight))
+                time.sleep(0.01)
+                with lock:
+                    in_flight.pop()
+
+        threads = [threading.Thread(target=request) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(max(max_in_flight), 2)
+
+    def test_no_limit(self):
+        with utils.service_request("ols"):
+            pass
+
+
+class GetSessionTest(unittest.TestCase):
+    def tearDown(self):
+        utils.set_service_concurrency({})
+
+    def test_shared_connection_pools(self):
+        session = utils.get_session()
+        self.assertIs(utils.get_session(), session)
+        other_sessions = []
+        thread = threading.Thread(target=lambda: other_sessions.append(utils.get_session()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other_sessions[0], session)
+        self.assertIs(other_sessions[0].adapters["https://"], session.adapters["https://"])
+
+    def test_pool_size(self):
+        session = utils.get_session()
+        utils.set_service_concurrency({"ols": 32})
+        self.assertIsNot(utils.get_session(), session)
+        self.assertEqual(utils.get_session().adapters["https://"]._pool_maxsize, 32)
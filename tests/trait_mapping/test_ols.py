@@ -38,3 +38,42 @@ class TestIsInEfo(unittest.TestCase):
 
             self.assertEqual(ols.is_in_efo("http://www.orpha.net/ORDO/Orphanet_425"),
                              True)
+
+
+class TestGetTermStatus(unittest.TestCase):
+    efo_terms_url = "http://www.ebi.ac.uk/ols/api/ontologies/efo/terms/"
+    terms_url = "http://www.ebi.ac.uk/ols/api/terms?iri="
+
+    def setUp(self):
+        ols.get_term_status.cache_clear()
+        ols.get_ontology_label_from_ols.cache_clear()
+
+    def test_defined_in_efo(self):
+        uri = "http://www.ebi.ac.uk/efo/EFO_0000408"
+        with requests_mock.mock() as m:
+            m.get(self.efo_terms_url + ols.double_encode_uri(uri),
+                  json={"iri": uri, "label": "disease", "is_obsolete": False,
+                        "is_defining_ontology": True})
+            self.assertEqual(ols.get_term_status(uri), ("disease", True, True))
+            # The label is that of the term in EFO
+            self.assertEqual(m.call_count, 1)
+
+    def test_imported_into_efo(self):
+        uri = "http://www.orpha.net/ORDO/Orphanet_199318"
+        terms_json = test_ols_data.TestGetTraitNamesData.orphanet_199318_ols_terms_json
+        with requests_mock.mock() as m:
+            m.get(self.efo_terms_url + ols.double_encode_uri(uri),
+                  json=terms_json["_embedded"]["terms"][1])
+            m.get(self.terms_url + uri, json=terms_json)
+            self.assertEqual(ols.get_term_status(uri),
+                             ("15q13.3 microdeletion syndrome", True, True))
+            self.assertEqual(m.call_count, 2)
+
+    def test_not_in_efo(self):
+        uri = "http://www.orpha.net/ORDO/Orphanet_199318"
+        with requests_mock.mock() as m:
+            m.get(self.efo_terms_url + ols.double_encode_uri(uri), status_code=404, json={})
+            m.get(self.terms_url + uri,
+                  json=test_ols_data.TestGetTraitNamesData.orphanet_199318_ols_terms_json)
+            self.assertEqual(ols.get_term_status(uri),
+                             ("15q13.3 microdeletion syndrome", False, False))
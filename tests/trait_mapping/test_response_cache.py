@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from eva_cttv_pipeline.bench import services
+from eva_cttv_pipeline.bench.synthetic_data import SyntheticRelease
+from eva_cttv_pipeline.trait_mapping import main
+from eva_cttv_pipeline.trait_mapping import response_cache
+from eva_cttv_pipeline.trait_mapping.response_cache import JsonResponse, ResponseCache
+
+
+class GetRequestKeyTest(unittest.TestCase):
+    def test_parameter_order(self):
+        self.assertEqual(response_cache.get_request_key("get", "HTTP://Host/path?b=2&a=1"),
+                         response_cache.get_request_key("GET", "http://host/path?a=1&b=2"))
+        self.assertEqual(
+            response_cache.get_request_key("POST", "http://host/path", {"ids": ["a"], "d": 3}),
+            response_cache.get_request_key("POST", "http://host/path", {"d": 3, "ids": ["a"]}))
+        self.assertNotEqual(response_cache.get_request_key("GET", "http://host/path?a=1"),
+                            response_cache.get_request_key("GET", "http://host/path?a=2"))
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = ResponseCache(self.cache_dir)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.cache_dir)
+
+    def test_put_get(self):
+        self.assertIsNone(self.cache.get("ols", "a"))
+        self.cache.put("ols", "a", JsonResponse(200, {"label": "A"}))
+        self.cache.put("ols", "b", JsonResponse(404, {}))
+        self.assertEqual(self.cache.get("ols", "a"), JsonResponse(200, {"label": "A"}))
+        self.assertEqual(self.cache.get("ols", "b"), JsonResponse(404, {}))
+        self.assertEqual(self.cache.stats["ols"],
+                         {"misses": 1, "hits": 1, "negative_hits": 1})
+
+    def test_failed_responses_not_cached(self):
+        self.cache.put("zooma", "a", JsonResponse(200, None))
+        self.cache.put("zooma", "b", JsonResponse(500, {"error": "Server error"}))
+        self.assertIsNone(self.cache.get("zooma", "a"))
+        self.assertIsNone(self.cache.get("zooma", "b"))
+
+    def test_expiry(self):
+        self.cache.close()
+        self.cache = ResponseCache(self.cache_dir, service_ttls={"zooma": 60}, negative_ttl=1)
+        self.cache.put("zooma", "a", JsonResponse(200, [{"confidence": "HIGH"}]))
+        self.cache.put("zooma", "b", JsonResponse(200, []))
+        self.cache.connection.execute("UPDATE response SET created = ?", (time.time() - 30,))
+        self.assertIsNotNone(self.cache.get("zooma", "a"))
+        self.assertIsNone(self.cache.get("zooma", "b"))
+        self.assertEqual(self.cache.stats["zooma"]["expired"], 1)
+
+    def test_eviction(self):
+        self.cache.close()
+        self.cache = ResponseCache(self.cache_dir, max_size=1000)
+        for number in range(20):
+            self.cache.put("oxo", "key {}".format(number), JsonResponse(200, ["x" * 90]))
+            # The first response is used again, so it is kept
+            self.cache.get("oxo", "key 0")
+        self.assertLessEqual(self.cache.size, 1000)
+        self.assertIsNotNone(self.cache.get("oxo", "key 0"))
+        self.assertIsNotNone(self.cache.get("oxo", "key 19"))
+        self.assertIsNone(self.cache.get("oxo", "key 1"))
+        self.assertGreater(self.cache.stats["oxo"]["evictions"], 0)
+
+    def test_persistent(self):
+        self.cache.put("ols", "a", JsonResponse(200, {"label": "A"}))
+        self.cache.close()
+        self.cache = ResponseCache(self.cache_dir)
+        self.assertEqual(self.cache.get("ols", "a"), JsonResponse(200, {"label": "A"}))
+        self.assertGreater(self.cache.size, 0)
+
+
+class CachedTraitMappingTest(unittest.TestCase):
+    def setUp(self):
+        self.dir_out = tempfile.mkdtemp()
+        SyntheticRelease(0.0005, 1).write_files(self.dir_out)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_out)
+
+    def _run(self, name):
+        services.clear_caches()
+        filters = {"ontologies": "efo,ordo,hp", "required": "cttv,eva-clinvar,clinvar-xrefs,gwas",
+                   "preferred": "eva-clinvar,cttv,gwas,clinvar-xrefs"}
+        mappings_file = os.path.join(self.dir_out, name + "_mappings.tsv")
+        curation_file = os.path.join(self.dir_out, name + "_curation.tsv")
+        with services.stub_services() as mocker:
+            main.main(os.path.join(self.dir_out, "clinvar.json.gz"), mappings_file, curation_file,
+                      filters, services.ZOOMA_HOST, ["Orphanet", "efo", "hp"], 3,
+                      cache_dir=os.path.join(self.dir_out, "cache"))
+        with open(mappings_file) as mappings_fh, open(curation_file) as curation_fh:
+            return mocker.call_count, mappings_fh.read(), curation_fh.read()
+
+    def test_second_run_from_cache(self):
+        n_requests, mappings, curation = self._run("first")
+        self.assertGreater(n_requests, 0)
+        self.assertEqual(self._run("second"), (0, mappings, curation))
+        self.assertIsNone(response_cache.response_cache)